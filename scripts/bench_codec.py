@@ -0,0 +1,130 @@
+"""JSON 编解码与消息 metadata 延迟解析基准(user-047)
+
+测量:
+- frame:  NapCat 私聊消息事件帧的解析(loads)与序列化(dumps)吞吐，标准库 json 与 codec 对比；
+- rows:   get_recent_messages() 读取带 metadata 的消息并组装上下文(只读角色与内容)的吞吐，
+          对比逐行访问 metadata(相当于改动前的立即解析)与不访问 metadata(延迟解析)。
+每项取多次运行中的最优值，单位为每秒处理的帧数/行数。
+
+用法(在仓库根目录):
+    python scripts/bench_codec.py [--src src] [--rows 2000] [--reads 20]
+
+codec 的后端取决于是否安装了 orjson，输出的 backend 字段标明实际使用的实现。
+与改动前对比时，检出改动前的版本到另一个目录，再用 --src 指向它的 src(旧版本没有 codec 时只测 rows)。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+_FRAME = {
+    "self_id": 3889000001,
+    "user_id": 10001,
+    "time": 1760000000,
+    "message_id": 1234567890,
+    "message_seq": 1234567890,
+    "real_id": 1234567890,
+    "message_type": "private",
+    "sender": {"user_id": 10001, "nickname": "测试用户", "card": ""},
+    "raw_message": "今天下午三点提醒我去取快递，顺便买点水果[CQ:face,id=14]",
+    "font": 14,
+    "sub_type": "friend",
+    "message": [
+        {"type": "text", "data": {"text": "今天下午三点提醒我去取快递，顺便买点水果"}},
+        {"type": "face", "data": {"id": "14"}},
+    ],
+    "message_format": "array",
+    "post_type": "message",
+}
+
+_METADATA = {
+    "chat_id": 10001,
+    "message_id": 1234567890,
+    "reply_to": None,
+    "attachments": [{"mime_type": "image/jpeg", "cache_name": "0" * 64}],
+    "sender": {"nickname": "测试用户", "is_bot": False},
+}
+
+
+def _best_per_second(samples: list[float], n: int) -> float:
+    return n / min(samples)
+
+
+def _bench_loop(func, arg, n: int, rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(n):
+            func(arg)
+        samples.append(time.perf_counter() - start)
+    return _best_per_second(samples, n)
+
+
+def _bench_frames(n: int, rounds: int) -> None:
+    def std_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    raw = std_dumps(_FRAME)
+    print(f"frame: bytes={len(raw.encode('utf-8'))} n={n}")
+    print(f"  stdlib  loads={_bench_loop(json.loads, raw, n, rounds):,.0f}/s"
+          f" dumps={_bench_loop(std_dumps, _FRAME, n, rounds):,.0f}/s")
+    try:
+        import codec
+    except ImportError:
+        print("  codec   (不存在，跳过)")
+        return
+    print(f"  codec   loads={_bench_loop(codec.loads, raw, n, rounds):,.0f}/s"
+          f" dumps={_bench_loop(codec.dumps, _FRAME, n, rounds):,.0f}/s backend={codec.BACKEND}")
+
+
+async def _bench_rows(rows: int, reads: int, rounds: int) -> None:
+    import storage.db_config as db_config
+    import storage.message as message_storage
+
+    path = os.path.join(tempfile.mkdtemp(prefix="amaya-bench-"), "bench.db")
+    await db_config.init_db(path)
+    for i in range(rows):
+        await message_storage.create_message("telegram", "user" if i % 2 else "amaya", f"第 {i} 条消息", _METADATA)
+
+    async def read(access_metadata: bool) -> float:
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(reads):
+                messages = await message_storage.get_recent_messages(rows)
+                if access_metadata:
+                    for message in messages:
+                        message["metadata"]
+                [(message["role"], message["content"]) for message in messages]
+            samples.append(time.perf_counter() - start)
+        return _best_per_second(samples, rows * reads)
+
+    print(f"rows: n={rows} reads={reads}")
+    print(f"  eager   {await read(True):,.0f} rows/s (逐行访问 metadata)")
+    print(f"  lazy    {await read(False):,.0f} rows/s (只读角色与内容)")
+    await db_config.conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(__file__), "..", "src"))
+    parser.add_argument("--frames", type=int, default=50000)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--reads", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    src = os.path.abspath(args.src)
+    # db_config 按仓库根目录的相对路径读取 SQL 脚本
+    os.chdir(os.path.dirname(src))
+    sys.path[:0] = [src, os.path.join(src, "config")]
+    _bench_frames(args.frames, args.rounds)
+    asyncio.run(_bench_rows(args.rows, args.reads, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
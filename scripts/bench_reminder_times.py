@@ -0,0 +1,109 @@
+"""提醒时间存储格式基准(user-031：字符串分钟 -> 整数 epoch 分钟)
+
+在临时数据库中写入 N 条 pending 提醒(约 1% 已到期)，测量:
+- scan:   get_reminders_need_action_now() 的到期扫描；
+- format: 把全部提醒的时间格式化为用户本地时间(冷缓存)；
+- render: 遍历 get_pending_reminders() 拼接 Prompt 中的提醒列表。
+每项取多次运行中的最小值。
+
+用法(在仓库根目录):
+    python scripts/bench_reminder_times.py [--src src] [--count 50000]
+
+与改动前对比时，检出改动前的版本到另一个目录，再用 --src 指向它的 src:
+    git worktree add /tmp/amaya-base be2fdb2~1
+    python scripts/bench_reminder_times.py --src /tmp/amaya-base/src
+脚本按 utils 中是否存在 utc_epoch_min_to_user_local_min 自动选择新旧两种格式。
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def _best_ms(samples: list[float]) -> float:
+    return min(samples) * 1000
+
+
+async def _bench(count: int, rounds: int) -> None:
+    from config.settings import USER_TIMEZONE
+    import storage.db_config as db_config
+    import storage.reminder as reminder_storage
+    import utils
+
+    new_format = hasattr(utils, "utc_epoch_min_to_user_local_min")
+    path = os.path.join(tempfile.mkdtemp(prefix="amaya-bench-"), "bench.db")
+    await db_config.init_db(path)
+
+    random.seed(1)
+    now_min = int(time.time() // 60)
+    rows = []
+    for i in range(count):
+        minute = now_min - 500 + random.randint(0, 60 * 24 * 60)
+        value = minute if new_format else time.strftime("%Y-%m-%d %H:%M", time.gmtime(minute * 60))
+        rows.append((f"t{i}", value, "p", "pending", value))
+    await db_config.conn.executemany(
+        "INSERT INTO reminders (title, remind_at_min_utc, prompt, status, next_action_at_min_utc) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    await db_config.conn.commit()
+    await db_config.conn.execute("ANALYZE")
+
+    if new_format:
+        def to_local(value):
+            return utils.utc_epoch_min_to_user_local_min(value, USER_TIMEZONE)
+    else:
+        def to_local(value):
+            return utils.utc_min_str_to_user_local_min(value, USER_TIMEZONE)
+
+    samples = []
+    for _ in range(rounds * 4):
+        start = time.perf_counter()
+        due = await reminder_storage.get_reminders_need_action_now()
+        samples.append(time.perf_counter() - start)
+    print(f"format={'epoch_min' if new_format else 'str'} count={count}")
+    print(f"scan:   due={len(due)} best={_best_ms(samples):.2f}ms")
+
+    values = [row[1] for row in rows]
+    cache_clear = getattr(getattr(utils, "utc_epoch_min_to_user_local_min", None), "cache_clear", None)
+    samples = []
+    for _ in range(rounds):
+        if cache_clear is not None:
+            cache_clear()
+        start = time.perf_counter()
+        for value in values:
+            to_local(value)
+        samples.append(time.perf_counter() - start)
+    print(f"format: n={len(values)} best={_best_ms(samples):.2f}ms (cold cache)")
+
+    pending = await reminder_storage.get_pending_reminders()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        lines = [f"- [{r.reminder_id}] {r.title} (at {to_local(r.remind_at_min_utc)})" for r in pending]
+        "\n".join(lines)
+        samples.append(time.perf_counter() - start)
+    print(f"render: n={len(pending)} best={_best_ms(samples):.2f}ms")
+
+    await db_config.conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(__file__), "..", "src"))
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    src = os.path.abspath(args.src)
+    # db_config 按仓库根目录的相对路径读取 SQL 脚本
+    os.chdir(os.path.dirname(src))
+    sys.path[:0] = [src, os.path.join(src, "config")]
+    asyncio.run(_bench(args.count, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
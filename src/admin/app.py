@@ -8,14 +8,18 @@ from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
+from codec import JSONDecodeError, loads
 from config.settings import (
     ADMIN_AUTH_TOKEN,
     ADMIN_LOG_FILE,
     ENABLE_QQ_NAPCAT,
     ENABLE_TELEGRAM_BOT_POLLING,
+    ENABLE_TELEGRAM_BOT_WEBHOOK,
+    PRIMARY_CONTACT_METHOD,
     WEBHOOK_SHARED_SECRET,
 )
 from core.amaya import require_amaya
+from events import bus
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse
 from logger import logger
@@ -25,6 +29,7 @@ from pydantic import BaseModel, Field
 import storage.db_config as db_config
 from .store import (
     append_jsonl,
+    ensure_conn,
     fetch_all,
     fetch_one,
     filter_logs,
@@ -46,6 +51,13 @@ class ShutdownRequest(BaseModel):
     reason: str = Field(default="manual")
 
 
+class LoopbackRunRequest(BaseModel):
+    messages: list[str] = Field(default_factory=lambda: ["你好"])
+    count: int = Field(default=100)
+    rate_per_second: float | None = Field(default=None)  # 为空时不限速
+    send_delay_ms: int = Field(default=0)  # 模拟渠道发送耗时
+
+
 if not ADMIN_AUTH_TOKEN:
     logger.warning("未配置 ADMIN_AUTH_TOKEN，管理 API/Web 将不可访问")
 
@@ -85,11 +97,10 @@ def dashboard_html() -> str:
 
 def create_app(control: RuntimeControl) -> FastAPI:
     app = FastAPI(title="Amaya Admin API", version="1.2.0")
-    if ENABLE_QQ_NAPCAT:
-        from channels.qq_onebot_ws import register_fastapi_routes as register_napcatqq_routes
+    from channels.base import load_channels, register_channel_routes
 
-        register_napcatqq_routes(app)
-        logger.info("已挂载 NapCatQQ OneBot 反向 WS 路由")
+    load_channels()
+    register_channel_routes(app)
 
     def health_payload() -> dict[str, Any]:
         return {
@@ -137,13 +148,16 @@ def create_app(control: RuntimeControl) -> FastAPI:
     @app.get("/api/v1/overview")
     async def get_overview(request: Request) -> dict[str, Any]:
         await require_admin_auth(request)
+        archived_sql = "(SELECT COUNT(*) FROM archive.messages)" if db_config.archive_attached else "0"
         row = await fetch_one(
-            """
+            f"""
             SELECT
                 (SELECT COUNT(*) FROM messages) AS messages,
+                {archived_sql} AS messages_archived,
                 (SELECT COUNT(*) FROM reminders) AS reminders,
                 (SELECT COUNT(*) FROM memory_groups) AS memory_groups,
-                (SELECT COUNT(*) FROM memory_points) AS memory_points
+                (SELECT COUNT(*) FROM memory_points) AS memory_points,
+                (SELECT COUNT(*) FROM memory_points_archive) AS memory_points_archived
             """
         )
         return {"counts": row or {}}
@@ -153,15 +167,19 @@ def create_app(control: RuntimeControl) -> FastAPI:
         await require_admin_auth(request)
 
         telegram_status = {
-            "enabled": ENABLE_TELEGRAM_BOT_POLLING,
+            "enabled": ENABLE_TELEGRAM_BOT_POLLING or ENABLE_TELEGRAM_BOT_WEBHOOK,
             "connected": False,
             "active_typing": 0,
         }
-        if ENABLE_TELEGRAM_BOT_POLLING:
+        if ENABLE_TELEGRAM_BOT_POLLING or ENABLE_TELEGRAM_BOT_WEBHOOK:
             try:
                 from channels.telegram_polling import get_status as get_telegram_status
 
                 telegram_status.update(get_telegram_status())
+                if ENABLE_TELEGRAM_BOT_WEBHOOK:
+                    from channels.telegram_webhook import get_status as get_telegram_webhook_status
+
+                    telegram_status["webhook"] = get_telegram_webhook_status()
             except Exception as e:
                 logger.warning(f"读取 Telegram 状态失败: {e}")
 
@@ -178,7 +196,21 @@ def create_app(control: RuntimeControl) -> FastAPI:
             except Exception as e:
                 logger.warning(f"读取 NapCatQQ 状态失败: {e}")
 
-        reminder_status = {"running": False, "last_check_at_epoch": None}
+        channel_status: dict[str, Any] = {}
+        try:
+            from channels.base import get_channel_status
+
+            channel_status = get_channel_status()
+        except Exception as e:
+            logger.warning(f"读取渠道状态失败: {e}")
+
+        reminder_status = {
+            "running": False,
+            "last_check_at_epoch": None,
+            "db_check_count": 0,
+            "scheduled_count": 0,
+            "next_due_at_epoch": None,
+        }
         try:
             from world.reminder import get_status as get_reminder_status
 
@@ -186,12 +218,83 @@ def create_app(control: RuntimeControl) -> FastAPI:
         except Exception as e:
             logger.warning(f"读取 Reminder 状态失败: {e}")
 
+        reminder_draft_status = {"drafted_count": 0, "draft_failed_count": 0}
+        try:
+            from core.reminder_draft import get_status as get_reminder_draft_status
+
+            reminder_draft_status.update(get_reminder_draft_status())
+        except Exception as e:
+            logger.warning(f"读取提醒预生成状态失败: {e}")
+
+        scheduler_status = {"running": False, "next_due_at_epoch": None, "queue": {}}
+        try:
+            from world.scheduler import get_status as get_scheduler_status
+            import storage.scheduled_event as scheduled_event_storage
+
+            scheduler_status.update(get_scheduler_status())
+            scheduler_status["queue"] = await scheduled_event_storage.count_events_by_status()
+        except Exception as e:
+            logger.warning(f"读取延时事件调度器状态失败: {e}")
+
+        outbox_status = {"running": False, "next_due_at_epoch": None, "queue": {}}
+        try:
+            from core.outbox import get_status as get_outbox_status
+            import storage.outbox as outbox_storage
+
+            outbox_status.update(get_outbox_status())
+            outbox_status["queue"] = await outbox_storage.count_outbox_by_status()
+        except Exception as e:
+            logger.warning(f"读取发件箱状态失败: {e}")
+
+        attachment_status = {"file_count": None, "total_bytes": None}
+        try:
+            from storage.attachment import get_status as get_attachment_status
+
+            attachment_status.update(get_attachment_status())
+        except Exception as e:
+            logger.warning(f"读取附件缓存状态失败: {e}")
+
+        memory_decay_status = {"running": False, "last_run_at_epoch": None}
+        try:
+            from maintenance.memory_decay import get_status as get_memory_decay_status
+
+            memory_decay_status.update(get_memory_decay_status())
+        except Exception as e:
+            logger.warning(f"读取记忆衰减状态失败: {e}")
+
+        message_archive_status = {"running": False, "last_run_at_epoch": None}
+        try:
+            from maintenance.message_archive import get_status as get_message_archive_status
+
+            message_archive_status.update(get_message_archive_status())
+        except Exception as e:
+            logger.warning(f"读取消息归档状态失败: {e}")
+
+        backup_status = {"running": False, "last": None}
+        try:
+            from maintenance.backup import get_status as get_backup_status
+
+            backup_status.update(get_backup_status())
+        except Exception as e:
+            logger.warning(f"读取备份状态失败: {e}")
+
+        memory_index_status = {"ready": False}
+        try:
+            from storage.memory_index import get_status as get_memory_index_status
+
+            memory_index_status.update(get_memory_index_status())
+        except Exception as e:
+            logger.warning(f"读取记忆索引状态失败: {e}")
+
         amaya_status = {
             "configured": False,
             "thinking": False,
             "unsent_queue": 0,
             "buffered_segments": 0,
             "new_message_pending": False,
+            "memory_points_considered": 0,
+            "memory_points_injected": 0,
+            "memory_context_chars": 0,
         }
         try:
             amaya = require_amaya()
@@ -206,9 +309,19 @@ def create_app(control: RuntimeControl) -> FastAPI:
                 "db": {"connected": db_config.conn is not None},
                 "telegram": telegram_status,
                 "napcatqq": napcatqq_status,
+                "channels": channel_status,
                 "reminder": reminder_status,
+                "reminder_draft": reminder_draft_status,
+                "scheduler": scheduler_status,
+                "outbox": outbox_status,
+                "attachments": attachment_status,
+                "memory_index": memory_index_status,
+                "memory_decay": memory_decay_status,
+                "message_archive": message_archive_status,
+                "backup": backup_status,
                 "amaya": amaya_status,
             },
+            "event_bus": bus.get_status(),
             "active_tasks": len(asyncio.all_tasks()),
         }
 
@@ -219,10 +332,12 @@ def create_app(control: RuntimeControl) -> FastAPI:
         role: str | None = None,
         limit: int = 50,
         offset: int = 0,
+        include_archive: bool = True,
     ) -> dict[str, Any]:
         await require_admin_auth(request)
         limit = max(1, min(limit, 500))
         offset = max(0, offset)
+        table = "messages_all" if include_archive and db_config.archive_attached else "messages"
 
         where_clauses: list[str] = []
         params: list[Any] = []
@@ -240,7 +355,7 @@ def create_app(control: RuntimeControl) -> FastAPI:
             where_sql = "WHERE " + " AND ".join(where_clauses)
 
         total_row = await fetch_one(
-            f"SELECT COUNT(*) AS total FROM messages {where_sql}",
+            f"SELECT COUNT(*) AS total FROM {table} {where_sql}",
             tuple(params),
         )
         total = int((total_row or {}).get("total", 0))
@@ -249,7 +364,7 @@ def create_app(control: RuntimeControl) -> FastAPI:
         items = await fetch_all(
             (
                 "SELECT message_id, channel, role, content, created_at_utc "
-                f"FROM messages {where_sql} "
+                f"FROM {table} {where_sql} "
                 "ORDER BY message_id DESC LIMIT ? OFFSET ?"
             ),
             tuple(query_params),
@@ -261,6 +376,7 @@ def create_app(control: RuntimeControl) -> FastAPI:
             "offset": offset,
             "q": q,
             "role": role,
+            "include_archive": table == "messages_all",
             "total": total,
         }
 
@@ -297,7 +413,12 @@ def create_app(control: RuntimeControl) -> FastAPI:
         total = int((total_row or {}).get("total", 0))
 
         sql = (
-            "SELECT reminder_id, title, remind_at_min_utc, prompt, status, next_action_at_min_utc, created_at_utc, updated_at_utc "
+            # 库中以 epoch 分钟存储，对外仍输出 "YYYY-MM-DD HH:MM"（UTC）
+            "SELECT reminder_id, title, "
+            "strftime('%Y-%m-%d %H:%M', remind_at_min_utc * 60, 'unixepoch') AS remind_at_min_utc, "
+            "prompt, status, recurrence_rule, occurrence_count, "
+            "strftime('%Y-%m-%d %H:%M', next_action_at_min_utc * 60, 'unixepoch') AS next_action_at_min_utc, "
+            "created_at_utc, updated_at_utc "
             f"FROM reminders {where_sql} ORDER BY reminder_id DESC LIMIT ? OFFSET ?"
         )
         params.extend([limit, offset])
@@ -312,6 +433,98 @@ def create_app(control: RuntimeControl) -> FastAPI:
             "total": total,
         }
 
+    @app.get("/api/v1/outbox")
+    async def get_outbox(
+        request: Request,
+        status: str | None = "dead",
+        limit: int = 50,
+        offset: int = 0,
+    ) -> dict[str, Any]:
+        """发件箱记录，默认列出死信"""
+        await require_admin_auth(request)
+        limit = max(1, min(limit, 500))
+        offset = max(0, offset)
+
+        where_sql = ""
+        params: list[Any] = []
+        if status:
+            where_sql = "WHERE status = ?"
+            params.append(status)
+
+        total_row = await fetch_one(
+            f"SELECT COUNT(*) AS total FROM outbox {where_sql}",
+            tuple(params),
+        )
+        total = int((total_row or {}).get("total", 0))
+
+        sql = (
+            "SELECT outbox_id, channel_type, content, metadata, message_id, status, attempts, max_attempts, "
+            "next_attempt_at_ms_utc, last_error, delivered_at_ms_utc, created_at_utc, updated_at_utc "
+            f"FROM outbox {where_sql} ORDER BY outbox_id DESC LIMIT ? OFFSET ?"
+        )
+        params.extend([limit, offset])
+        items = await fetch_all(sql, tuple(params))
+
+        return {
+            "items": items,
+            "limit": limit,
+            "offset": offset,
+            "status": status,
+            "total": total,
+        }
+
+    @app.post("/api/v1/outbox/{outbox_id}/retry")
+    async def retry_outbox(outbox_id: str, request: Request) -> dict[str, Any]:
+        """死信重新入队，由发件箱立即重发"""
+        auth_info = await require_admin_auth(request)
+        ensure_conn()
+        import storage.outbox as outbox_storage
+
+        if not await outbox_storage.requeue_dead(outbox_id, int(time.time() * 1000)):
+            raise HTTPException(status_code=404, detail="死信不存在")
+        from core.outbox import wake
+
+        wake()
+        logger.info(f"死信已重新入队: outbox_id={outbox_id}, by={auth_info['user']}")
+        return {"ok": True, "action": "retry", "outbox_id": outbox_id}
+
+    @app.post("/api/v1/loopback/runs")
+    async def start_loopback_run(payload: LoopbackRunRequest, request: Request) -> dict[str, Any]:
+        """在回环渠道上开始一轮压测(仅 PRIMARY_CONTACT_METHOD=loopback 时可用，避免回复发给真实用户)"""
+        auth_info = await require_admin_auth(request)
+        if PRIMARY_CONTACT_METHOD != "loopback":
+            raise HTTPException(status_code=409, detail="主联系方式不是 loopback")
+        from channels.loopback import start_run
+
+        try:
+            run = start_run(payload.messages, payload.count, payload.rate_per_second, payload.send_delay_ms)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        logger.info(f"开始回环压测: run_id={run['run_id']}, by={auth_info['user']}")
+        return {"ok": True, "run": run}
+
+    @app.get("/api/v1/loopback/runs/current")
+    async def get_loopback_run(request: Request, include_deliveries: bool = False) -> dict[str, Any]:
+        await require_admin_auth(request)
+        from channels.loopback import get_run
+
+        run = get_run(include_deliveries)
+        if run is None:
+            raise HTTPException(status_code=404, detail="尚未运行回环压测")
+        return {"run": run}
+
+    @app.delete("/api/v1/loopback/runs/current")
+    async def stop_loopback_run(request: Request) -> dict[str, Any]:
+        await require_admin_auth(request)
+        from channels.loopback import stop_run
+
+        run = await stop_run()
+        if run is None:
+            raise HTTPException(status_code=404, detail="尚未运行回环压测")
+        return {"ok": True, "run": run}
+
     @app.get("/api/v1/memory/groups")
     async def get_memory_groups(
         request: Request,
@@ -449,8 +662,8 @@ def create_app(control: RuntimeControl) -> FastAPI:
             await require_admin_auth(request)
 
         try:
-            payload = await request.json()
-        except Exception:
+            payload = loads(await request.body())
+        except JSONDecodeError:
             raise HTTPException(status_code=400, detail="Webhook payload 必须为 JSON")
 
         now_epoch = int(time.time())
@@ -467,6 +680,19 @@ def create_app(control: RuntimeControl) -> FastAPI:
 
         return {"ok": True, "message": "Webhook 已接收", "source": safe_source}
 
+    @app.post("/api/v1/admin/backup")
+    async def admin_backup(request: Request) -> dict[str, Any]:
+        auth_info = await require_admin_auth(request)
+        logger.info(f"收到手动备份请求: by={auth_info['user']}")
+        from maintenance.backup import run_once as run_backup
+
+        try:
+            result = await run_backup()
+        except Exception as e:
+            logger.error(f"手动备份失败: {e}", exc_info=e)
+            raise HTTPException(status_code=500, detail=f"备份失败: {e}")
+        return {"ok": True, "action": "backup", "result": result}
+
     @app.post("/api/v1/admin/restart")
     async def admin_restart(payload: ShutdownRequest, request: Request) -> dict[str, Any]:
         auth_info = await require_admin_auth(request)
@@ -1,12 +1,12 @@
 from __future__ import annotations
 
-import json
 import re
 from collections import deque
 from pathlib import Path
 from typing import Any
 
 import storage.db_config as db_config
+from codec import dumps_bytes
 from fastapi import HTTPException
 
 _LOG_LEVEL_RE = re.compile(r"\|\s*([A-Z]+)\s*\|")
@@ -36,8 +36,8 @@ async def fetch_one(sql: str, params: tuple[Any, ...] = ()) -> dict[str, Any] |
 
 def append_jsonl(path: Path, data: dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(data, ensure_ascii=False) + "\n")
+    with path.open("ab") as f:
+        f.write(dumps_bytes(data) + b"\n")
 
 
 def tail_lines(path: Path, lines: int) -> list[str]:
@@ -0,0 +1,124 @@
+"""
+渠道适配器基类与注册表
+
+每个渠道模块定义一个 Channel 子类，并在导入时调用 register_channel() 登记实例：
+- 注册表为渠道的每个 channel_type 注册 IO_DELIVER_MESSAGE 路由，发件箱的投递交给 Channel.send()；
+  未启用的渠道同样注册，切换渠道前登记的待重发消息仍能发送(或失败后进入死信)；
+- main 通过 load_channels() 导入内置渠道与 EXTRA_CHANNEL_MODULES 中的第三方渠道，
+  对已启用的渠道调用 run_channel()：start() 后等待关闭信号，再 stop()；
+- 管理后台通过 register_channel_routes() 挂载渠道需要的 HTTP/WS 路由，通过 get_channel_status() 汇总状态。
+
+接收方向由渠道自行把 IncomingMessage 发布到 E.IO_MESSAGE_RECEIVED(按会话分区)。
+"""
+
+import asyncio
+import importlib
+
+from fastapi import FastAPI
+
+from config.settings import EXTRA_CHANNEL_MODULES
+from datamodel import ChannelType
+from events import E, bus
+from logger import logger
+
+__all__ = [
+    "Channel",
+    "get_channel_status",
+    "get_channels",
+    "load_channels",
+    "register_channel",
+    "register_channel_routes",
+    "run_channel",
+]
+
+_BUILTIN_CHANNEL_MODULES = (
+    "channels.telegram_polling",
+    "channels.telegram_webhook",
+    "channels.qq_onebot_ws",
+    "channels.loopback",
+)
+
+_channels: dict[str, "Channel"] = {}
+
+
+class Channel:
+    """渠道适配器：子类需要设置 name 与 channel_types，并实现 is_enabled/start/send"""
+
+    name: str = ""
+    channel_types: tuple[ChannelType, ...] = ()
+
+    def is_enabled(self) -> bool:
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        """建立连接并开始接收，完成后返回"""
+        raise NotImplementedError
+
+    async def stop(self) -> None:
+        """停止接收并释放资源；start() 中途失败时也会调用，需要能处理未完全启动的状态"""
+
+    async def send(self, channel_type: str, content: str, metadata: dict | None) -> None:
+        """发送一条消息，失败时抛出异常，由发件箱按退避重发"""
+        raise NotImplementedError
+
+    def register_routes(self, app: FastAPI) -> None:
+        """在管理后台的 FastAPI 应用上挂载渠道需要的路由(如 Webhook、反向 WS)"""
+
+    def get_status(self) -> dict[str, object]:
+        return {}
+
+
+def register_channel(channel: Channel) -> Channel:
+    if not channel.name or not channel.channel_types:
+        raise ValueError(f"渠道缺少 name 或 channel_types: {type(channel).__name__}")
+    if channel.name in _channels:
+        raise RuntimeError(f"渠道已注册: {channel.name}")
+    _channels[channel.name] = channel
+
+    async def deliver(channel_type: str, content: str, metadata: dict | None = None, **_) -> None:
+        await channel.send(channel_type, content, metadata)
+
+    deliver.__name__ = f"{channel.name}.send"
+    for channel_type in channel.channel_types:
+        bus.on(E.IO_DELIVER_MESSAGE, route=channel_type)(deliver)
+    return channel
+
+
+def load_channels() -> list[Channel]:
+    """导入内置渠道与 EXTRA_CHANNEL_MODULES 中的渠道模块(模块导入时自行注册)，可重复调用"""
+    for module_name in (*_BUILTIN_CHANNEL_MODULES, *EXTRA_CHANNEL_MODULES):
+        importlib.import_module(module_name)
+    return get_channels()
+
+
+def get_channels() -> list[Channel]:
+    return list(_channels.values())
+
+
+async def run_channel(channel: Channel, shutdown_event: asyncio.Event) -> None:
+    try:
+        await channel.start()
+        await shutdown_event.wait()
+    finally:
+        await channel.stop()
+
+
+def register_channel_routes(app: FastAPI) -> None:
+    for channel in _channels.values():
+        if channel.is_enabled():
+            channel.register_routes(app)
+            logger.info(f"已挂载渠道路由: {channel.name}")
+
+
+def get_channel_status() -> dict[str, dict[str, object]]:
+    status: dict[str, dict[str, object]] = {}
+    for channel in _channels.values():
+        enabled = channel.is_enabled()
+        item: dict[str, object] = {"enabled": enabled}
+        if enabled:
+            try:
+                item.update(channel.get_status())
+            except Exception as e:
+                logger.warning(f"读取渠道状态失败: {channel.name}, error={e}")
+        status[channel.name] = item
+    return status
@@ -0,0 +1,192 @@
+"""
+本地回环渠道(压测用)
+
+不连接任何外部平台：按脚本向事件总线注入模拟的用户消息，并记录回复经发件箱送达本渠道的时间，
+用于在本地测量整条链路(接收 → 落库 → 规划/LLM → 发件箱 → 渠道发送)的端到端延迟与吞吐。
+
+- 需要 ENABLE_LOOPBACK_CHANNEL=true 且 PRIMARY_CONTACT_METHOD=loopback，回复才会送达本渠道；
+  注入的消息与回复会正常写入数据库，请使用单独的数据目录；
+- LLM 仍按配置调用，可把 OPENAI_PRIMARY_BASE_URL 指向本地的模拟服务以排除模型延迟；
+- Amaya 会把连续的多条消息合并后一起回复，回复与消息之间没有一一对应关系：
+  回复的 metadata 带有规划时读到的最新注入序号(loopback_seq)，送达时序号不超过它且尚未得到回复的消息
+  记为被这次回复应答，延迟 = 送达时间 - 注入时间；不带序号或属于其他轮次的送达(如提醒)只计入送达数；
+- 同一时间只运行一轮，通过管理 API 启动、查看与停止注入(见 docs/API.zh-CN.md)。
+"""
+
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+
+from ulid import ULID
+
+from channels.base import Channel, register_channel
+from config.settings import ENABLE_LOOPBACK_CHANNEL, LOOPBACK_MAX_MESSAGES
+from datamodel import ChannelType, IncomingMessage
+from events import E, bus
+from logger import logger
+from metrics import Histogram
+
+__all__ = ["get_run", "get_status", "start_run", "stop_run"]
+
+_LATENCY_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+
+
+class _LoopbackRun:
+    def __init__(self, messages: list[str], count: int, rate_per_second: float | None, send_delay_ms: int) -> None:
+        self.run_id = str(ULID())
+        self.messages = messages
+        self.count = count
+        self.rate_per_second = rate_per_second
+        self.send_delay_ms = send_delay_ms
+        self.started_at = time.time()
+        self.injection_finished_at: float | None = None
+        self.injected_count = 0
+        self.unanswered: deque[tuple[int, float]] = deque()  # 尚未得到回复的消息的 (序号, 注入时间)
+        self.answered_count = 0
+        self.delivered_at: list[float] = []  # 每条回复的送达时间
+        self.latency_ms = Histogram(_LATENCY_BUCKETS_MS)
+        self.inject_task: asyncio.Task | None = None
+
+    def record_delivery(self, now: float, answered_seq: int | None) -> None:
+        self.delivered_at.append(now)
+        if answered_seq is None:
+            return
+        while self.unanswered and self.unanswered[0][0] <= answered_seq:
+            _, injected_at = self.unanswered.popleft()
+            self.latency_ms.observe((now - injected_at) * 1000)
+            self.answered_count += 1
+
+    def snapshot(self, include_deliveries: bool = False) -> dict[str, object]:
+        injecting = self.inject_task is not None and not self.inject_task.done()
+        injection_seconds = (self.injection_finished_at or time.time()) - self.started_at
+        last_delivery = self.delivered_at[-1] if self.delivered_at else None
+        answered_seconds = None if last_delivery is None else last_delivery - self.started_at
+        result: dict[str, object] = {
+            "run_id": self.run_id,
+            "injecting": injecting,
+            "count": self.count,
+            "rate_per_second": self.rate_per_second,
+            "send_delay_ms": self.send_delay_ms,
+            "started_at_epoch": self.started_at,
+            "injection_finished_at_epoch": self.injection_finished_at,
+            "last_delivery_at_epoch": last_delivery,
+            "injected_count": self.injected_count,
+            "delivered_count": len(self.delivered_at),
+            "answered_count": self.answered_count,
+            "unanswered_count": len(self.unanswered),
+            "ingress_per_second": round(self.injected_count / injection_seconds, 2) if injection_seconds > 0 else None,
+            "answered_per_second": (
+                round(self.answered_count / answered_seconds, 2) if answered_seconds else None
+            ),
+            "latency_ms": self.latency_ms.snapshot(),
+        }
+        if include_deliveries:
+            result["delivered_at_epoch"] = list(self.delivered_at)
+        return result
+
+
+_run: _LoopbackRun | None = None
+_delivered_count = 0
+
+
+def get_status() -> dict[str, object]:
+    return {
+        "delivered_count": _delivered_count,
+        "run": None if _run is None else _run.snapshot(),
+    }
+
+
+def get_run(include_deliveries: bool = False) -> dict[str, object] | None:
+    return None if _run is None else _run.snapshot(include_deliveries)
+
+
+async def _inject(run: _LoopbackRun) -> None:
+    key = f"conversation:{ChannelType.LOOPBACK.value}"
+    started = time.monotonic()
+    try:
+        for seq in range(run.count):
+            if run.rate_per_second:
+                delay = started + seq / run.rate_per_second - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            now = time.time()
+            run.unanswered.append((seq, now))
+            run.injected_count += 1
+            # 分区队列满时在此等待，注入速度受限于整条链路的处理能力
+            await bus.publish(E.IO_MESSAGE_RECEIVED, IncomingMessage(
+                channel_type=ChannelType.LOOPBACK,
+                content=run.messages[seq % len(run.messages)],
+                timestamp=datetime.fromtimestamp(now),
+                metadata={"loopback_run_id": run.run_id, "loopback_seq": seq},
+            ), key=key)
+    finally:
+        run.injection_finished_at = time.time()
+        logger.info(f"回环渠道注入结束: run_id={run.run_id}, injected={run.injected_count}/{run.count}")
+
+
+def start_run(messages: list[str], count: int, rate_per_second: float | None = None, send_delay_ms: int = 0) -> dict[str, object]:
+    """开始一轮压测：循环使用 messages 注入 count 条消息，rate_per_second 为空时不限速"""
+    global _run
+    if not ENABLE_LOOPBACK_CHANNEL:
+        raise RuntimeError("回环渠道未启用")
+    if _run is not None and _run.inject_task is not None and not _run.inject_task.done():
+        raise RuntimeError(f"已有一轮压测正在注入: run_id={_run.run_id}")
+    messages = [message for message in messages if message.strip()]
+    if not messages:
+        raise ValueError("messages 不能为空")
+    if not 1 <= count <= LOOPBACK_MAX_MESSAGES:
+        raise ValueError(f"count 必须在 1 到 {LOOPBACK_MAX_MESSAGES} 之间")
+    if rate_per_second is not None and rate_per_second <= 0:
+        rate_per_second = None
+
+    run = _LoopbackRun(messages, count, rate_per_second, max(0, send_delay_ms))
+    run.inject_task = asyncio.create_task(_inject(run), name=f"loopback:{run.run_id}")
+    _run = run
+    logger.info(f"回环渠道开始压测: run_id={run.run_id}, count={count}, rate_per_second={rate_per_second}")
+    return run.snapshot()
+
+
+async def stop_run() -> dict[str, object] | None:
+    """停止当前一轮的注入(已注入的消息仍会继续处理与统计)"""
+    if _run is None:
+        return None
+    task = _run.inject_task
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    return _run.snapshot()
+
+
+class LoopbackChannel(Channel):
+    name = "loopback"
+    channel_types = (ChannelType.LOOPBACK,)
+
+    def is_enabled(self) -> bool:
+        return ENABLE_LOOPBACK_CHANNEL
+
+    async def start(self) -> None:
+        logger.warning("回环渠道已启用，仅用于本地压测")
+
+    async def stop(self) -> None:
+        await stop_run()
+
+    async def send(self, channel_type: str, content: str, metadata: dict | None) -> None:
+        global _delivered_count
+        run = _run
+        if run is not None and run.send_delay_ms:
+            await asyncio.sleep(run.send_delay_ms / 1000)  # 模拟平台接口的发送耗时
+        _delivered_count += 1
+        if run is not None:
+            metadata = metadata or {}
+            answered_seq = metadata.get("loopback_seq") if metadata.get("loopback_run_id") == run.run_id else None
+            run.record_delivery(time.time(), answered_seq if isinstance(answered_seq, int) else None)
+
+    def get_status(self) -> dict[str, object]:
+        return get_status()
+
+
+register_channel(LoopbackChannel())
@@ -3,6 +3,13 @@ from __future__ import annotations
 """
 NapCatQQ OneBot 反向WS通道
 
+支持同时接入多个 NapCat 实例(多个账号，或同一账号的冗余连接)，连接池按 self_id 分组：
+- 发送按目标路由到最近一次收到其消息的账号，同账号内选择进行中调用最少的连接；
+- 连接在调用得到响应前断开时，调用转交其他健康连接重新提交，没有可用连接时在超时时间内等待重连；
+- 冗余连接重复上报的同一条消息按 (self_id, message_id) 去重；
+- 接收循环只就地完成 API 响应(echo)，消息等事件交给 QQ_NAPCAT_EVENT_WORKERS 个工作协程处理；
+  同一会话 (user_id, group_id) 的消息事件按接收顺序逐条处理，下载图片等等待不会让后一条消息先发布。
+
 通信协议参考资料(部分):
 https://napneko.github.io/
 https://napneko.github.io/use/integration
@@ -18,38 +25,92 @@ https://node-napcat-ts.huankong.top/guide/call-api
 import asyncio
 import datetime
 import hmac
-import json
+import time
 import uuid
+from collections import OrderedDict
 from typing import Any
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 
+from codec import JSONDecodeError, dumps, loads
 from config.settings import *
-from datamodel import ChannelType, IncomingMessage, OutgoingMessage
+from datamodel import ChannelType, IncomingMessage
 from events import E, bus
 from logger import logger
+from metrics import Histogram
+import storage.attachment as attachment_storage
+from channels.base import Channel, register_channel
+
+
+class _SessionClosed(RuntimeError):
+    """调用尚未得到响应时所在连接已断开，可以换一个连接重新提交"""
 
 
 class _NapCatQQSession:
-    def __init__(self, websocket: WebSocket):
+    def __init__(self, websocket: WebSocket, self_id: int | None):
         self.websocket = websocket
+        self.self_id = self_id
         self.send_lock = asyncio.Lock()
+        self.pending: dict[str, asyncio.Future] = {}  # echo -> 等待响应的调用
+        self.closed = False
+        self.connected_at = datetime.datetime.now()
+        self.call_count = 0
 
     async def send_json(self, payload: dict[str, Any]) -> None:
         async with self.send_lock:
-            await self.websocket.send_text(json.dumps(payload, ensure_ascii=False))
+            await self.websocket.send_text(dumps(payload))
+
+    def fail_pending(self, exc: Exception) -> None:
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending.clear()
 
 
+_LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_RECENT_MESSAGE_KEYS_SIZE = 1024  # 同一账号的冗余连接会重复上报同一条消息，按 (self_id, message_id) 去重
+
 _routes_registered = False
-_active_session: _NapCatQQSession | None = None
-_session_lock = asyncio.Lock()
-_pending_echo: dict[str, asyncio.Future] = {}
+# 连接池：self_id -> 该账号的所有连接(多个 NapCat 实例可以登录同一账号做冗余)；self_id 未知的连接记在 None 下
+_sessions: dict[int | None, list[_NapCatQQSession]] = {}
+_sessions_changed = asyncio.Event()  # 有新连接加入时唤醒等待可用连接的调用
+_last_self_id: dict[tuple[int | None, int | None], int] = {}  # (qq_user_id, qq_group_id) -> 最近一次收到消息的账号
+_recent_message_keys: OrderedDict[tuple[int | None, Any], None] = OrderedDict()
+_failover_count = 0
+_duplicate_message_count = 0
+# 事件在接收循环之外处理，避免慢处理(如等待 API 响应的拒绝消息)阻塞同一连接上 echo 帧的读取
+_event_queue: asyncio.Queue[tuple[_NapCatQQSession, dict[str, Any], float]] = asyncio.Queue(maxsize=QQ_NAPCAT_EVENT_QUEUE_SIZE)
+_event_workers: set[asyncio.Task] = set()
+# (qq_user_id, qq_group_id) -> 该会话最后一条消息事件处理完成的信号，后到的消息等前一条处理完再处理
+_conversation_tails: dict[tuple[int | None, int | None], asyncio.Future] = {}
+_event_queue_wait_ms = Histogram(_LATENCY_BUCKETS_MS)  # 事件入队到开始处理的等待时间(接收循环从不等待队列)
+_echo_rtt_ms = Histogram(_LATENCY_BUCKETS_MS)  # API 调用发出到收到响应
+_event_failed_count = 0
+_event_dropped_count = 0
 
 
 def get_status() -> dict[str, object]:
+    sessions = [session for pool in _sessions.values() for session in pool]
     return {
-        "connected": _active_session is not None,
-        "pending_calls": len(_pending_echo),
+        "connected": bool(sessions),
+        "pending_calls": sum(len(session.pending) for session in sessions),
+        "sessions": [
+            {
+                "self_id": session.self_id,
+                "pending_calls": len(session.pending),
+                "call_count": session.call_count,
+                "connected_at": session.connected_at.isoformat(timespec="seconds"),
+            }
+            for session in sessions
+        ],
+        "failover_count": _failover_count,
+        "duplicate_message_count": _duplicate_message_count,
+        "event_queue_depth": _event_queue.qsize(),
+        "event_workers": len(_event_workers),
+        "event_failed_count": _event_failed_count,
+        "event_dropped_count": _event_dropped_count,
+        "event_queue_wait_ms": _event_queue_wait_ms.snapshot(),
+        "echo_rtt_ms": _echo_rtt_ms.snapshot(),
     }
 
 
@@ -80,6 +141,20 @@ def _to_int(value: Any) -> int | None:
         return None
 
 
+def _is_duplicate_message(self_id: int | None, message_id: Any) -> bool:
+    global _duplicate_message_count
+    if message_id is None:
+        return False
+    key = (self_id, message_id)
+    if key in _recent_message_keys:
+        _duplicate_message_count += 1
+        return True
+    _recent_message_keys[key] = None
+    if len(_recent_message_keys) > _RECENT_MESSAGE_KEYS_SIZE:
+        _recent_message_keys.popitem(last=False)
+    return False
+
+
 def _extract_text_content(message: Any, raw_message: Any) -> str:
     if isinstance(message, str):
         return message.strip()
@@ -103,82 +178,136 @@ def _extract_text_content(message: Any, raw_message: Any) -> str:
     return str(raw_message).strip()
 
 
-def _resolve_pending_response(payload: dict[str, Any]) -> None:
+def _extract_image_urls(message: Any) -> list[str]:
+    if not isinstance(message, list):
+        return []
+    urls: list[str] = []
+    for segment in message:
+        if not isinstance(segment, dict) or segment.get("type") != "image":
+            continue
+        data = segment.get("data")
+        url = data.get("url") if isinstance(data, dict) else None
+        if isinstance(url, str) and url.startswith(("http://", "https://")):
+            urls.append(url)
+    return urls
+
+
+async def _download_images(urls: list[str]) -> list[dict[str, str]]:
+    """把图片下载到附件缓存，单张失败只记录日志"""
+    attachments: list[dict[str, str]] = []
+    for url in urls:
+        try:
+            attachments.append(await attachment_storage.download(url))
+        except Exception as e:
+            logger.warning(f"下载 QQ 图片失败: url={url}, error={type(e).__name__}: {e}")
+    return attachments
+
+
+def _resolve_pending_response(session: _NapCatQQSession, payload: dict[str, Any]) -> None:
     echo = str(payload.get("echo", ""))
     if echo == "":
         return
 
-    future = _pending_echo.get(echo)
+    future = session.pending.get(echo)
     if future is None or future.done():
         return
     future.set_result(payload)
 
 
-def _fail_all_pending(exc: Exception) -> None:
-    for future in list(_pending_echo.values()):
-        if not future.done():
-            future.set_exception(exc)
-    _pending_echo.clear()
+def _add_session(session: _NapCatQQSession) -> None:
+    _sessions.setdefault(session.self_id, []).append(session)
+    _sessions_changed.set()
 
 
-async def _replace_active_session(session: _NapCatQQSession) -> None:
-    global _active_session
-    old: _NapCatQQSession | None = None
-    async with _session_lock:
-        old = _active_session
-        _active_session = session
+def _remove_session(session: _NapCatQQSession) -> None:
+    session.closed = True
+    pool = _sessions.get(session.self_id)
+    if pool is not None and session in pool:
+        pool.remove(session)
+        if not pool:
+            del _sessions[session.self_id]
+    session.fail_pending(_SessionClosed("NapCatQQ Reverse WS 连接已断开"))
 
-    if old is not None:
-        try:
-            await old.websocket.close(code=1012, reason="replaced")
-        except Exception:
-            pass
-
-
-async def _detach_active_session(session: _NapCatQQSession) -> bool:
-    global _active_session
-    async with _session_lock:
-        if _active_session is session:
-            _active_session = None
-            return True
-    return False
-
-async def _close_active_session(reason: str) -> None:
-    global _active_session
-    session: _NapCatQQSession | None = None
-    async with _session_lock:
-        session = _active_session
-        _active_session = None
 
-    if session is not None:
+def _bind_self_id(session: _NapCatQQSession, self_id: int | None) -> None:
+    """连接时未带 X-Self-ID 的，以收到的第一条事件中的 self_id 归入对应账号"""
+    if self_id is None or session.self_id is not None or session.closed:
+        return
+    pool = _sessions.get(None)
+    if pool is not None and session in pool:
+        pool.remove(session)
+        if not pool:
+            del _sessions[None]
+    session.self_id = self_id
+    _sessions.setdefault(self_id, []).append(session)
+    logger.info(f"NapCatQQ 连接已关联账号: self_id={self_id}")
+
+
+async def _close_all_sessions(reason: str) -> None:
+    sessions = [session for pool in _sessions.values() for session in pool]
+    for session in sessions:
+        _remove_session(session)
         try:
             await session.websocket.close(code=1001, reason=reason)
         except Exception:
             pass
 
 
-async def _send_action(action: str, params: dict[str, Any]) -> dict[str, Any]:
-    session = _active_session
-    if session is None:
-        raise RuntimeError("NapCatQQ Reverse WS 未连接")
+def _pick_session(self_id: int | None, exclude: set[_NapCatQQSession]) -> _NapCatQQSession | None:
+    """优先使用目标所在账号的连接，其中取进行中调用最少的；该账号没有可用连接时退回任意账号"""
+    for pool in (_sessions.get(self_id, []) if self_id is not None else [], *_sessions.values()):
+        candidates = [session for session in pool if session not in exclude and not session.closed]
+        if candidates:
+            return min(candidates, key=lambda session: len(session.pending))
+    return None
 
-    echo = uuid.uuid4().hex
-    loop = asyncio.get_running_loop()
-    future: asyncio.Future = loop.create_future()
-    _pending_echo[echo] = future
 
-    try:
-        await session.send_json({"action": action, "params": params, "echo": echo})
-        response = await asyncio.wait_for(future, timeout=QQ_NAPCAT_SEND_TIMEOUT_SECONDS)
-    finally:
-        _pending_echo.pop(echo, None)
+async def _send_action(action: str, params: dict[str, Any], self_id: int | None = None) -> dict[str, Any]:
+    """
+    调用 OneBot API。连接在响应前断开时换一个健康的连接重新提交(可能重复发送，与重发队列一样是至少一次语义)；
+    暂时没有可用连接时在超时时间内等待重连
+    """
+    global _failover_count
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + QQ_NAPCAT_SEND_TIMEOUT_SECONDS
+    tried: set[_NapCatQQSession] = set()
+
+    while True:
+        session = _pick_session(self_id, tried)
+        if session is None:
+            _sessions_changed.clear()
+            try:
+                await asyncio.wait_for(_sessions_changed.wait(), timeout=max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise RuntimeError("NapCatQQ Reverse WS 未连接")
+            continue
+
+        echo = uuid.uuid4().hex
+        future: asyncio.Future = loop.create_future()
+        session.pending[echo] = future
+        session.call_count += 1
+        try:
+            sent_at = time.perf_counter()
+            await session.send_json({"action": action, "params": params, "echo": echo})
+            response = await asyncio.wait_for(future, timeout=max(0.0, deadline - loop.time()))
+            _echo_rtt_ms.observe((time.perf_counter() - sent_at) * 1000)
+        except (_SessionClosed, WebSocketDisconnect, RuntimeError) as e:
+            # RuntimeError: 连接关闭过程中调用 send_text
+            if not (isinstance(e, _SessionClosed) or session.closed):
+                raise
+            tried.add(session)
+            _failover_count += 1
+            logger.warning(f"NapCatQQ 连接断开，调用转交其他连接: action={action}, self_id={session.self_id}")
+            continue
+        finally:
+            session.pending.pop(echo, None)
 
-    if response.get("status") != "ok":
-        raise RuntimeError(f"OneBot API 调用失败: action={action}, response={response}")
-    return response
+        if response.get("status") != "ok":
+            raise RuntimeError(f"OneBot API 调用失败: action={action}, response={response}")
+        return response
 
 
-async def _safe_reject_private_user(qq_user_id: int) -> None:
+async def _safe_reject_private_user(qq_user_id: int, self_id: int | None) -> None:
     try:
         await _send_action(
             "send_private_msg",
@@ -186,6 +315,7 @@ async def _safe_reject_private_user(qq_user_id: int) -> None:
                 "user_id": qq_user_id,
                 "message": "您无权使用此 Bot。如有需要, 请联系管理员。",
             },
+            self_id,
         )
     except Exception as e:
         logger.warning(f"发送 NapCatQQ 鉴权拒绝消息失败: user={qq_user_id}, error={e}")
@@ -205,15 +335,23 @@ async def _handle_message_event(payload: dict[str, Any]) -> None:
     self_id = _to_int(payload.get("self_id"))
     if self_id is not None and qq_user_id == self_id:
         return
+    if _is_duplicate_message(self_id, payload.get("message_id")):
+        return
 
     # 检查是否是主用户
     if qq_user_id != PRIMARY_QQ_USER_ID:
         logger.warning(f"QQ 用户 {qq_user_id} 未经允许访问 Bot")
         if message_type == "private":
-            await _safe_reject_private_user(qq_user_id)
+            await _safe_reject_private_user(qq_user_id, self_id)
         return
 
-    content = _extract_text_content(payload.get("message"), payload.get("raw_message"))
+    # 含图片时 raw_message 是带 CQ 码的原文，不再作为文本回退
+    image_urls = _extract_image_urls(payload.get("message"))
+    text = _extract_text_content(payload.get("message"), None if image_urls else payload.get("raw_message"))
+    attachments = await _download_images(image_urls)
+    content = "\n".join(part for part in (attachment_storage.describe(attachments), text) if part)
+    if content == "" and image_urls:
+        content = "[图片(下载失败)]"
     if content == "":
         return
 
@@ -231,24 +369,88 @@ async def _handle_message_event(payload: dict[str, Any]) -> None:
     qq_group_id = _to_int(payload.get("group_id"))
     if qq_group_id is not None:
         metadata["qq_group_id"] = qq_group_id
+    if self_id is not None:
+        _last_self_id[(qq_user_id, qq_group_id)] = self_id
 
-    bus.emit(E.IO_MESSAGE_RECEIVED, IncomingMessage(
+    await bus.publish(E.IO_MESSAGE_RECEIVED, IncomingMessage(
         channel_type=ChannelType.NAPCATQQ_ONEBOT_V11,
         content=content,
+        attachments=attachments or None,
         channel_context=None,
         metadata=metadata,
         timestamp=timestamp,
-    ))
+    ), key=f"conversation:{ChannelType.NAPCATQQ_ONEBOT_V11.value}")
 
 
-async def _handle_payload(payload: Any) -> None:
+def _handle_payload(session: _NapCatQQSession, payload: Any) -> None:
+    """
+    接收循环中调用，不会等待：API 响应就地完成，其余事件放入队列由工作协程处理。
+    队列满时丢弃事件并计数——接收循环一旦等待队列，工作协程等待的 echo 响应也读不到，会一直卡到调用超时
+    """
+    global _event_dropped_count
     if not isinstance(payload, dict):
         return
 
     if "echo" in payload:
-        _resolve_pending_response(payload)
+        _resolve_pending_response(session, payload)
         return
 
+    _bind_self_id(session, _to_int(payload.get("self_id")))
+    _ensure_event_workers()
+    try:
+        _event_queue.put_nowait((session, payload, time.perf_counter()))
+    except asyncio.QueueFull:
+        _event_dropped_count += 1
+        logger.warning(
+            f"NapCatQQ 事件队列已满，丢弃事件: post_type={payload.get('post_type')}, "
+            f"message_id={payload.get('message_id')}, dropped={_event_dropped_count}"
+        )
+
+
+def _ensure_event_workers() -> None:
+    while len(_event_workers) < QQ_NAPCAT_EVENT_WORKERS:
+        worker = asyncio.create_task(_run_event_worker(), name=f"napcatqq-event-{len(_event_workers)}")
+        _event_workers.add(worker)
+        worker.add_done_callback(_event_workers.discard)
+
+
+async def _run_event_worker() -> None:
+    global _event_failed_count
+    while True:
+        session, payload, received_at = await _event_queue.get()
+        _event_queue_wait_ms.observe((time.perf_counter() - received_at) * 1000)
+        try:
+            if payload.get("post_type") == "message":
+                await _handle_in_conversation_order(payload)
+            else:
+                await _handle_event(payload)
+        except Exception as e:
+            _event_failed_count += 1
+            logger.error(f"NapCatQQ 事件处理失败: {e}", exc_info=e)
+        finally:
+            _event_queue.task_done()
+
+
+async def _handle_in_conversation_order(payload: dict[str, Any]) -> None:
+    """
+    消息事件在 bus.publish 之前有等待点(下载图片、发送拒绝消息)，多个工作协程并行处理会打乱同一会话的消息顺序。
+    出队后立即(没有等待点)排到该会话上一条消息之后，等它处理完再处理本条；等待的工作协程不再出队，保留队列的背压
+    """
+    key = (_to_int(payload.get("user_id")), _to_int(payload.get("group_id")))
+    previous = _conversation_tails.get(key)
+    done = asyncio.get_running_loop().create_future()
+    _conversation_tails[key] = done
+    try:
+        if previous is not None:
+            await asyncio.shield(previous)
+        await _handle_event(payload)
+    finally:
+        done.set_result(None)
+        if _conversation_tails.get(key) is done:
+            del _conversation_tails[key]
+
+
+async def _handle_event(payload: dict[str, Any]) -> None:
     post_type = payload.get("post_type")
     if post_type == "message":
         await _handle_message_event(payload)
@@ -271,62 +473,70 @@ def register_fastapi_routes(app: FastAPI) -> None:
             return
 
         await websocket.accept()
-        session = _NapCatQQSession(websocket)
-        await _replace_active_session(session)
-        logger.info(f"NapCatQQ Reverse WS 已连接: path={QQ_NAPCAT_WS_PATH}")
+        # OneBot v11 反向 WS 连接时通过 X-Self-ID 请求头携带登录账号
+        session = _NapCatQQSession(websocket, _to_int(websocket.headers.get("x-self-id")))
+        _add_session(session)
+        logger.info(f"NapCatQQ Reverse WS 已连接: path={QQ_NAPCAT_WS_PATH}, self_id={session.self_id}")
 
         try:
             while True:
                 raw = await websocket.receive_text()
                 try:
-                    payload = json.loads(raw)
-                except json.JSONDecodeError:
+                    payload = loads(raw)
+                except JSONDecodeError:
                     logger.warning("收到无法解析的 NapCatQQ 消息, 已忽略")
                     continue
-                await _handle_payload(payload)
+                _handle_payload(session, payload)
         except WebSocketDisconnect:
             logger.warning("NapCatQQ Reverse WS 已断开")
         except Exception as e:
             logger.error(f"NapCatQQ Reverse WS 处理异常: {e}", exc_info=e)
         finally:
-            was_active = await _detach_active_session(session)
-            if was_active:
-                _fail_all_pending(RuntimeError("NapCatQQ Reverse WS 连接已断开"))
+            # 未完成的调用由 _send_action 转交同账号(或其他账号)的健康连接
+            _remove_session(session)
 
     _routes_registered = True
 
 
-@bus.on(E.IO_SEND_MESSAGE)
-async def send_outgoing_message(msg: OutgoingMessage) -> None:
-    if msg.channel_type != ChannelType.NAPCATQQ_ONEBOT_V11:
-        return
+async def _deliver(qq_user_id: Any, qq_group_id: int | None, content: str, self_id: int | None = None) -> None:
+    # 未指定账号时按目标选择最近一次收到其消息的账号
+    if self_id is None:
+        self_id = _last_self_id.get((_to_int(qq_user_id), qq_group_id))
+    if qq_group_id is not None:
+        await _send_action("send_group_msg", {"group_id": qq_group_id, "message": content}, self_id)
+    else:
+        await _send_action("send_private_msg", {"user_id": qq_user_id, "message": content}, self_id)
 
-    qq_user_id = msg.metadata.get("qq_user_id") if msg.metadata else None
-    if qq_user_id is None:
-        qq_user_id = PRIMARY_QQ_USER_ID
-    
-    qq_group_id = _to_int(msg.metadata.get("qq_group_id")) if msg.metadata else None
 
-    try:
-        if qq_group_id is not None:
-            await _send_action("send_group_msg", {"group_id": qq_group_id, "message": msg.content})
-        else:
-            await _send_action("send_private_msg", {"user_id": qq_user_id, "message": msg.content})
-    except Exception as e:
-        logger.error(f"向 QQ 用户发送消息失败: error={e}, 即将重试", exc_info=e)
-        try:
-            await asyncio.sleep(2)
-            if qq_group_id is not None:
-                await _send_action("send_group_msg", {"group_id": qq_group_id, "message": msg.content})
-            else:
-                await _send_action("send_private_msg", {"user_id": qq_user_id, "message": msg.content})
-        except Exception as e2:
-            logger.error(f"[重试] 向 QQ 用户发送消息失败: user_id={msg.user_id}, error={e2}", exc_info=e2)
+class NapCatQQChannel(Channel):
+    name = "napcatqq"
+    channel_types = (ChannelType.NAPCATQQ_ONEBOT_V11,)
+
+    def is_enabled(self) -> bool:
+        return ENABLE_QQ_NAPCAT
+
+    async def start(self) -> None:
+        # 连接由 NapCat 主动发起(见 register_fastapi_routes)，这里无需建立连接
+        logger.info(f"NapCatQQ OneBot 通道已启动，等待反向 WS 连接: {QQ_NAPCAT_WS_PATH}")
+
+    async def stop(self) -> None:
+        await _close_all_sessions("service_shutdown")
+        for worker in list(_event_workers):
+            worker.cancel()
+        logger.info("NapCatQQ OneBot 通道已关闭")
+
+    async def send(self, channel_type: str, content: str, metadata: dict | None) -> None:
+        metadata = metadata or {}
+        qq_user_id = metadata.get("qq_user_id")
+        if qq_user_id is None:
+            qq_user_id = PRIMARY_QQ_USER_ID
+        await _deliver(qq_user_id, _to_int(metadata.get("qq_group_id")), content, _to_int(metadata.get("qq_self_id")))
+
+    def register_routes(self, app: FastAPI) -> None:
+        register_fastapi_routes(app)
+
+    def get_status(self) -> dict[str, object]:
+        return get_status()
 
 
-async def main(shutdown_event: asyncio.Event = asyncio.Event()) -> None:
-    logger.info(f"NapCatQQ OneBot 通道已启动，等待反向 WS 连接: {QQ_NAPCAT_WS_PATH}")
-    await shutdown_event.wait()
-    await _close_active_session("service_shutdown")
-    _fail_all_pending(RuntimeError("服务已关闭"))
-    logger.info("NapCatQQ OneBot 通道已关闭")
+register_channel(NapCatQQChannel())
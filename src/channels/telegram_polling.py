@@ -1,15 +1,20 @@
 from logger import logger
 from events import bus, E
 from datamodel import *
+from metrics import Histogram
 import datetime
 import asyncio
+import time
 
 from config.settings import *
 import telegram
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters
 
 from functools import wraps
 
+import storage.attachment as attachment_storage
+from channels.base import Channel, register_channel
+
 def requires_auth(func):
     @wraps(func)
     async def decorated(update: telegram.Update, *args, **kwargs):
@@ -21,59 +26,189 @@ def requires_auth(func):
     return decorated
 
 
+# Polling 与 Webhook 只是更新的接入方式不同，收发处理器共用；渠道类型随启用的模式而定
+TELEGRAM_CHANNEL_TYPE = ChannelType.TELEGRAM_BOT_WEBHOOK if ENABLE_TELEGRAM_BOT_WEBHOOK else ChannelType.TELEGRAM_BOT_POLLING
+
+_SEND_LATENCY_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# 正在输入状态由 Amaya 的 PRESENCE_TYPING 事件驱动；客户端约 5 秒后清除输入状态，因此按略短的间隔重复发送
+_TYPING_INTERVAL_SECONDS = 4.5
+_TYPING_MAX_SECONDS = 300  # 兜底上限，防止关闭通知丢失时无限发送
+
 _typing_tasks: dict[int, asyncio.Task] = {}
+_typing_refresh: dict[int, asyncio.Event] = {}
+_typing_action_count = 0
 _bot_instance: telegram.Bot = None
 
 
+class _TokenBucket:
+    """令牌桶：按 rate(每秒)补充，最多积攒 capacity 个令牌"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# ----------------- 出站发送队列 ----------------
+# 每个会话一个有界队列和一个按需启动的发送协程，保证同一会话内按顺序发送；
+# 发送前依次取会话令牌桶与全局令牌桶的令牌，收到 429(RetryAfter) 时全局暂停 retry_after 秒后重发同一条消息。
+# 队列项: (bot, 文本, 入队时间, 等待结果的 Future 或 None)
+_send_queues: dict[int, asyncio.Queue] = {}
+_send_workers: set[asyncio.Task] = set()
+_chat_buckets: dict[int, _TokenBucket] = {}
+_global_bucket = _TokenBucket(TELEGRAM_SEND_GLOBAL_RATE, max(1.0, TELEGRAM_SEND_GLOBAL_RATE))
+_paused_until = 0.0  # time.monotonic()，收到 429 后全局暂停到该时刻
+_sent_count = 0
+_send_failed_count = 0
+_rate_limited_count = 0
+_send_latency_ms = Histogram(_SEND_LATENCY_BUCKETS_MS)
+
+
 def get_status() -> dict[str, object]:
     return {
+        "mode": "webhook" if ENABLE_TELEGRAM_BOT_WEBHOOK else "polling",
         "connected": _bot_instance is not None,
         "active_typing": len(_typing_tasks),
+        "typing_action_count": _typing_action_count,
+        "send_queue_depth": sum(queue.qsize() for queue in _send_queues.values()),
+        "send_queue_chats": len(_send_queues),
+        "receive_queue_depth": sum(queue.qsize() for queue in _receive_queues.values()),
+        "sent_count": _sent_count,
+        "send_failed_count": _send_failed_count,
+        "rate_limited_count": _rate_limited_count,
+        "paused_for_seconds": round(max(0.0, _paused_until - time.monotonic()), 2),
+        "send_latency_ms": _send_latency_ms.snapshot(),
     }
 
-async def _send_typing_loop(bot: telegram.Bot, chat_id: int) -> None:
-    """发送正在输入的动作"""
+
+def _retry_after_seconds(error: telegram.error.RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def _enqueue_send(bot: telegram.Bot, chat_id: int, text: str, result: asyncio.Future) -> None:
+    """放入会话的发送队列，发送结果写入 result；队列满时等待，形成背压"""
+    queue = _send_queues.get(chat_id)
+    if queue is None:
+        queue = asyncio.Queue(maxsize=TELEGRAM_SEND_QUEUE_SIZE)
+        _send_queues[chat_id] = queue
+        worker = asyncio.create_task(_drain_send_queue(chat_id, queue), name=f"telegram-send:{chat_id}")
+        _send_workers.add(worker)
+        worker.add_done_callback(_send_workers.discard)
+    await queue.put((bot, text, time.perf_counter(), result))
+
+
+async def _send_with_limits(bot: telegram.Bot, chat_id: int, text: str) -> None:
+    global _rate_limited_count, _paused_until
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        bucket = _chat_buckets[chat_id] = _TokenBucket(TELEGRAM_SEND_CHAT_RATE, TELEGRAM_SEND_CHAT_BURST)
+    while True:
+        await bucket.acquire()
+        await _global_bucket.acquire()
+        pause = _paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            return
+        except telegram.error.RetryAfter as e:
+            _rate_limited_count += 1
+            wait_seconds = _retry_after_seconds(e)
+            _paused_until = max(_paused_until, time.monotonic() + wait_seconds)
+            logger.warning(f"Telegram 触发限流，{wait_seconds:.0f}s 后重发: chat_id={chat_id}")
+
+
+async def _drain_send_queue(chat_id: int, queue: asyncio.Queue) -> None:
+    # 队列取空即退出并移除；判断与移除之间没有 await，不会与 _enqueue_send 交错
+    global _sent_count, _send_failed_count
+    while not queue.empty():
+        bot, text, enqueued_at, result = queue.get_nowait()
+        try:
+            await _send_with_limits(bot, chat_id, text)
+        except Exception as e:
+            _send_failed_count += 1
+            logger.error(f"向 Telegram 用户 {chat_id} 发送消息失败: {e}", exc_info=e)
+            if not result.done():
+                result.set_exception(e)
+            continue
+        _sent_count += 1
+        _send_latency_ms.observe((time.perf_counter() - enqueued_at) * 1000)
+        if chat_id in _typing_refresh:
+            _typing_refresh[chat_id].set()
+        if not result.done():
+            result.set_result(None)
+    del _send_queues[chat_id]
+
+async def _send_typing_loop(bot: telegram.Bot, chat_id: int, refresh: asyncio.Event) -> None:
+    """持续发送正在输入的动作，直到被取消；消息送达会清除客户端的输入状态，因此发送后由 refresh 立即补发"""
+    global _typing_action_count
+    deadline = time.monotonic() + _TYPING_MAX_SECONDS
+    logger.trace(f"开始发送 'typing' 动作给 Telegram chat_id: {chat_id}")
     try:
-        logger.trace(f"开始发送 'typing' 动作给 Telegram chat_id: {chat_id}")
-        for _ in range(0, 15):
-            await bot.send_chat_action(chat_id=chat_id, action='typing')
-            await asyncio.sleep(3.5)
-        logger.trace(f"停止发送 typing 动作给 Telegram chat_id: {chat_id}")
+        # 关闭时先从 _typing_tasks 中移除再取消，即使取消恰好被 wait_for 吞掉，循环也会在下一轮退出
+        while _typing_tasks.get(chat_id) is asyncio.current_task() and time.monotonic() < deadline:
+            refresh.clear()
+            try:
+                await bot.send_chat_action(chat_id=chat_id, action=telegram.constants.ChatAction.TYPING)
+                _typing_action_count += 1
+            except telegram.error.TelegramError as e:
+                logger.debug(f"发送 typing 动作失败: chat_id={chat_id}, error={e}")
+            try:
+                await asyncio.wait_for(refresh.wait(), timeout=_TYPING_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        if time.monotonic() >= deadline:
+            logger.warning(f"typing 动作已持续 {_TYPING_MAX_SECONDS}s，自动停止: chat_id={chat_id}")
     except asyncio.CancelledError:
-        logger.trace(f"中止发送 typing 动作给 Telegram chat_id: {chat_id}")
-        return        
+        logger.trace(f"停止发送 typing 动作给 Telegram chat_id: {chat_id}")
+    finally:
+        if _typing_tasks.get(chat_id) is asyncio.current_task():
+            del _typing_tasks[chat_id]
+            del _typing_refresh[chat_id]
 
-@bus.on(E.IO_MESSAGE_RECEIVED)
-async def start_sending_typing_loop(msg: IncomingMessage) -> None:
-    """开始发送正在输入动作的循环任务"""
-    if msg.channel_type != ChannelType.TELEGRAM_BOT_POLLING:
-        return
-    if msg.channel_context is None or not msg.metadata:
-        return
-    if "channel_chat_id" not in msg.metadata:
-        return
 
-    chat_id = msg.metadata["channel_chat_id"]
-    task = asyncio.create_task(_send_typing_loop(msg.channel_context.bot, chat_id))
-    _typing_tasks[chat_id] = task
+def _stop_typing(chat_id: int) -> None:
+    task = _typing_tasks.pop(chat_id, None)
+    _typing_refresh.pop(chat_id, None)
+    if task is not None:
+        task.cancel()
+
+
+def _cancel_typing_tasks() -> None:
+    for chat_id in list(_typing_tasks):
+        _stop_typing(chat_id)
+
 
-@bus.on(E.IO_SEND_MESSAGE)
-async def stop_sending_typing_loop(msg: OutgoingMessage) -> None:
-    """停止发送正在输入动作的循环任务"""
-    if msg.channel_type != ChannelType.TELEGRAM_BOT_POLLING:
+@bus.on(E.PRESENCE_TYPING, route=TELEGRAM_CHANNEL_TYPE)
+async def update_typing_presence(typing: bool, metadata: dict | None = None, **_) -> None:
+    """按 Amaya 的规划/待发送状态开关输入状态，每个会话至多一个循环任务"""
+    chat_id = (metadata or {}).get("channel_chat_id") or PRIMARY_TELEGRAM_USER_ID
+    if not typing:
+        _stop_typing(chat_id)
         return
-    if not msg.metadata or "channel_chat_id" not in msg.metadata:
+    if chat_id in _typing_tasks or _bot_instance is None:
         return
-
-    chat_id = msg.metadata["channel_chat_id"]
-    task = _typing_tasks.get(chat_id)
-    if task:
-        task.cancel()
-        try:
-            await task
-        except asyncio.CancelledError:
-            pass
-        del _typing_tasks[chat_id]
+    refresh = asyncio.Event()
+    _typing_refresh[chat_id] = refresh
+    _typing_tasks[chat_id] = asyncio.create_task(
+        _send_typing_loop(_bot_instance, chat_id, refresh),
+        name=f"telegram-typing:{chat_id}",
+    )
 
 
 @requires_auth
@@ -81,44 +216,102 @@ async def cmd_start(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE)
     logger.info(f"收到 /start 命令来自 Telegram ID: {update.effective_user.id}")
     await update.message.reply_text("Amaya bot online.")
 
-@requires_auth
-async def process_message(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    logger.info(f"Telegram 消息内容: {update.message.text}")
-
-    # 发送到事件总线
-    if update.message and update.message.text:
-        incoming_msg = IncomingMessage(
-            channel_type = ChannelType.TELEGRAM_BOT_POLLING,
-            content = update.message.text,
-            channel_context = context,
-            timestamp = update.message.date,
-            metadata = {"channel_chat_id": update.effective_chat.id},
-        )
-        bus.emit(E.IO_MESSAGE_RECEIVED, incoming_msg)
+async def _download_attachments(bot: telegram.Bot, message: telegram.Message) -> list[dict[str, str]]:
+    """把消息中的图片/文件下载到附件缓存，单个附件失败只记录日志"""
+    files: list[tuple[str, str | None, int | None]] = []  # (file_id, mime_type, file_size)
+    if message.photo:
+        photo = message.photo[-1]  # 尺寸最大的一张
+        files.append((photo.file_id, "image/jpeg", photo.file_size))
+    if message.document:
+        files.append((message.document.file_id, message.document.mime_type, message.document.file_size))
+
+    attachments: list[dict[str, str]] = []
+    for file_id, mime_type, file_size in files:
+        if file_size is not None and file_size > ATTACHMENT_MAX_FILE_MB * 1024 * 1024:
+            logger.warning(f"Telegram 附件超过大小上限，已忽略: file_size={file_size}")
+            continue
+        try:
+            tg_file = await bot.get_file(file_id)
+            # file_path 是包含 Bot Token 的下载地址，不要写入日志
+            attachments.append(await attachment_storage.download(tg_file.file_path, mime_type))
+        except Exception as e:
+            logger.warning(f"下载 Telegram 附件失败: file_id={file_id}, error={type(e).__name__}: {e}")
+    return attachments
 
 
-@bus.on(E.IO_SEND_MESSAGE)
-async def send_outgoing_message(msg: OutgoingMessage) -> None:
-    if msg.channel_type != ChannelType.TELEGRAM_BOT_POLLING:
+# ----------------- 入站接收队列 ----------------
+# Application 按顺序逐个处理更新，下载附件若在处理器中进行会阻塞后续所有更新。
+# 处理器只把消息放入会话的有界队列，由按需启动的接收协程依次下载附件并发布，同一会话内保持接收顺序。
+# 队列项: (telegram.Message, chat_id, context)
+_RECEIVE_QUEUE_SIZE = 100
+_receive_queues: dict[int, asyncio.Queue] = {}
+_receive_workers: set[asyncio.Task] = set()
+
+
+async def _publish_incoming(message: telegram.Message, chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
+    text = message.text or message.caption or ""
+    attachments = await _download_attachments(context.bot, message)
+    content = "\n".join(part for part in (attachment_storage.describe(attachments), text) if part)
+    if content == "" and (message.photo or message.document):
+        content = "[附件(下载失败)]"
+    if content == "":
         return
 
-    logger.info(f"发送消息: {msg.content}")
-    
-    # 使用元数据中的 chat_id 或默认使用 PRIMARY_TELEGRAM_USER_ID
-    chat_id = msg.metadata.get("channel_chat_id") if msg.metadata else None
-    if chat_id is None:
-        chat_id = PRIMARY_TELEGRAM_USER_ID
-    
-    bot = _bot_instance or msg.channel_context.bot
-    try:
-        await bot.send_message(chat_id=chat_id, text=msg.content)
-    except Exception as e:
-        logger.error(f"向 Telegram 用户 {chat_id} 发送消息失败: {e}, 即将重试", exc_info=e)
+    # 发送到事件总线；附件只传递缓存引用
+    incoming_msg = IncomingMessage(
+        channel_type = TELEGRAM_CHANNEL_TYPE,
+        content = content,
+        attachments = attachments or None,
+        channel_context = context,
+        timestamp = message.date,
+        metadata = {"channel_chat_id": chat_id},
+    )
+    # 同一会话的收发事件按顺序处理，队列满时在此等待
+    await bus.publish(E.IO_MESSAGE_RECEIVED, incoming_msg, key=f"conversation:{TELEGRAM_CHANNEL_TYPE.value}")
+
+
+async def _drain_receive_queue(chat_id: int, queue: asyncio.Queue) -> None:
+    # 队列取空即退出并移除；判断与移除之间没有 await，不会与 process_message 交错
+    while not queue.empty():
+        message, chat_id, context = queue.get_nowait()
         try:
-            await asyncio.sleep(5)
-            await bot.send_message(chat_id=chat_id, text=msg.content)
+            await _publish_incoming(message, chat_id, context)
         except Exception as e:
-            logger.error(f"[重试] 向 Telegram 用户 {chat_id} 发送消息失败: {e}", exc_info=e)
+            logger.error(f"处理 Telegram 消息失败: chat_id={chat_id}, error={e}", exc_info=e)
+    del _receive_queues[chat_id]
+
+
+@requires_auth
+async def process_message(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.message
+    if message is None:
+        return
+    logger.info(f"Telegram 消息内容: {message.text or message.caption or ''}")
+
+    chat_id = update.effective_chat.id
+    queue = _receive_queues.get(chat_id)
+    if queue is None:
+        queue = asyncio.Queue(maxsize=_RECEIVE_QUEUE_SIZE)
+        _receive_queues[chat_id] = queue
+        worker = asyncio.create_task(_drain_receive_queue(chat_id, queue), name=f"telegram-receive:{chat_id}")
+        _receive_workers.add(worker)
+        worker.add_done_callback(_receive_workers.discard)
+    # 队列满时等待，形成背压
+    await queue.put((message, chat_id, context))
+
+
+async def deliver_outgoing_message(content: str, metadata: dict | None = None) -> None:
+    """Polling 与 Webhook 渠道共用的发送入口；失败时抛出异常，由发件箱按退避重发"""
+    if _bot_instance is None:
+        raise RuntimeError("Telegram Bot 尚未启动")
+
+    # 使用元数据中的 chat_id 或默认使用 PRIMARY_TELEGRAM_USER_ID
+    chat_id = (metadata or {}).get("channel_chat_id") or PRIMARY_TELEGRAM_USER_ID
+    logger.info(f"发送消息: {content}")
+    # 经过出站队列，保证限速与会话内顺序；等待实际发送结果以便发件箱判断是否重发
+    result = asyncio.get_running_loop().create_future()
+    await _enqueue_send(_bot_instance, chat_id, content, result)
+    await result
 
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -136,22 +329,44 @@ def bot_error_callback(error: telegram.error.TelegramError) -> None:
         logger.error(f"Telegram Bot 发生预期外的错误: {error}", exc_info=error)
 
 
-async def main(shutdown_event: asyncio.Event = asyncio.Event()) -> None:
-    global _bot_instance
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+def build_application(updater: bool = True) -> Application:
+    """创建注册好命令与消息处理器的 Application；Webhook 模式不需要 Updater"""
+    builder = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN)
+    if not updater:
+        builder = builder.updater(None)
+    app = builder.build()
 
     app.add_handler(CommandHandler("start", cmd_start))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_message))
+    app.add_handler(MessageHandler((filters.TEXT | filters.PHOTO | filters.Document.ALL) & ~filters.COMMAND, process_message))
     app.add_error_handler(error_handler)
+    return app
+
+
+def set_bot_instance(bot: telegram.Bot | None) -> None:
+    global _bot_instance
+    _bot_instance = bot
+    if bot is None:
+        _cancel_typing_tasks()
+
 
-    #app.run_polling(
-    #    drop_pending_updates=True,
-    #    timeout=datetime.timedelta(seconds=30),  # 长轮询
-    #)
+class TelegramPollingChannel(Channel):
+    name = "telegram_polling"
+    channel_types = (ChannelType.TELEGRAM_BOT_POLLING,)
 
-    try:    
+    def __init__(self) -> None:
+        self._app: Application | None = None
+
+    def is_enabled(self) -> bool:
+        return ENABLE_TELEGRAM_BOT_POLLING
+
+    async def start(self) -> None:
+        #app.run_polling(
+        #    drop_pending_updates=True,
+        #    timeout=datetime.timedelta(seconds=30),  # 长轮询
+        #)
+        self._app = app = build_application()
         await app.initialize()
-        _bot_instance = app.bot
+        set_bot_instance(app.bot)
         await app.updater.start_polling(
             poll_interval=0.5,
             timeout=datetime.timedelta(seconds=15),
@@ -161,11 +376,24 @@ async def main(shutdown_event: asyncio.Event = asyncio.Event()) -> None:
         )
         await app.start()
         logger.info("Telegram Bot Polling 已启动")
-        
-        await shutdown_event.wait()
-    finally:
-        await app.updater.stop()
-        await app.stop()
+
+    async def stop(self) -> None:
+        app, self._app = self._app, None
+        if app is None:
+            return
+        if app.updater.running:
+            await app.updater.stop()
+        if app.running:
+            await app.stop()
         await app.shutdown()
-        _bot_instance = None
+        set_bot_instance(None)
         logger.info("Telegram Bot Polling 已关闭")
+
+    async def send(self, channel_type: str, content: str, metadata: dict | None) -> None:
+        await deliver_outgoing_message(content, metadata)
+
+    def get_status(self) -> dict[str, object]:
+        return get_status()
+
+
+register_channel(TelegramPollingChannel())
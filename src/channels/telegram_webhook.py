@@ -0,0 +1,137 @@
+"""
+Telegram Bot Webhook 接入
+
+与 Polling 二选一：Telegram 主动把更新 POST 到管理后台已有的 FastAPI 服务上，省去长轮询的空转请求和轮询间隔带来的延迟。
+消息的收发处理器与 Polling 模式共用(见 channels.telegram_polling)，这里只负责：
+1. 启动时 setWebhook 注册回调地址和 secret_token；
+2. 校验请求头 X-Telegram-Bot-Api-Secret-Token 后，把更新放入 Application.update_queue，立即返回 200。
+
+停机时不删除 Webhook，Telegram 会在服务恢复前暂存并重试投递期间的更新(与 Polling 模式 drop_pending_updates=False 一致)。
+
+参考资料:
+https://core.telegram.org/bots/api#setwebhook
+https://docs.python-telegram-bot.org/en/stable/examples.customwebhookbot.html
+"""
+
+import hmac
+
+import telegram
+from fastapi import FastAPI, HTTPException, Request
+from telegram.ext import Application
+
+from codec import JSONDecodeError, loads
+from config.settings import *
+from logger import logger
+from datamodel import ChannelType
+from channels.base import Channel, register_channel
+from channels.telegram_polling import build_application, deliver_outgoing_message, set_bot_instance
+from channels.telegram_polling import get_status as get_telegram_status
+
+__all__ = ["get_status", "register_fastapi_routes"]
+
+_SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+_app: Application | None = None
+_routes_registered = False
+__received_count = 0
+__rejected_count = 0
+
+
+def get_status() -> dict[str, object]:
+    return {
+        "path": TELEGRAM_WEBHOOK_PATH,
+        "running": _app is not None,
+        "received_count": __received_count,
+        "rejected_count": __rejected_count,
+    }
+
+
+def _is_authorized(request: Request) -> bool:
+    token = request.headers.get(_SECRET_HEADER, "")
+    return hmac.compare_digest(token.encode(), TELEGRAM_WEBHOOK_SECRET.encode())
+
+
+def register_fastapi_routes(app: FastAPI) -> None:
+    global _routes_registered
+    if _routes_registered:
+        return
+
+    @app.post(TELEGRAM_WEBHOOK_PATH)
+    async def telegram_webhook(request: Request):
+        global __received_count, __rejected_count
+        if not _is_authorized(request):
+            __rejected_count += 1
+            logger.warning("Telegram Webhook 鉴权失败")
+            raise HTTPException(status_code=401, detail="unauthorized")
+        if _app is None:
+            # 返回非 2xx，Telegram 会稍后重试投递
+            raise HTTPException(status_code=503, detail="telegram bot not ready")
+        # 无法解析的更新返回 400：Telegram 只重试 5xx，格式错误的请求重试也没有意义
+        try:
+            payload = loads(await request.body())
+        except JSONDecodeError:
+            raise HTTPException(status_code=400, detail="invalid json")
+        if not isinstance(payload, dict):
+            raise HTTPException(status_code=400, detail="update must be a json object")
+        try:
+            update = telegram.Update.de_json(payload, _app.bot)
+        except Exception as e:
+            logger.warning(f"Telegram Webhook 更新解析失败: {type(e).__name__}: {e}")
+            raise HTTPException(status_code=400, detail="invalid update")
+
+        await _app.update_queue.put(update)
+        __received_count += 1
+        return {"ok": True}
+
+    _routes_registered = True
+
+
+class TelegramWebhookChannel(Channel):
+    name = "telegram_webhook"
+    channel_types = (ChannelType.TELEGRAM_BOT_WEBHOOK,)
+
+    def __init__(self) -> None:
+        self._app: Application | None = None
+
+    def is_enabled(self) -> bool:
+        return ENABLE_TELEGRAM_BOT_WEBHOOK
+
+    async def start(self) -> None:
+        global _app
+        self._app = app = build_application(updater=False)
+        url = TELEGRAM_WEBHOOK_URL.rstrip("/") + TELEGRAM_WEBHOOK_PATH
+        await app.initialize()
+        set_bot_instance(app.bot)
+        await app.bot.set_webhook(
+            url=url,
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=[telegram.constants.UpdateType.MESSAGE],
+        )
+        await app.start()
+        _app = app
+        logger.info(f"Telegram Bot Webhook 已启动: url={url}")
+
+    async def stop(self) -> None:
+        global _app
+        _app = None
+        app, self._app = self._app, None
+        if app is None:
+            return
+        if app.running:
+            await app.stop()
+        await app.shutdown()
+        set_bot_instance(None)
+        logger.info("Telegram Bot Webhook 已关闭")
+
+    async def send(self, channel_type: str, content: str, metadata: dict | None) -> None:
+        await deliver_outgoing_message(content, metadata)
+
+    def register_routes(self, app: FastAPI) -> None:
+        register_fastapi_routes(app)
+
+    def get_status(self) -> dict[str, object]:
+        # 发送队列与限速由两种接入方式共用，统计在 channels.telegram_polling 中
+        return {**get_telegram_status(), "webhook": get_status()}
+
+
+register_channel(TelegramWebhookChannel())
@@ -0,0 +1,66 @@
+"""JSON 编解码
+
+WebSocket 帧、消息 metadata、延时事件 payload 与 Webhook 记录统一经由这里编解码。
+orjson 已列入 pyproject 依赖，可导入时使用 orjson，否则(如未同步依赖的环境)回退到标准库 json 并记录一条警告；
+两者的输出都是不转义非 ASCII 字符的紧凑 JSON。当前使用的实现见 BACKEND。
+
+与标准库保持一致的约定:
+- 非字符串的字典键按标准库的方式转为字符串；
+- 指定 default 时，datetime 与 dataclass 同样交给 default 处理，不使用 orjson 的原生序列化；
+- orjson 无法处理的对象(如超过 64 位的整数)自动回退到标准库。
+"""
+
+import json
+from typing import Any, Callable
+
+from logger import logger
+
+try:
+    import orjson
+except ImportError:  # 依赖未同步时仍可运行，只是慢一些
+    orjson = None
+    logger.warning("未安装 orjson，JSON 编解码回退到标准库 json，请执行 uv sync 安装依赖")
+
+__all__ = ["BACKEND", "JSONDecodeError", "dumps", "dumps_bytes", "loads"]
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，调用方只需捕获这一个
+JSONDecodeError = json.JSONDecodeError
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+_ORJSON_DEFAULT_OPTIONS = (
+    _ORJSON_OPTIONS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    if orjson is not None else 0
+)
+
+
+def dumps_bytes(obj: Any, default: Callable[[Any], Any] | None = None) -> bytes:
+    """序列化为 UTF-8 编码的 JSON"""
+    if orjson is not None:
+        try:
+            if default is None:
+                return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+            return orjson.dumps(obj, default=default, option=_ORJSON_DEFAULT_OPTIONS)
+        except TypeError:
+            pass  # orjson.JSONEncodeError 是 TypeError 的子类；交给标准库处理或抛出同样的错误
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+
+
+def dumps(obj: Any, default: Callable[[Any], Any] | None = None) -> str:
+    """序列化为 JSON 字符串"""
+    if orjson is not None:
+        return dumps_bytes(obj, default).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+
+
+def loads(data: str | bytes | bytearray) -> Any:
+    """解析 JSON，失败时抛出 JSONDecodeError"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            data = data.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise JSONDecodeError(f"invalid UTF-8: {e}", "", 0) from e
+    return json.loads(data)
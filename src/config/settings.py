@@ -4,15 +4,31 @@ from logger import logger
 load_dotenv()
 
 __all__ = [
-    "ENABLE_TELEGRAM_BOT_POLLING",
+    "ENABLE_TELEGRAM_BOT_POLLING", "ENABLE_TELEGRAM_BOT_WEBHOOK",
+    "TELEGRAM_WEBHOOK_URL", "TELEGRAM_WEBHOOK_PATH", "TELEGRAM_WEBHOOK_SECRET",
     "TELEGRAM_BOT_TOKEN", "PRIMARY_TELEGRAM_USER_ID",
+    "TELEGRAM_SEND_GLOBAL_RATE", "TELEGRAM_SEND_CHAT_RATE", "TELEGRAM_SEND_CHAT_BURST", "TELEGRAM_SEND_QUEUE_SIZE",
     "ENABLE_QQ_NAPCAT", "QQ_NAPCAT_WS_PATH", "QQ_NAPCAT_WS_TOKEN",
     "PRIMARY_QQ_USER_ID", "QQ_NAPCAT_ENABLE_GROUP", "QQ_NAPCAT_SEND_TIMEOUT_SECONDS",
+    "QQ_NAPCAT_EVENT_WORKERS", "QQ_NAPCAT_EVENT_QUEUE_SIZE",
+    "ENABLE_LOOPBACK_CHANNEL", "LOOPBACK_MAX_MESSAGES", "EXTRA_CHANNEL_MODULES",
     "LLM_PROVIDER", "OPENAI_PRIMARY_API_KEY", "OPENAI_PRIMARY_BASE_URL", "GEMINI_API_KEY", "GEMINI_BASE_URL",
     "LLM_MAIN_MODEL", "LLM_FAST_MODEL",
     "USER_NAME", "USER_TIMEZONE", "USER_EMAIL", "PRIMARY_CONTACT_METHOD",
     "ADMIN_HTTP_HOST", "ADMIN_HTTP_PORT", "ADMIN_AUTH_TOKEN",
     "WEBHOOK_SHARED_SECRET", "ADMIN_LOG_FILE",
+    "MEMORY_CONTEXT_TOP_K", "MEMORY_CONTEXT_MAX_CHARS", "MEMORY_INDEX_DIM",
+    "MEMORY_DECAY_HALF_LIFE_DAYS", "MEMORY_DECAY_INTERVAL_MINUTES", "MEMORY_ARCHIVE_WEIGHT_THRESHOLD",
+    "MESSAGE_ARCHIVE_DB_PATH", "MESSAGE_ARCHIVE_AFTER_DAYS", "MESSAGE_ARCHIVE_INTERVAL_MINUTES",
+    "BACKUP_DIR", "BACKUP_INTERVAL_MINUTES", "BACKUP_KEEP", "BACKUP_PAGES_PER_STEP", "BACKUP_MAX_RESTARTS",
+    "REMINDER_ESCALATION_MINUTES", "REMINDER_REPEAT_MINUTES", "REMINDER_MAX_REPEATS",
+    "REMINDER_DRAFT_LEAD_MINUTES", "REMINDER_DRAFT_TIMEOUT_SECONDS", "REMINDER_DRAFT_CONTEXT_MESSAGES",
+    "REMINDER_CATCHUP_AFTER_MINUTES", "REMINDER_STALE_MINUTES",
+    "BUS_SLOW_HANDLER_MS", "BUS_PARTITION_QUEUE_SIZE",
+    "SCHEDULER_BATCH_SIZE", "SCHEDULER_LEASE_SECONDS", "SCHEDULER_RETRY_BASE_SECONDS", "SCHEDULER_MAX_ATTEMPTS",
+    "OUTBOX_BATCH_SIZE", "OUTBOX_LEASE_SECONDS", "OUTBOX_RETRY_BASE_SECONDS", "OUTBOX_RETRY_MAX_SECONDS",
+    "OUTBOX_MAX_ATTEMPTS", "OUTBOX_RETAIN_DELIVERED_HOURS",
+    "ATTACHMENT_CACHE_DIR", "ATTACHMENT_CACHE_MAX_MB", "ATTACHMENT_MAX_FILE_MB", "ATTACHMENT_DOWNLOAD_TIMEOUT_SECONDS",
 ]
 
 
@@ -23,6 +39,28 @@ def _parse_bool(name: str, default: bool = False) -> bool:
     return raw.strip().lower() in ("1", "true", "yes", "on", "y")
 
 
+def _parse_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        logger.warning(f"{name} 非法, 已回退到 {default}")
+        return default
+
+
+def _parse_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        logger.warning(f"{name} 非法, 已回退到 {default}")
+        return default
+
+
 # 动态加载的环境变量
 # 用户个人信息
 USER_NAME = os.getenv("USER_NAME")
@@ -32,25 +70,44 @@ if USER_NAME is None:
     logger.warning("USER_NAME 未设置，会严重影响效果")
     USER_NAME = "用户"
 
-# 主联系方式: "telegram" 或 "napcatqq"（兼容 "qq"）
+# 主联系方式: "telegram"、"napcatqq"（兼容 "qq"）或 "loopback"（本地压测）
 PRIMARY_CONTACT_METHOD = os.getenv("PRIMARY_CONTACT_METHOD", "telegram").strip().lower()
 if PRIMARY_CONTACT_METHOD == "qq":
     PRIMARY_CONTACT_METHOD = "napcatqq"
-if PRIMARY_CONTACT_METHOD not in ("telegram", "napcatqq"):
-    logger.critical(f"PRIMARY_CONTACT_METHOD 非法: {PRIMARY_CONTACT_METHOD}, 仅支持 telegram 或 napcatqq")
+if PRIMARY_CONTACT_METHOD not in ("telegram", "napcatqq", "loopback"):
+    logger.critical(f"PRIMARY_CONTACT_METHOD 非法: {PRIMARY_CONTACT_METHOD}, 仅支持 telegram、napcatqq 或 loopback")
     exit(0)
 
 # Telegram Bot
 ENABLE_TELEGRAM_BOT_POLLING = _parse_bool("ENABLE_TELEGRAM_BOT_POLLING", True)
+# Webhook 模式：由 Telegram 主动推送更新到 Admin HTTP 服务上的 TELEGRAM_WEBHOOK_PATH，与 Polling 互斥
+ENABLE_TELEGRAM_BOT_WEBHOOK = _parse_bool("ENABLE_TELEGRAM_BOT_WEBHOOK", False)
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")  # 对外可访问的 HTTPS 根地址，如 https://example.com
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "/channels/telegram/webhook")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")  # 校验 X-Telegram-Bot-Api-Secret-Token
+if ENABLE_TELEGRAM_BOT_WEBHOOK:
+    if ENABLE_TELEGRAM_BOT_POLLING:
+        logger.critical("Telegram Bot Polling 与 Webhook 不能同时启用")
+        exit(0)
+    if TELEGRAM_WEBHOOK_URL == "" or TELEGRAM_WEBHOOK_SECRET == "":
+        logger.critical("已启用 Telegram Bot Webhook, 但 TELEGRAM_WEBHOOK_URL 或 TELEGRAM_WEBHOOK_SECRET 未设置")
+        exit(0)
+
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
-if ENABLE_TELEGRAM_BOT_POLLING and TELEGRAM_BOT_TOKEN == "":
-    logger.critical("已启用 Telegram Bot Polling, 但 TELEGRAM_BOT_TOKEN 未设置")
+if (ENABLE_TELEGRAM_BOT_POLLING or ENABLE_TELEGRAM_BOT_WEBHOOK) and TELEGRAM_BOT_TOKEN == "":
+    logger.critical("已启用 Telegram Bot, 但 TELEGRAM_BOT_TOKEN 未设置")
     exit(0)
 
 PRIMARY_TELEGRAM_USER_ID = int(os.getenv("PRIMARY_TELEGRAM_USER_ID", "0"))
-if ENABLE_TELEGRAM_BOT_POLLING and PRIMARY_TELEGRAM_USER_ID == 0:
+if (ENABLE_TELEGRAM_BOT_POLLING or ENABLE_TELEGRAM_BOT_WEBHOOK) and PRIMARY_TELEGRAM_USER_ID == 0:
     logger.warning("未设置 PRIMARY_TELEGRAM_USER_ID")
 
+# 出站发送限速(令牌桶)：全局每秒条数、单个会话每秒条数与突发容量，以及单个会话的待发送队列容量
+TELEGRAM_SEND_GLOBAL_RATE = max(0.1, _parse_float("TELEGRAM_SEND_GLOBAL_RATE", 25.0))
+TELEGRAM_SEND_CHAT_RATE = max(0.01, _parse_float("TELEGRAM_SEND_CHAT_RATE", 1.0))
+TELEGRAM_SEND_CHAT_BURST = max(1, _parse_int("TELEGRAM_SEND_CHAT_BURST", 3))
+TELEGRAM_SEND_QUEUE_SIZE = max(1, _parse_int("TELEGRAM_SEND_QUEUE_SIZE", 100))
+
 
 # NapCatQQ
 ENABLE_QQ_NAPCAT = _parse_bool("ENABLE_QQ_NAPCAT", False)
@@ -66,6 +123,20 @@ try:
 except ValueError:
     QQ_NAPCAT_SEND_TIMEOUT_SECONDS = 10.0
     logger.warning("QQ_NAPCAT_SEND_TIMEOUT_SECONDS 非法, 已回退到 10 秒")
+# 接收循环只解析帧并就地完成 API 响应(echo)，消息等事件交给固定数量的工作协程处理
+QQ_NAPCAT_EVENT_WORKERS = max(1, _parse_int("QQ_NAPCAT_EVENT_WORKERS", 4))
+QQ_NAPCAT_EVENT_QUEUE_SIZE = max(1, _parse_int("QQ_NAPCAT_EVENT_QUEUE_SIZE", 256))
+
+# 本地回环渠道：向事件总线注入脚本化的用户消息并记录回复送达时间，用于测量端到端延迟与吞吐；
+# 单轮最多注入的消息数。启用时应将 PRIMARY_CONTACT_METHOD 设为 loopback，并使用单独的数据目录
+ENABLE_LOOPBACK_CHANNEL = _parse_bool("ENABLE_LOOPBACK_CHANNEL", False)
+if PRIMARY_CONTACT_METHOD == "loopback" and not ENABLE_LOOPBACK_CHANNEL:
+    logger.critical("主联系方式为 loopback, 但 ENABLE_LOOPBACK_CHANNEL 未启用")
+    exit(0)
+LOOPBACK_MAX_MESSAGES = max(1, _parse_int("LOOPBACK_MAX_MESSAGES", 100000))
+
+# 额外加载的渠道模块(逗号分隔的模块路径)，模块导入时通过 channels.base.register_channel 注册
+EXTRA_CHANNEL_MODULES = [name.strip() for name in os.getenv("EXTRA_CHANNEL_MODULES", "").split(",") if name.strip()]
 
 
 # LLM 设置
@@ -98,3 +169,78 @@ ADMIN_AUTH_TOKEN = os.getenv("ADMIN_AUTH_TOKEN", "")
 
 WEBHOOK_SHARED_SECRET = os.getenv("WEBHOOK_SHARED_SECRET", "")
 ADMIN_LOG_FILE = os.getenv("ADMIN_LOG_FILE", "logs/amaya.log")
+
+
+# 记忆系统
+# 每轮注入 Prompt 的记忆点上限（工作型记忆不计入，始终注入）与字符预算
+MEMORY_CONTEXT_TOP_K = _parse_int("MEMORY_CONTEXT_TOP_K", 30)
+MEMORY_CONTEXT_MAX_CHARS = _parse_int("MEMORY_CONTEXT_MAX_CHARS", 4000)
+# 记忆相似度索引的向量维度（修改后会在启动时自动重建索引）；维度越小哈希碰撞越多、相似度区分度越差
+MEMORY_INDEX_DIM = max(16, _parse_int("MEMORY_INDEX_DIM", 512))
+# 事实型/情感型记忆的衰减半衰期、衰减任务执行间隔，以及归档阈值（权重低于该值的记忆点会被归档）
+MEMORY_DECAY_HALF_LIFE_DAYS = _parse_float("MEMORY_DECAY_HALF_LIFE_DAYS", 30.0)
+MEMORY_DECAY_INTERVAL_MINUTES = _parse_int("MEMORY_DECAY_INTERVAL_MINUTES", 360)
+MEMORY_ARCHIVE_WEIGHT_THRESHOLD = _parse_float("MEMORY_ARCHIVE_WEIGHT_THRESHOLD", 0.05)
+
+
+# 消息冷热分离：早于 MESSAGE_ARCHIVE_AFTER_DAYS 天的消息会被移动到归档库（设为 0 表示不归档）
+MESSAGE_ARCHIVE_DB_PATH = os.getenv("MESSAGE_ARCHIVE_DB_PATH", "data/amaya_archive.db")
+MESSAGE_ARCHIVE_AFTER_DAYS = _parse_int("MESSAGE_ARCHIVE_AFTER_DAYS", 30)
+MESSAGE_ARCHIVE_INTERVAL_MINUTES = _parse_int("MESSAGE_ARCHIVE_INTERVAL_MINUTES", 60)
+
+
+# 数据库在线备份：备份目录、间隔（分钟，0 表示禁用）、保留的快照数量，以及每步复制的页数
+BACKUP_DIR = os.getenv("BACKUP_DIR", "data/backups")
+BACKUP_INTERVAL_MINUTES = _parse_int("BACKUP_INTERVAL_MINUTES", 1440)
+BACKUP_KEEP = _parse_int("BACKUP_KEEP", 7)
+BACKUP_PAGES_PER_STEP = max(1, _parse_int("BACKUP_PAGES_PER_STEP", 64))
+# 分步备份因源库被修改而重新开始超过该次数后，改为一步复制完整快照(WAL 模式下不阻塞写入)
+BACKUP_MAX_RESTARTS = max(0, _parse_int("BACKUP_MAX_RESTARTS", 5))
+
+
+# 提醒状态机：发送后无响应多久升级（分钟）、升级后重复提醒的间隔（分钟）与 High 优先级的最大重复次数
+REMINDER_ESCALATION_MINUTES = max(1, _parse_int("REMINDER_ESCALATION_MINUTES", 5))
+REMINDER_REPEAT_MINUTES = max(1, _parse_int("REMINDER_REPEAT_MINUTES", 3))
+REMINDER_MAX_REPEATS = max(0, _parse_int("REMINDER_MAX_REPEATS", 3))
+
+# 提醒文案预生成：提前多少分钟用快速模型起草、单次起草超时（秒）与参考的最近消息条数；
+# 到期时直接发送草稿，不再等待主模型；没有可用草稿时发送模板化消息
+REMINDER_DRAFT_LEAD_MINUTES = max(1, _parse_int("REMINDER_DRAFT_LEAD_MINUTES", 3))
+REMINDER_DRAFT_TIMEOUT_SECONDS = _parse_float("REMINDER_DRAFT_TIMEOUT_SECONDS", 30.0)
+REMINDER_DRAFT_CONTEXT_MESSAGES = max(0, _parse_int("REMINDER_DRAFT_CONTEXT_MESSAGES", 10))
+
+# 错过提醒的补发：触发时已晚于到期时间多少分钟视为错过（例如停机期间到期），错过的提醒合并成一条世界消息统一补发；
+# 晚于 REMINDER_STALE_MINUTES 的提醒已无提醒意义，直接置为 ignored，只在补发消息中简要列出
+REMINDER_CATCHUP_AFTER_MINUTES = max(1, _parse_int("REMINDER_CATCHUP_AFTER_MINUTES", 2))
+REMINDER_STALE_MINUTES = max(REMINDER_CATCHUP_AFTER_MINUTES, _parse_int("REMINDER_STALE_MINUTES", 720))
+
+
+# 事件总线：单次处理耗时超过该值（毫秒）的处理器记入慢处理日志
+BUS_SLOW_HANDLER_MS = _parse_float("BUS_SLOW_HANDLER_MS", 500.0)
+# 有序分区投递(bus.publish)：每个分区键的队列容量，队列满时发布方等待
+BUS_PARTITION_QUEUE_SIZE = max(1, _parse_int("BUS_PARTITION_QUEUE_SIZE", 100))
+
+
+# 延时事件调度器：每批认领的事件数、认领租约（秒，超时未确认的事件会被重新投递）、
+# 失败重试的退避基数（秒，按 2 的幂次增长）与默认最大尝试次数
+SCHEDULER_BATCH_SIZE = max(1, _parse_int("SCHEDULER_BATCH_SIZE", 50))
+SCHEDULER_LEASE_SECONDS = max(1, _parse_int("SCHEDULER_LEASE_SECONDS", 300))
+SCHEDULER_RETRY_BASE_SECONDS = _parse_float("SCHEDULER_RETRY_BASE_SECONDS", 5.0)
+SCHEDULER_MAX_ATTEMPTS = max(1, _parse_int("SCHEDULER_MAX_ATTEMPTS", 5))
+
+
+# 出站发件箱：消息先落库再发送，失败按指数退避重发(基数与上限，秒)，超过最大尝试次数进入死信；
+# 发送中的消息租约到期(如进程崩溃)后重新发送；已送达的记录保留若干小时后清理
+OUTBOX_BATCH_SIZE = max(1, _parse_int("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_LEASE_SECONDS = max(1, _parse_int("OUTBOX_LEASE_SECONDS", 120))
+OUTBOX_RETRY_BASE_SECONDS = _parse_float("OUTBOX_RETRY_BASE_SECONDS", 2.0)
+OUTBOX_RETRY_MAX_SECONDS = _parse_float("OUTBOX_RETRY_MAX_SECONDS", 600.0)
+OUTBOX_MAX_ATTEMPTS = max(1, _parse_int("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETAIN_DELIVERED_HOURS = max(0, _parse_int("OUTBOX_RETAIN_DELIVERED_HOURS", 24))
+
+# 附件缓存：收到的图片/文件按内容哈希保存在缓存目录，总大小超过上限(MB)时淘汰最久未使用的文件；
+# 单个附件的大小上限(MB)与下载超时(秒)
+ATTACHMENT_CACHE_DIR = os.getenv("ATTACHMENT_CACHE_DIR", "data/attachments")
+ATTACHMENT_CACHE_MAX_MB = max(1, _parse_int("ATTACHMENT_CACHE_MAX_MB", 1024))
+ATTACHMENT_MAX_FILE_MB = max(1, _parse_int("ATTACHMENT_MAX_FILE_MB", 20))
+ATTACHMENT_DOWNLOAD_TIMEOUT_SECONDS = _parse_float("ATTACHMENT_DOWNLOAD_TIMEOUT_SECONDS", 60.0)
@@ -7,6 +7,8 @@ Amaya 处理新消息的方式是异步的，因此能做到类似真人的效
 3. 发送回复: Amaya 会根据规划的回复内容和分段控制符, 逐段发送消息给用户。每段消息发送后, Amaya 会等待指定的时间间隔（如果有的话）再发送下一段消息。
 4. 重新规划: 如果在 Amaya 回复的过程中, 又收到了新的消息, Amaya 会取消当前的规划任务，并重新开始规划，以确保回复内容能够及时响应最新的消息。
 
+从开始规划到待发送的分段全部发出(或规划结果为空)期间，Amaya 通过 PRESENCE_TYPING 事件让渠道显示“正在输入”，重新规划不会打断该状态。
+
 """
 
 import asyncio
@@ -20,7 +22,9 @@ from datamodel import *
 from events import bus, E
 from llm.base import LLMClient, LLMContextItem
 from metrics import runtime_metrics
+from core.memory_recall import MemoryRecallStats, render_memory_context, select_memory_points
 from storage.work_memory import *
+import storage.memory_index as memory_index
 import storage.message as message_storage
 import storage.reminder as reminder_storage
 from utils import *
@@ -29,6 +33,7 @@ __all__ = ["Amaya", "configure_amaya", "require_amaya"]
 
 
 _SEGMENT_MARKER_PATTERN = re.compile(r"^-#(\d+)#-$")
+_MEMORY_QUERY_MESSAGES = 3  # 用于记忆检索的最近用户/世界消息条数
 
 class Amaya:
     def __init__(self, smart_llm_client: LLMClient, fast_llm_client: LLMClient | None = None, channel: tuple[ChannelType, dict | None] = None) -> None:
@@ -44,7 +49,10 @@ class Amaya:
         self.get_new_msg_event = asyncio.Event()
         self.unsend_messages: list[tuple[int, str]] = []
         self.unsend_messages_buffer: list[tuple[int, str]] = []  # 类似人脑的“短期记忆”，是Amaya的思考缓存
+        self.unsend_metadata: dict | None = self.primary_channel_metadata  # 随待发送分段一起发出的 metadata
         self.think_task: asyncio.Task[None] | None = None
+        self.typing = False  # 已通知渠道的“正在输入”状态
+        self.last_memory_recall = MemoryRecallStats()
 
     def get_status(self) -> dict[str, object]:
         return {
@@ -52,6 +60,10 @@ class Amaya:
             "unsent_queue": len(self.unsend_messages),
             "buffered_segments": len(self.unsend_messages_buffer),
             "new_message_pending": self.get_new_msg_event.is_set(),
+            "typing": self.typing,
+            "memory_points_considered": self.last_memory_recall.considered,
+            "memory_points_injected": self.last_memory_recall.injected,
+            "memory_context_chars": self.last_memory_recall.chars,
         }
 
     def notify_new_message(self) -> None:
@@ -88,25 +100,43 @@ class Amaya:
                     delay_seconds, segment_text = self.unsend_messages[0]
                     if delay_seconds <= 0:
                         self.unsend_messages.pop(0)
+                        await self._update_typing()  # 最后一段发出前先结束输入状态，避免送达后又补发 typing
                         #logger.info(f"Amaya 正在发送计划中的消息: `{segment_text}`")
-                        bus.emit(
+                        # 有序投递：第 N 段的保存与发送完成后才处理第 N+1 段
+                        await bus.publish(
                             E.IO_SEND_MESSAGE,
                             OutgoingMessage(
                                 channel_type=self.primary_channel_type,
                                 content=segment_text,
                                 attachments=None,
                                 channel_context=None,
-                                metadata=self.primary_channel_metadata,
+                                metadata=self.unsend_metadata,
                             ),
+                            key=f"conversation:{self.primary_channel_type.value}",
                         )
                     else:
                         self.unsend_messages[0] = (delay_seconds - 1, segment_text)
 
+                await self._update_typing()
                 await asyncio.sleep(1)
         except asyncio.CancelledError:
             logger.info("Amaya 主循环已停止")
             return
 
+    async def _update_typing(self) -> None:
+        """规划中或仍有待发送分段时处于“正在输入”状态；只在状态变化时通知渠道，与发送走同一分区以保证先后顺序"""
+        typing = (self.think_task is not None and not self.think_task.done()) or bool(self.unsend_messages)
+        if typing == self.typing:
+            return
+        self.typing = typing
+        await bus.publish(
+            E.PRESENCE_TYPING,
+            channel_type=self.primary_channel_type,
+            metadata=self.primary_channel_metadata,
+            typing=typing,
+            key=f"conversation:{self.primary_channel_type.value}",
+        )
+
     async def _process_msg(
         self,
         append_inst: str | None = None,
@@ -126,18 +156,31 @@ class Amaya:
             for r in pending_reminders:
                 optional_reminder_str += (
                     f"- [{r.reminder_id}] {r.title} "
-                    f"(at {utc_min_str_to_user_local_min(r.remind_at_min_utc, USER_TIMEZONE)})\n"
+                    f"(at {utc_epoch_min_to_user_local_min(r.remind_at_min_utc, USER_TIMEZONE)})\n"
                 )
 
-        # 记忆系统
-        memory = ""
+        # 最近消息
+        history = await message_storage.get_recent_messages(limit=30)
+
+        # 记忆系统：仅注入与最近对话相关的记忆点
+        query_texts = [m["content"] for m in history if m["role"] in ("user", "world")][:_MEMORY_QUERY_MESSAGES]
+        if append_world_context:
+            query_texts.append(append_world_context)
         memory_groups = await list_memory_groups()
-        for group in memory_groups:
-            memory += f"Memory group: {group['title']}{{\n"
-            points = await list_memory_points_by_group_id(group["memory_group_id"])
-            for point in points:
-                memory += f"- [{point['anchor']}]->{point['content']}\n"
-            memory += "}\n\n-----\n"
+        similarities = dict(memory_index.search("\n".join(query_texts), k=MEMORY_CONTEXT_TOP_K * 4))
+        selected_points, recall_stats = select_memory_points(
+            await list_all_memory_points(),
+            query_texts,
+            top_k=MEMORY_CONTEXT_TOP_K,
+            max_chars=MEMORY_CONTEXT_MAX_CHARS,
+            similarities=similarities,
+        )
+        self.last_memory_recall = recall_stats
+        logger.debug(
+            f"记忆检索: 候选 {recall_stats.considered} 条, 注入 {recall_stats.injected} 条"
+            f"(工作型 {recall_stats.work_injected} 条), 共 {recall_stats.chars} 字符"
+        )
+        memory = render_memory_context(selected_points, [g["title"] for g in memory_groups])
 
         llm_context = [
             {
@@ -146,8 +189,6 @@ class Amaya:
             }
         ]
 
-        # 最近消息
-        history = await message_storage.get_recent_messages(limit=30)
         llm_context += [
             {
                 "role": m["role"],
@@ -190,9 +231,24 @@ class Amaya:
         segments = self._split_segmented_response(res)
         logger.info(f"Amaya 完成回复规划，共 {len(segments)} 段回复")
         self.unsend_messages = segments
+        self.unsend_metadata = self._reply_metadata(history)
         self.unsend_messages_buffer = segments.copy()  # 同步更新思考缓存
 
 
+    def _reply_metadata(self, history: list[dict]) -> dict | None:
+        """回复的 metadata；回环压测时带上本次规划读到的最新一条注入消息的序号，用于把回复与注入的消息对应起来"""
+        if self.primary_channel_type != ChannelType.LOOPBACK:
+            return self.primary_channel_metadata  # 其他渠道不访问历史消息的 metadata，避免逐行解析
+        for m in history:
+            metadata = m["metadata"]
+            if m["role"] == "user" and metadata and "loopback_seq" in metadata:
+                return {
+                    **(self.primary_channel_metadata or {}),
+                    "loopback_run_id": metadata.get("loopback_run_id"),
+                    "loopback_seq": metadata["loopback_seq"],
+                }
+        return self.primary_channel_metadata
+
     def _split_segmented_response(self, raw: str) -> list[tuple[int, str]]:
         segments: list[tuple[int, str]] = []
         pending_delay_seconds = 0
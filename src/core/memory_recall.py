@@ -0,0 +1,146 @@
+"""记忆检索模块
+
+每轮规划前，从全部记忆点中挑选与最近对话最相关的一部分注入 [Memory Context]，
+而不是把整个记忆库塞进 Prompt。
+
+打分由三部分组成：
+1. 相关度: 最近用户消息与记忆点(锚点 + 内容)之间的词元重叠程度，中文按相邻二字切分，英文/数字按单词切分；
+   若提供了相似度索引的检索结果(见 storage.memory_index)，取两者中的较大值；
+2. 记忆强度: 记忆点的 weight；
+3. 新近度: 按记忆点最后更新时间指数衰减。
+
+工作型记忆(work)相当于外置备忘录，始终注入，不参与排序。
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+__all__ = ["MemoryRecallStats", "tokenize", "select_memory_points", "render_memory_context"]
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+|[㐀-鿿]+")
+
+# 各项得分的权重
+_RELEVANCE_WEIGHT = 0.6
+_STRENGTH_WEIGHT = 0.25
+_RECENCY_WEIGHT = 0.15
+_RECENCY_HALF_LIFE_DAYS = 30.0
+
+
+@dataclass
+class MemoryRecallStats:
+    considered: int = 0  # 参与检索的记忆点总数
+    injected: int = 0  # 最终注入的记忆点数量（含工作型记忆）
+    work_injected: int = 0
+    chars: int = 0  # 记忆块字符数
+
+
+def tokenize(text: str) -> set[str]:
+    """将文本切分为词元集合: 英文/数字取整词，中文取相邻二字（单字则取自身）"""
+    tokens: set[str] = set()
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if word[0].isascii():
+            tokens.add(word)
+        elif len(word) == 1:
+            tokens.add(word)
+        else:
+            tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _age_days(raw: str | None, now: datetime) -> float:
+    if not raw:
+        return 0.0
+    try:
+        dt = datetime.strptime(raw, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return 0.0
+    return max(0.0, (now - dt).total_seconds() / 86400.0)
+
+
+def _score(point: dict, query_tokens: set[str], similarity: float, now: datetime) -> float:
+    lexical = 0.0
+    if query_tokens:
+        point_tokens = tokenize(f"{point['anchor']} {point['content']}")
+        if point_tokens:
+            lexical = len(point_tokens & query_tokens) / min(len(point_tokens), len(query_tokens))
+    # 哈希向量的槽位碰撞会让无关文本也有一定相似度(维度越小越明显，见 storage.memory_index)，
+    # 取较大值时索引只能抬高得分；MEMORY_INDEX_DIM 过小会让弱相关的记忆挤占 Top-K
+    relevance = max(lexical, similarity)
+
+    strength = min(1.0, max(0.0, float(point.get("weight") or 0.0)))
+    age = _age_days(point.get("updated_at_utc") or point.get("created_at_utc"), now)
+    recency = math.pow(0.5, age / _RECENCY_HALF_LIFE_DAYS)
+
+    return _RELEVANCE_WEIGHT * relevance + _STRENGTH_WEIGHT * strength + _RECENCY_WEIGHT * recency
+
+
+def _point_line(point: dict) -> str:
+    return f"- [{point['anchor']}]->{point['content']}\n"
+
+
+def select_memory_points(
+    points: list[dict],
+    query_texts: list[str],
+    top_k: int,
+    max_chars: int,
+    similarities: dict[int, float] | None = None,
+) -> tuple[list[dict], MemoryRecallStats]:
+    """按相关度挑选记忆点
+
+    工作型记忆全部保留并优先占用字符预算；其余记忆点按得分降序依次加入，
+    直到达到 top_k 或超出 max_chars。
+    similarities 为 memory_point_id -> 余弦相似度，未出现的记忆点视为 0。
+    """
+    similarities = similarities or {}
+    stats = MemoryRecallStats(considered=len(points))
+    now = datetime.now(timezone.utc)
+    query_tokens: set[str] = set()
+    for text in query_texts:
+        query_tokens |= tokenize(text)
+
+    selected: list[dict] = []
+    others: list[tuple[float, dict]] = []
+    for point in points:
+        if point["memory_type"] == "work":
+            selected.append(point)
+            stats.work_injected += 1
+            stats.chars += len(_point_line(point))
+        else:
+            similarity = max(0.0, similarities.get(point["memory_point_id"], 0.0))
+            others.append((_score(point, query_tokens, similarity, now), point))
+
+    others.sort(key=lambda item: item[0], reverse=True)
+    picked = 0
+    for _, point in others:
+        if picked >= top_k:
+            break
+        line_len = len(_point_line(point))
+        if stats.chars + line_len > max_chars:
+            break
+        selected.append(point)
+        stats.chars += line_len
+        picked += 1
+
+    stats.injected = len(selected)
+    return selected, stats
+
+
+def render_memory_context(selected: list[dict], group_titles: list[str]) -> str:
+    """按记忆组渲染选中的记忆点，并附上全部记忆组标题以便 LLM 继续归类"""
+    grouped: dict[str, list[dict]] = {}
+    for point in selected:
+        grouped.setdefault(point["memory_group_title"], []).append(point)
+
+    memory = ""
+    if group_titles:
+        memory += f"Memory groups: {', '.join(group_titles)}\n\n-----\n"
+    for title, points in grouped.items():
+        memory += f"Memory group: {title}{{\n"
+        for point in points:
+            memory += _point_line(point)
+        memory += "}\n\n-----\n"
+    return memory
@@ -3,10 +3,12 @@ from config.settings import *
 from events import bus, E
 from datamodel import *
 from metrics import runtime_metrics
+from utils import *
 from storage.work_memory import *
 import storage.message as message_storage
-import storage.reminder as reminder_storage
 from core.amaya import require_amaya
+import core.outbox as outbox
+import core.reminder_draft as reminder_draft
 
 # 注册工具函数
 from functions.reminder_func import *
@@ -16,23 +18,29 @@ from functions.work_memory_func import *
 @bus.on(E.IO_SEND_MESSAGE)
 async def save_message(msg: OutgoingMessage) -> None:
     runtime_metrics.record_msg_out()
-    await message_storage.create_message(
+    message_id = await message_storage.create_message(
         msg.channel_type,
         "amaya",
         msg.content,
         metadata=msg.metadata,
     )
+    # 经发件箱落库后发送，失败由发件箱退避重发
+    await outbox.submit(msg, message_id or None)
 
 
 @bus.on(E.IO_MESSAGE_RECEIVED)
 async def handle_incoming_message(msg: IncomingMessage) -> None:
     runtime_metrics.record_msg_in()
     logger.info(f"开始处理来自用户的消息")
+    metadata = msg.metadata
+    if msg.attachments:
+        # 消息记录只保存附件引用，内容在附件缓存中(见 storage.attachment)
+        metadata = {**(metadata or {}), "attachments": msg.attachments}
     await message_storage.create_message(
         msg.channel_type,
         "user",
         msg.content,
-        metadata=msg.metadata,
+        metadata=metadata,
     )
     amaya = require_amaya()
     amaya.notify_new_message()
@@ -41,15 +49,17 @@ async def handle_incoming_message(msg: IncomingMessage) -> None:
 @bus.on(E.REMINDER_TRIGGERED)
 async def handle_reminder_triggered(reminder: Reminder):
     runtime_metrics.record_reminder_triggered()
-    logger.info(f"触发 Reminder: id={reminder.reminder_id}, title={reminder.title}")
-    reminder.status = "triggered"
-    reminder.next_action_at_min_utc = None  # ToDo: 未来可能需要更复杂的状态机设计
-    await reminder_storage.update_reminder(reminder)
+    # 状态已由 world.reminder 通过 claim_due_reminders 原子更新，这里不再重复写库
+    # 文案使用预生成的草稿或模板，按时送达不依赖主模型的实时延迟(见 core.reminder_draft)
+    text, source = await reminder_draft.resolve_delivery_text(reminder)
+    logger.info(f"触发 Reminder: id={reminder.reminder_id}, title={reminder.title}, source={source}")
 
     world_context = (
-        "[SYSTEM]{有一个提醒被触发，请注意及时转达给“凛星”: "
-        f"{reminder.title} -> {reminder.prompt} }}"
+        "[SYSTEM]{有一个提醒被触发，已按时发送给“凛星”: "
+        f"[{reminder.reminder_id}] {reminder.title} -> {reminder.prompt} }}"
     )
+    if source == "stale":
+        world_context += "\n[SYSTEM]{提醒文案起草后对话有了新进展，已先发送模板化提醒，如有必要请结合当前对话自然地补充，不要重复提醒内容}"
     await message_storage.create_message(
         ChannelType.AMAYA_INTERNAL,
         "world",
@@ -57,6 +67,79 @@ async def handle_reminder_triggered(reminder: Reminder):
         metadata={
             "kind": "reminder_triggered",
             "reminder_id": reminder.reminder_id,
+            "source": source,
+        },
+    )
+
+    amaya = require_amaya()
+    await bus.publish(
+        E.IO_SEND_MESSAGE,
+        OutgoingMessage(
+            channel_type=amaya.primary_channel_type,
+            content=text,
+            attachments=None,
+            channel_context=None,
+            metadata=amaya.primary_channel_metadata,
+        ),
+        key=f"conversation:{amaya.primary_channel_type.value}",
+    )
+    if source == "stale":
+        amaya.notify_new_message()
+
+
+@bus.on(E.REMINDER_CATCHUP)
+async def handle_reminder_catchup(missed: list[Reminder], stale: list[Reminder]):
+    # 停机等原因错过的提醒合并为一条世界消息，只通知一次，避免 N 次规划互相取消
+    for _ in missed:
+        runtime_metrics.record_reminder_triggered()
+    logger.info(f"补发 Reminder: missed={len(missed)}, stale={len(stale)}")
+
+    lines = []
+    for r in missed:
+        due_at = utc_epoch_min_to_user_local_min(r.remind_at_min_utc, USER_TIMEZONE)
+        lines.append(f"- [{r.reminder_id}] {r.title} (原定 {due_at}) -> {r.prompt}")
+    world_context = ""
+    if missed:
+        world_context = (
+            "[SYSTEM]{由于系统离线，以下提醒错过了原定时间，请合并成一次简洁的提醒转达给“凛星”，并说明已经晚了:\n"
+            + "\n".join(lines) + "\n}"
+        )
+    if stale:
+        stale_titles = "、".join(r.title for r in stale)
+        world_context += f"\n[SYSTEM]{{以下提醒已过期太久，不再提醒，如有必要可顺带一提: {stale_titles}}}"
+    await message_storage.create_message(
+        ChannelType.AMAYA_INTERNAL,
+        "world",
+        world_context.strip(),
+        metadata={
+            "kind": "reminder_catchup",
+            "reminder_ids": [r.reminder_id for r in missed],
+            "stale_reminder_ids": [r.reminder_id for r in stale],
+        },
+    )
+    if missed:  # 只有过期提醒时不单独触发规划，留待下次对话时带上
+        amaya = require_amaya()
+        amaya.notify_new_message()
+
+
+@bus.on(E.REMINDER_ESCALATED)
+async def handle_reminder_escalated(reminder: Reminder):
+    # 目前没有 Email 等备用渠道，升级提醒仍通过主渠道由 Amaya 再次转达
+    logger.info(f"升级 Reminder: id={reminder.reminder_id}, priority={reminder.priority}, retry_count={reminder.retry_count}")
+
+    world_context = (
+        "[SYSTEM]{一个提醒发出后仍未得到回应"
+        f"(第 {reminder.retry_count + 1} 次追加提醒)，请再次提醒“凛星”: "
+        f"[{reminder.reminder_id}] {reminder.title} -> {reminder.prompt} }}"
+    )
+    await message_storage.create_message(
+        ChannelType.AMAYA_INTERNAL,
+        "world",
+        world_context,
+        metadata={
+            "kind": "reminder_escalated",
+            "reminder_id": reminder.reminder_id,
+            "retry_count": reminder.retry_count,
         },
     )
     amaya = require_amaya()
@@ -0,0 +1,214 @@
+"""
+出站消息发件箱
+
+IO_SEND_MESSAGE 由编排器保存为消息记录后交给 submit()：先写入 storage.outbox，再立即放入按渠道划分的进程内队列，
+由该渠道的工作协程按登记顺序调用 bus.emit_and_wait(IO_DELIVER_MESSAGE) 交给渠道实际发送。
+- 成功：标记 delivered；
+- 失败：按指数退避改回 pending，由本模块的主循环到期后认领重发；超过最大尝试次数成为死信(dead)，
+  可通过管理 API 查看与重新入队；
+- 进程崩溃：发送中的消息在下次启动时立即重发(至少一次，渠道侧可能重复收到同一条消息)。
+
+正常路径只比直接发送多一次本地写库，不等待定时轮询。
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Set
+
+from config.settings import *
+from datamodel import *
+from events import bus, E
+from logger import logger
+from metrics import REMINDER_LATENESS_BUCKETS_MS, Histogram
+import storage.outbox as outbox_storage
+
+__all__ = ["get_status", "main_loop", "submit", "wake"]
+
+_PURGE_INTERVAL_SECONDS = 3600
+
+__shutdown_event: asyncio.Event = None
+__wake_event = asyncio.Event()
+__next_due_ms: int | None = None
+__woken_ms: int | None = None  # 刷新 __next_due_ms 期间 wake() 收到的最早重发时间
+__queues: Dict[str, asyncio.Queue] = {}  # channel_type -> (OutboxItem, 入队时间)
+__in_flight: Set[str] = set()  # 已在进程内排队或正在发送的 outbox_id，认领到期消息时排除，租约过期也不重复发送
+__delivered_count = 0
+__failed_count = 0
+__dead_count = 0
+__replayed_count = 0
+__delivery_latency_ms = Histogram(REMINDER_LATENESS_BUCKETS_MS)
+
+
+def get_status() -> dict[str, object]:
+    running = __shutdown_event is not None and not __shutdown_event.is_set()
+    return {
+        "running": running,
+        "next_due_at_epoch": None if __next_due_ms is None else __next_due_ms / 1000,
+        "queue_depth": sum(queue.qsize() for queue in __queues.values()),
+        "in_flight": len(__in_flight),
+        "delivered_count": __delivered_count,
+        "failed_count": __failed_count,
+        "dead_count": __dead_count,
+        "replayed_count": __replayed_count,
+        "delivery_latency_ms": __delivery_latency_ms.snapshot(),
+    }
+
+
+def wake(at_ms: int | None = None) -> None:
+    """有新的重发时间(默认立即)时唤醒主循环"""
+    global __next_due_ms, __woken_ms
+    if at_ms is None:
+        at_ms = int(time.time() * 1000)
+    if __woken_ms is None or at_ms < __woken_ms:
+        __woken_ms = at_ms
+    if __next_due_ms is None or at_ms < __next_due_ms:
+        __next_due_ms = at_ms
+        __wake_event.set()
+
+
+async def submit(msg: OutgoingMessage, message_id: str | None = None) -> None:
+    """登记并立即发送一条出站消息"""
+    item = await outbox_storage.enqueue_outbox(
+        msg.channel_type.value if isinstance(msg.channel_type, ChannelType) else str(msg.channel_type),
+        msg.content,
+        msg.metadata,
+        message_id,
+        OUTBOX_LEASE_SECONDS * 1000,
+    )
+    _dispatch(item)
+
+
+def _dispatch(item: OutboxItem) -> None:
+    if item.outbox_id in __in_flight:
+        return
+    __in_flight.add(item.outbox_id)
+    queue = __queues.get(item.channel_type)
+    if queue is None:
+        queue = asyncio.Queue()
+        __queues[item.channel_type] = queue
+        asyncio.create_task(_drain_queue(item.channel_type, queue), name=f"outbox:{item.channel_type}")
+    queue.put_nowait((item, time.perf_counter()))
+
+
+async def _drain_queue(channel_type: str, queue: asyncio.Queue) -> None:
+    # 同一渠道按登记顺序逐条发送；队列取空即退出并移除，判断与移除之间没有 await，不会与 _dispatch 交错
+    while not queue.empty():
+        item, queued_at = queue.get_nowait()
+        try:
+            await _deliver(item, queued_at)
+        except Exception as e:
+            # 只会是更新发件箱状态失败；消息保持 sending，租约到期后重发(计算下次到期时间时排除了它，需要主动唤醒)
+            logger.error(f"更新发件箱状态失败: outbox_id={item.outbox_id}, error={e}", exc_info=e)
+            wake(int((time.time() + OUTBOX_LEASE_SECONDS) * 1000))
+        finally:
+            __in_flight.discard(item.outbox_id)
+    del __queues[channel_type]
+
+
+async def _deliver(item: OutboxItem, queued_at: float) -> None:
+    global __delivered_count, __failed_count, __dead_count
+    try:
+        await bus.emit_and_wait(
+            E.IO_DELIVER_MESSAGE,
+            channel_type=item.channel_type,
+            content=item.content,
+            metadata=item.metadata,
+        )
+    except Exception as e:
+        __failed_count += 1
+        backoff = min(OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_BASE_SECONDS * (2 ** max(0, item.attempts - 1)))
+        retry_at_ms = int((time.time() + backoff) * 1000)
+        status = await outbox_storage.mark_failed(item.outbox_id, f"{type(e).__name__}: {e}", retry_at_ms)
+        if status == "dead":
+            __dead_count += 1
+            logger.error(
+                f"消息发送失败且已达最大尝试次数，已转入死信: channel={item.channel_type}, "
+                f"outbox_id={item.outbox_id}, attempts={item.attempts}, error={e}",
+                exc_info=e,
+            )
+        else:
+            logger.warning(
+                f"消息发送失败，{backoff:.1f}s 后重发: channel={item.channel_type}, "
+                f"outbox_id={item.outbox_id}, attempts={item.attempts}, error={e}"
+            )
+            wake(retry_at_ms)
+        return
+
+    await outbox_storage.mark_delivered(item.outbox_id)
+    __delivered_count += 1
+    __delivery_latency_ms.observe((time.perf_counter() - queued_at) * 1000)
+    if item.attempts > 1:
+        logger.info(f"[重发] 消息已送达: channel={item.channel_type}, outbox_id={item.outbox_id}, attempts={item.attempts}")
+
+
+async def _sleep(timeout: float | None) -> None:
+    """睡眠直到超时、被新的重发时间唤醒或收到关闭信号"""
+    waiters = [
+        asyncio.create_task(__wake_event.wait()),
+        asyncio.create_task(__shutdown_event.wait()),
+    ]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+async def _dispatch_due() -> None:
+    while True:
+        items: List[OutboxItem] = await outbox_storage.claim_due_outbox(
+            int(time.time() * 1000), OUTBOX_LEASE_SECONDS * 1000, OUTBOX_BATCH_SIZE, tuple(__in_flight)
+        )
+        for item in items:
+            _dispatch(item)
+        if len(items) < OUTBOX_BATCH_SIZE:
+            return
+
+
+async def _refresh_next_due() -> None:
+    global __next_due_ms, __woken_ms
+    __woken_ms = None
+    next_due_ms = await outbox_storage.get_next_due_ms(tuple(__in_flight))
+    # 查询期间 wake() 登记的重发时间可能不在查询结果中，且会被旧的 __next_due_ms 挡掉，取两者中较早的
+    if __woken_ms is not None and (next_due_ms is None or __woken_ms < next_due_ms):
+        next_due_ms = __woken_ms
+    __next_due_ms = next_due_ms
+
+
+async def _purge_delivered() -> None:
+    purged = await outbox_storage.purge_delivered(int((time.time() - OUTBOX_RETAIN_DELIVERED_HOURS * 3600) * 1000))
+    if purged:
+        logger.trace(f"清理已送达的发件箱记录: purged={purged}")
+
+
+async def main_loop(shutdown_event: asyncio.Event):
+    global __shutdown_event, __replayed_count
+    __shutdown_event = shutdown_event
+
+    __replayed_count = await outbox_storage.release_sending(int(time.time() * 1000))
+    await _refresh_next_due()
+    logger.info(f"发件箱已启动，重新发送 {__replayed_count} 条未确认的消息")
+
+    next_purge_at = 0.0
+    while not shutdown_event.is_set():
+        __wake_event.clear()
+        if time.time() >= next_purge_at:
+            try:
+                await _purge_delivered()
+            except Exception as e:
+                logger.error(f"清理发件箱失败: {e}", exc_info=e)
+            next_purge_at = time.time() + _PURGE_INTERVAL_SECONDS
+
+        delay = _PURGE_INTERVAL_SECONDS if __next_due_ms is None else __next_due_ms / 1000 - time.time()
+        if delay > 0:
+            await _sleep(min(delay, _PURGE_INTERVAL_SECONDS))
+            continue
+
+        try:
+            await _dispatch_due()
+            await _refresh_next_due()
+        except Exception as e:
+            logger.error(f"发件箱调度失败: {e}", exc_info=e)
+            await _sleep(OUTBOX_RETRY_BASE_SECONDS)
+
+    logger.info("发件箱已关闭")
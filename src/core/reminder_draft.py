@@ -0,0 +1,165 @@
+"""提醒文案预生成模块
+
+提醒到期时如果再走一遍主模型规划，送达时间会被整段 LLM 延迟拖后，服务商故障时甚至无法送达。
+因此提醒的文案提前生成，到期时只做廉价校验后直接发送：
+1. 提醒创建(或重复提醒推进到下一次)时，向延时事件队列登记 REMINDER_DRAFT_DUE，投递时间为到期前
+   REMINDER_DRAFT_LEAD_MINUTES 分钟；
+2. 投递后用快速模型结合最近对话起草一条提醒消息，写入 reminders.draft_text，并记录对应的那一次发生时间;
+3. 到期时若草稿对应当前这一次发生、且起草之后用户没有发过新消息，直接发送草稿；
+   没有可用草稿时按 HLD 的降级策略发送模板化消息(任务标题 + 时间)。
+   草稿已过时(起草后有新的对话)时同样先发送模板消息，再通知 Amaya 结合当前对话自行补充。
+
+起草失败会抛出异常交给调度器按退避重试，到期后不再起草。
+"""
+
+import asyncio
+import re
+import time
+from typing import List
+
+from logger import logger
+from config.settings import *
+from datamodel import *
+from events import bus, E
+from llm.base import LLMContextItem
+from metrics import runtime_metrics
+import storage.message as message_storage
+import storage.reminder as reminder_storage
+import storage.scheduled_event as scheduled_event_storage
+from utils import *
+
+__all__ = ["get_status", "render_reminder_template", "resolve_delivery_text"]
+
+_SEGMENT_MARKER_PATTERN = re.compile(r"^-#\d+#-$")
+
+_DRAFT_INSTRUCTION = (
+    "\n\n-----\n# 提醒文案预生成\n"
+    "现在需要你提前写好一条提醒消息，它会在提醒时间到达时原样发送给“{user_name}”。"
+    "请结合最近的对话，用你平时的语气写一条简短的提醒，只输出这条消息本身，不要使用分段控制符，不要调用工具。"
+)
+
+__drafted_count = 0
+__draft_failed_count = 0
+__delivered = {"draft": 0, "template": 0, "stale": 0}
+
+
+def get_status() -> dict[str, object]:
+    return {
+        "drafted_count": __drafted_count,
+        "draft_failed_count": __draft_failed_count,
+        "delivered_draft_count": __delivered["draft"],
+        "delivered_template_count": __delivered["template"],
+        "stale_draft_count": __delivered["stale"],
+    }
+
+
+def render_reminder_template(reminder: Reminder) -> str:
+    """HLD 降级策略中的模板化提醒消息"""
+    local_time = utc_epoch_min_to_user_local_min(reminder.remind_at_min_utc, USER_TIMEZONE)
+    return f"提醒：{reminder.title}（{local_time}）"
+
+
+async def resolve_delivery_text(reminder: Reminder) -> tuple[str, str]:
+    """
+    到期时决定发送的文案，返回 (文案, 来源)，来源为 'draft' / 'template' / 'stale'。
+    只读取 claim 时已随 RETURNING 取回的草稿字段，外加一次按主键范围的消息查询
+    """
+    source = "template"
+    if reminder.draft_text and reminder.draft_for_min_utc == reminder.remind_at_min_utc:
+        source = "draft"
+        if await message_storage.has_user_message_since((reminder.drafted_at_ms_utc or 0) / 1000):
+            source = "stale"
+    __delivered[source] += 1
+    if source == "draft":
+        return reminder.draft_text, source
+    return render_reminder_template(reminder), source
+
+
+async def _schedule_draft(reminder_id: int, remind_at_min_utc: int) -> None:
+    at_ms = max(int(time.time() * 1000), (remind_at_min_utc - REMINDER_DRAFT_LEAD_MINUTES) * 60 * 1000)
+    await scheduled_event_storage.schedule_event(
+        E.REMINDER_DRAFT_DUE,
+        {"reminder_id": reminder_id, "remind_at_min_utc": remind_at_min_utc},
+        at_ms=at_ms,
+    )
+
+
+@bus.on(E.REMINDER_CREATED)
+async def schedule_draft_on_created(reminder_id: int, remind_at_min_utc: int, **_):
+    await _schedule_draft(reminder_id, remind_at_min_utc)
+
+
+@bus.on(E.REMINDER_RESCHEDULED)
+async def schedule_draft_on_rescheduled(reminder_id: int, next_action_at_min_utc: int, **_):
+    # 只有重复提醒推进到下一次(回到 pending 且下次动作即为发送)才需要新的草稿；延后不改变发生时间，沿用原草稿
+    reminder = await reminder_storage.get_reminder(reminder_id)
+    if reminder is None or reminder.status != "pending":
+        return
+    if reminder.remind_at_min_utc != next_action_at_min_utc or reminder.draft_for_min_utc == reminder.remind_at_min_utc:
+        return
+    await _schedule_draft(reminder_id, reminder.remind_at_min_utc)
+
+
+async def _generate_draft(reminder: Reminder) -> str:
+    from core.amaya import require_amaya
+
+    history = await message_storage.get_recent_messages(limit=REMINDER_DRAFT_CONTEXT_MESSAGES) if REMINDER_DRAFT_CONTEXT_MESSAGES else []
+    context: List[LLMContextItem] = [
+        {
+            "role": m["role"],
+            "content": f"[{utc_str_to_user_local_min(m['created_at_utc'], USER_TIMEZONE)}] {m['content']}",
+        }
+        for m in reversed(history)
+    ]
+    context.append({
+        "role": "world",
+        "content": (
+            f"提醒时间：{utc_epoch_min_to_user_local_min(reminder.remind_at_min_utc, USER_TIMEZONE)}\n"
+            f"提醒内容：[{reminder.reminder_id}] {reminder.title} -> {reminder.prompt}"
+        ),
+    })
+
+    start_time = time.perf_counter()
+    llm_call_error = False
+    try:
+        raw = await asyncio.wait_for(
+            require_amaya().fast_llm_client.generate_response(
+                context,
+                _DRAFT_INSTRUCTION.format(user_name=USER_NAME),
+                allow_tools=False,
+            ),
+            timeout=REMINDER_DRAFT_TIMEOUT_SECONDS,
+        )
+    except Exception:
+        llm_call_error = True
+        raise
+    finally:
+        runtime_metrics.record_llm_call(latency_ms=(time.perf_counter() - start_time) * 1000, error=llm_call_error)
+
+    lines = [line for line in (raw or "").splitlines() if not _SEGMENT_MARKER_PATTERN.fullmatch(line.strip())]
+    return "\n".join(lines).strip()
+
+
+@bus.on(E.REMINDER_DRAFT_DUE)
+async def draft_reminder_text(reminder_id: int, remind_at_min_utc: int, **_):
+    """由延时事件调度器投递；失败时抛出异常，由调度器按退避重试"""
+    global __drafted_count, __draft_failed_count
+    reminder = await reminder_storage.get_reminder(reminder_id)
+    if reminder is None or reminder.status not in ("pending", "snoozed"):
+        return
+    if reminder.remind_at_min_utc != remind_at_min_utc or reminder.draft_for_min_utc == remind_at_min_utc:
+        return  # 已改期/已推进(新的草稿事件另行登记)或已有草稿
+    if now_utc_epoch_min() >= remind_at_min_utc and reminder.status == "pending":
+        return  # 已到期，起草已无意义
+
+    try:
+        draft_text = await _generate_draft(reminder)
+        if not draft_text:
+            raise ValueError("模型返回了空的提醒文案")
+    except Exception:
+        __draft_failed_count += 1
+        raise
+
+    if await reminder_storage.save_reminder_draft(reminder_id, remind_at_min_utc, draft_text, int(time.time() * 1000)):
+        __drafted_count += 1
+        logger.info(f"提醒文案已预生成: reminder_id={reminder_id}")
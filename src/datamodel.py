@@ -4,7 +4,7 @@ from enum import Enum
 from datetime import datetime
 
 __all__ = [
-    "Reminder",
+    "Reminder", "ScheduledEvent", "OutboxItem",
     "ChannelType", "IncomingMessage", "OutgoingMessage",
     "FunctionCall",
 ]
@@ -14,10 +14,43 @@ __all__ = [
 class Reminder:
     reminder_id: int
     title: str
-    remind_at_min_utc: str  # 格式: "YYYY-MM-DD HH:MM"
+    remind_at_min_utc: int  # UTC epoch 分钟 (unix 秒 // 60)
     prompt: str
     status: str = "pending"  # 'pending', 'sent', 'acked', 'snoozed', 'escalated', 'ignored', 'cancelled'
-    next_action_at_min_utc: str = None  # 格式: "YYYY-MM-DD HH:MM"
+    next_action_at_min_utc: int | None = None  # UTC epoch 分钟，None 表示无后续动作
+    priority: str = "none"  # 'high', 'medium', 'low', 'none'
+    retry_count: int = 0
+    snoozed_until_min_utc: int | None = None
+    recurrence_rule: str | None = None  # RRULE 子集，None 表示一次性提醒
+    occurrence_count: int = 1  # 当前是重复序列中的第几次
+    draft_text: str | None = None  # 预生成的提醒文案
+    draft_for_min_utc: int | None = None  # 草稿对应的 remind_at_min_utc，不一致即失效
+    drafted_at_ms_utc: int | None = None
+
+
+# ----------------- 延时事件数据模型 ----------------
+@dataclass
+class ScheduledEvent:
+    event_id: str  # ULID
+    event_type: str  # 投递到事件总线的事件名
+    payload: Dict[str, Any]  # 作为关键字参数传给处理器
+    scheduled_at_ms_utc: int  # UTC epoch 毫秒
+    status: str = "pending"  # 'pending', 'claimed', 'dead'
+    attempts: int = 0
+    max_attempts: int = 5
+
+
+# ----------------- 出站发件箱数据模型 ----------------
+@dataclass
+class OutboxItem:
+    outbox_id: str  # ULID
+    channel_type: str
+    content: str
+    metadata: Dict[str, Any] | None = None
+    message_id: str | None = None  # messages 中对应的记录
+    status: str = "pending"  # 'pending', 'sending', 'delivered', 'dead'
+    attempts: int = 0
+    max_attempts: int = 8
 
 
 # ----------------- Channel 数据模型 ----------------
@@ -25,7 +58,8 @@ class ChannelType(str, Enum):
     AMAYA_INTERNAL = "amaya_internal"  # Amaya 内部消息通道，主要用于系统消息和世界信息
     TELEGRAM_BOT_POLLING = "telegram_bot_polling"
     NAPCATQQ_ONEBOT_V11 = "napcatqq_onebot_v11"
-    #TELEGRAM_BOT_WEBHOOK = "telegram_bot_webhook"
+    TELEGRAM_BOT_WEBHOOK = "telegram_bot_webhook"
+    LOOPBACK = "loopback"  # 本地压测用的回环渠道
 
 @dataclass
 class IncomingMessage:
@@ -1,16 +1,37 @@
 """事件总线模块，定义了事件总线类 Bus 及事件名集合 E
 事件分为两种：
 1. 普通事件：允许多个处理器注册;
-2. 独占事件：仅允许一个处理器注册，尝试重复注册会引发运行时错误(未实现);
-(暂时不使用以上逻辑，仅作预留)
+2. 独占事件(EXCLUSIVE_EVENTS)：每个路由只允许一个处理器注册，重复注册会引发 RuntimeError。
+   由延时事件调度器以“至少一次”语义投递的事件属于此类，保证每条事件只有一个负责方。
+
+路由：处理器可以用 bus.on(event, route=...) 只订阅某个路由(目前为渠道类型)。投递时按事件参数中的
+channel_type(第一个参数的属性或同名关键字参数)查表，只调度匹配的处理器；未指定路由的处理器照常接收全部事件。
+这样新增渠道不会增加其他渠道每条消息的投递开销。
+
+处理器在注册时被包装以采集运行指标：每个处理器的耗时直方图，每个事件的进行中/完成/异常次数，
+以及超过 BUS_SLOW_HANDLER_MS 的慢处理记录，通过 bus.get_status() 暴露给 /api/v1/metrics。
+
+投递方式有两种：
+1. bus.emit：立即为每个处理器创建任务，互不等待，无顺序保证;
+2. await bus.publish(event, ..., key=...)：按分区键排队，同一分区内的事件严格按发布顺序逐个处理
+   (前一个事件的全部处理器完成后才处理下一个)，不同分区并行；队列容量为 BUS_PARTITION_QUEUE_SIZE，
+   队列满时发布方等待，形成背压。分区处理器内不要向自身所在的分区 await publish，否则队列满时会死锁。
 """
 
 from __future__ import annotations
 from pyee.asyncio import AsyncIOEventEmitter
-from typing import Awaitable, Callable, Dict, Set
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
 from functools import wraps
+import asyncio
+import inspect
+import time
 
 from logger import logger
+from metrics import BUS_HANDLER_LATENCY_BUCKETS_MS, Histogram
+from config.settings import BUS_SLOW_HANDLER_MS, BUS_PARTITION_QUEUE_SIZE
 
 AsyncHandler = Callable[..., Awaitable[None]]
 
@@ -20,33 +41,249 @@ class E:
     IO_MESSAGE_RECEIVED = "io.message_received"
     IO_SEND_MESSAGE = "io.send_message"
     REMINDER_CREATED = "reminder.created"
-    REMINDER_TRIGGERED = "reminder.triggered"
+    REMINDER_RESCHEDULED = "reminder.rescheduled"  # next_action_at_min_utc 被改为新的时间
+    REMINDER_TRIGGERED = "reminder.triggered"  # pending -> sent
+    REMINDER_CATCHUP = "reminder.catchup"  # 停机等原因错过的提醒，合并为一次补发
+    REMINDER_ESCALATED = "reminder.escalated"  # 超时未响应，升级/重复提醒
+    REMINDER_ACKED = "reminder.acked"
+    REMINDER_CANCELLED = "reminder.cancelled"
     REMINDER_SENT = "reminder.sent"
+    REMINDER_DRAFT_DUE = "reminder.draft_due"  # 由调度器在到期前投递，预生成提醒文案
+    IO_DELIVER_MESSAGE = "io.deliver_message"  # 由发件箱调用渠道实际发送，失败时抛出异常
+    PRESENCE_TYPING = "presence.typing"  # Amaya 开始/结束“正在输入”(规划中或仍有待发送分段)
+    SCHEDULED_EVENT_ADDED = "scheduler.event_added"
+
+EXCLUSIVE_EVENTS = {
+    E.IO_DELIVER_MESSAGE,
+    E.REMINDER_DRAFT_DUE,
+}
+
+_SLOW_LOG_SIZE = 50
+
+
+@dataclass
+class _EventStats:
+    in_flight: int = 0
+    completed: int = 0
+    errors: int = 0
+    cancelled: int = 0
 
-EXCLUSIVE_EVENTS = {}
+
+@dataclass
+class _HandlerStats:
+    event: str
+    latency_ms: Histogram = field(default_factory=lambda: Histogram(BUS_HANDLER_LATENCY_BUCKETS_MS))
+    errors: int = 0
 
 
 class Bus(AsyncIOEventEmitter):
     def __init__(self) -> None:
         super().__init__()
-        self._exclusive: Set[str] = set()
+        self._exclusive: Set[Tuple[str, str | None]] = set()
+        self._routes: Dict[str, Dict[str, List[AsyncHandler]]] = {}  # event -> route -> 处理器
+        self._event_stats: Dict[str, _EventStats] = {}
+        self._handler_stats: Dict[str, _HandlerStats] = {}
+        self._slow_calls: deque[dict] = deque(maxlen=_SLOW_LOG_SIZE)
+        self._partitions: Dict[str, asyncio.Queue] = {}
+        self._partition_workers: Set[asyncio.Task] = set()
+        self._publish_blocked_count = 0
+
+    def _instrument(self, event: str, handler: AsyncHandler) -> AsyncHandler:
+        """包装处理器，记录耗时、进行中数量与异常；异常照常抛出，不改变原有的错误传播"""
+        name = f"{handler.__module__}.{handler.__qualname__}"
+        event_stats = self._event_stats.setdefault(event, _EventStats())
+        handler_stats = self._handler_stats.setdefault(name, _HandlerStats(event))
+
+        def finish(start: float, error: BaseException | None) -> None:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            event_stats.in_flight -= 1
+            if isinstance(error, asyncio.CancelledError):
+                event_stats.cancelled += 1
+                return
+            handler_stats.latency_ms.observe(elapsed_ms)
+            if error is not None:
+                event_stats.errors += 1
+                handler_stats.errors += 1
+            else:
+                event_stats.completed += 1
+            if elapsed_ms >= BUS_SLOW_HANDLER_MS:
+                self._slow_calls.append({
+                    "event": event,
+                    "handler": name,
+                    "elapsed_ms": round(elapsed_ms, 2),
+                    "at_epoch": time.time(),
+                })
+                logger.warning(f"事件处理器耗时过长: event={event}, handler={name}, elapsed={elapsed_ms:.1f}ms")
+
+        if inspect.iscoroutinefunction(handler):
+            @wraps(handler)
+            async def instrumented(*args, **kwargs):
+                event_stats.in_flight += 1
+                start = time.perf_counter()
+                error: BaseException | None = None
+                try:
+                    return await handler(*args, **kwargs)
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    finish(start, error)
+        else:
+            @wraps(handler)
+            def instrumented(*args, **kwargs):
+                event_stats.in_flight += 1
+                start = time.perf_counter()
+                error: BaseException | None = None
+                try:
+                    return handler(*args, **kwargs)
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    finish(start, error)
+
+        return instrumented
+
+    def get_status(self) -> dict[str, object]:
+        return {
+            "pending_tasks": len(self._waiting),  # 已调度但尚未完成的处理器任务
+            "events": {
+                event: {
+                    "in_flight": stats.in_flight,
+                    "completed": stats.completed,
+                    "errors": stats.errors,
+                    "cancelled": stats.cancelled,
+                }
+                for event, stats in self._event_stats.items()
+            },
+            "handlers": {
+                name: {
+                    "event": stats.event,
+                    "errors": stats.errors,
+                    "latency_ms": stats.latency_ms.snapshot(),
+                }
+                for name, stats in self._handler_stats.items()
+            },
+            "slow_handler_ms": BUS_SLOW_HANDLER_MS,
+            "slow_calls": list(self._slow_calls),
+            "routes": {
+                event: {route: len(handlers) for route, handlers in routes.items()}
+                for event, routes in self._routes.items()
+            },
+            "partitions": {key: queue.qsize() for key, queue in self._partitions.items()},
+            "publish_blocked_count": self._publish_blocked_count,
+        }
+
+    async def publish(self, event: str, *args, key: str | None = None, **kwargs) -> None:
+        """按分区键有序投递，key 为空时以事件名为分区；队列满时等待(背压)，只等待入队，不等待处理完成"""
+        key = key or event
+        queue = self._partitions.get(key)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=BUS_PARTITION_QUEUE_SIZE)
+            self._partitions[key] = queue
+            worker = asyncio.create_task(self._drain_partition(key, queue), name=f"bus-partition:{key}")
+            self._partition_workers.add(worker)
+            worker.add_done_callback(self._partition_workers.discard)
+        if queue.full():
+            self._publish_blocked_count += 1
+        await queue.put((event, args, kwargs))
+
+    async def _drain_partition(self, key: str, queue: asyncio.Queue) -> None:
+        # 队列取空即退出并移除分区；最后一次判断与移除之间没有 await，不会与 publish 交错
+        while True:
+            if queue.empty():
+                # get_nowait 腾出的位置会唤醒阻塞在 put 上的 publish，但它要等本协程让出后才能入队；
+                # 没有处理器的事件不经过 await，因此先让出一次再确认队列为空，否则事件会留在已移除的分区里
+                await asyncio.sleep(0)
+                if queue.empty():
+                    break
+            event, args, kwargs = queue.get_nowait()
+            handlers = self._handlers_for(event, args, kwargs)
+            if not handlers:
+                continue
+            results = await asyncio.gather(
+                *(self._call_handler(handler, args, kwargs) for handler in handlers),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"分区事件处理失败: key={key}, event={event}, error={result}", exc_info=result)
+        del self._partitions[key]
+
+    @staticmethod
+    async def _call_handler(handler: Callable, args: tuple, kwargs: dict) -> None:
+        result = handler(*args, **kwargs)
+        if inspect.isawaitable(result):
+            await result
+
+    def on(self, event: str, route: Any = None) -> Callable[[AsyncHandler], AsyncHandler]:
+        """注册事件处理器装饰器，route 非空时只接收该路由(渠道类型)的事件"""
+        route_key = _route_key(route)
 
-    def on(self, event: str) -> Callable[[AsyncHandler], AsyncHandler]:
-        """注册事件处理器装饰器"""
         def decorator(handler: AsyncHandler) -> AsyncHandler:
-            # 检查独占事件
+            # 检查独占事件：同一路由只能有一个处理器，且未指定路由的处理器与按路由注册的处理器不能并存，
+            # 否则同一事件会被两者各处理一次(如重复发送)
             if event in EXCLUSIVE_EVENTS:
-                if event in self._exclusive:
-                    raise RuntimeError(f"独占事件的唯一处理器已注册: {event}")
-                self._exclusive.add(event)
-            
-            # 注册到父类
-            logger.debug(f"注册事件处理器: {event} -> {handler.__name__}")
-            super(Bus, self).on(event, handler)
+                if (event, route_key) in self._exclusive:
+                    raise RuntimeError(f"独占事件的唯一处理器已注册: {event}, route={route_key}")
+                registered = [key for exclusive_event, key in self._exclusive if exclusive_event == event]
+                if route_key is None and registered:
+                    raise RuntimeError(f"独占事件已有按路由注册的处理器，不能再注册未指定路由的处理器: {event}")
+                if route_key is not None and None in registered:
+                    raise RuntimeError(f"独占事件已有未指定路由的处理器，不能再按路由注册: {event}, route={route_key}")
+                self._exclusive.add((event, route_key))
+
+            # 注册的是带指标采集的包装，返回原处理器以便直接调用
+            logger.debug(f"注册事件处理器: {event} -> {handler.__name__}" + (f" (route={route_key})" if route_key else ""))
+            instrumented = self._instrument(event, handler)
+            if route_key is None:
+                super(Bus, self).on(event, instrumented)
+            else:
+                self._routes.setdefault(event, {}).setdefault(route_key, []).append(instrumented)
             return handler
-        
+
         return decorator
 
+    def _routed_handlers(self, event: str, args: tuple, kwargs: dict) -> List[AsyncHandler]:
+        routes = self._routes.get(event)
+        if not routes:
+            return []
+        route = kwargs.get("channel_type")
+        if route is None and args:
+            route = getattr(args[0], "channel_type", None)
+        return routes.get(_route_key(route), []) if route is not None else []
+
+    def _handlers_for(self, event: str, args: tuple, kwargs: dict) -> List[Callable]:
+        return self.listeners(event) + self._routed_handlers(event, args, kwargs)
+
+    def emit(self, event: str, *args, **kwargs) -> bool:
+        """先投递给未指定路由的处理器，再按路由表调度匹配的处理器"""
+        handled = super().emit(event, *args, **kwargs)
+        routed = self._routed_handlers(event, args, kwargs)
+        for handler in routed:
+            self._emit_run(handler, args, kwargs)
+        return handled or bool(routed)
+
+    async def emit_and_wait(self, event: str, *args, **kwargs) -> None:
+        """并发执行事件的全部处理器并等待完成，任一处理器抛出异常则向上抛出
+
+        普通的 emit 不关心处理结果；需要“至少一次”投递语义的调用方(如延时事件调度器)使用此方法确认处理成功。
+        """
+        handlers = self._handlers_for(event, args, kwargs)
+        if not handlers:
+            raise LookupError(f"事件没有已注册的处理器: {event}")
+
+        results = await asyncio.gather(*(self._call_handler(h, args, kwargs) for h in handlers), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+
+def _route_key(route: Any) -> str | None:
+    if route is None:
+        return None
+    return route.value if isinstance(route, Enum) else str(route)
+
 
 bus = Bus()
 
@@ -26,22 +26,93 @@ class CreateReminder(BaseFunction):
                     "prompt": {
                         "type": "string",
                         "description": "When a reminder is triggered, the conversation along with this prompt will be fed into Amaya to generate the most appropriate response for that moment. Ensure conciseness and accuracy. Such as '提醒用户完成微积分作业'"  # 在提示词中融入username以实现更好的效果
+                    },
+                    "priority": {
+                        "type": "string",
+                        "enum": ["high", "medium", "low", "none"],
+                        "description": "If the user does not respond within 5 minutes: 'high' repeats the reminder every 3 minutes (up to 3 times), 'medium' reminds once more, 'low'/'none' gives up. Default 'none'"
+                    },
+                    "recurrence": {
+                        "type": "string",
+                        "description": "Optional RRULE for recurring reminders; 'time' is the first occurrence. Supports FREQ (MINUTELY/HOURLY/DAILY/WEEKLY/MONTHLY/YEARLY), INTERVAL, BYDAY (DAILY/WEEKLY only), COUNT, UNTIL (YYYYMMDD). Such as 'FREQ=WEEKLY;BYDAY=MO,WE,FR' or 'FREQ=DAILY;COUNT=7'. Omit for one-time reminders"
                     }
                 },
                 "required": ["title", "time", "prompt"]
             }
         }
 
-    async def execute(self, title: str, time: str, prompt: str):
-        remind_at_min_utc = user_local_min_to_utc_min_str(time, USER_TIMEZONE)
+    async def execute(self, title: str, time: str, prompt: str, priority: str = "none", recurrence: str | None = None):
+        remind_at_min_utc = user_local_min_to_utc_epoch_min(time, USER_TIMEZONE)
 
-        reminder = await reminder_storage.create_reminder(
-            title=title,
-            remind_at_min_utc=remind_at_min_utc,
-            prompt=prompt
-        )
+        try:
+            reminder = await reminder_storage.create_reminder(
+                title=title,
+                remind_at_min_utc=remind_at_min_utc,
+                prompt=prompt,
+                priority=priority,
+                recurrence_rule=recurrence
+            )
+        except ValueError as e:
+            return f"Failed to create reminder: {e}"
+        if reminder.recurrence_rule:
+            return f"Recurring reminder created with ID: {reminder.reminder_id}"
         return f"Reminder created with ID: {reminder.reminder_id}"
 
+class SnoozeReminder(BaseFunction):
+    @property
+    def tool_schema(self) -> dict:
+        return {
+            "type": "function",
+            "name": "snooze_reminder",
+            "description": "Postpone a reminder when the user asks to be reminded again later",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "reminder_id": {
+                        "type": "integer",
+                        "description": "The ID of the reminder"
+                    },
+                    "minutes": {
+                        "type": "integer",
+                        "description": "How many minutes from now the reminder should fire again"
+                    }
+                },
+                "required": ["reminder_id", "minutes"]
+            }
+        }
+
+    async def execute(self, reminder_id: int, minutes: int):
+        until_min = now_utc_epoch_min() + max(1, int(minutes))
+        if not await reminder_storage.snooze_reminder(int(reminder_id), until_min):
+            return f"Reminder {reminder_id} not found or already finished"
+        return f"Reminder {reminder_id} snoozed until {utc_epoch_min_to_user_local_min(until_min, USER_TIMEZONE)}"
+
+class CancelReminder(BaseFunction):
+    @property
+    def tool_schema(self) -> dict:
+        return {
+            "type": "function",
+            "name": "cancel_reminder",
+            "description": "Cancel a reminder that has not finished yet",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "reminder_id": {
+                        "type": "integer",
+                        "description": "The ID of the reminder"
+                    }
+                },
+                "required": ["reminder_id"]
+            }
+        }
+
+    async def execute(self, reminder_id: int):
+        if not await reminder_storage.cancel_reminder(int(reminder_id)):
+            return f"Reminder {reminder_id} not found or already finished"
+        return f"Reminder {reminder_id} cancelled"
+
 register_tool(CreateReminder())
+register_tool(SnoozeReminder())
+register_tool(CancelReminder())
 
-__all__ = ["CreateReminder"]
+__all__ = ["CreateReminder", "SnoozeReminder", "CancelReminder"]
@@ -7,9 +7,10 @@
 
 from logger import logger
 from functions.base import *
+import storage.memory_index as memory_index
 import storage.work_memory as work_memory_storage
 
-__all__ = ["CreateMemoryGroup", "CreateMemoryPoint"]
+__all__ = ["CreateMemoryGroup", "CreateMemoryPoint", "SearchMemoryPoints"]
 
 class CreateMemoryGroup(BaseFunction):
     @property
@@ -117,3 +118,38 @@ class EditMemoryPointContent(BaseFunction):
             return f"Memory point with ID '{memory_point_id}' has been updated."
 
 register_tool(EditMemoryPointContent())
+
+
+class SearchMemoryPoints(BaseFunction):
+    @property
+    def tool_schema(self) -> dict:
+        return {
+            "type": "function",
+            "name": "search_memory_points",
+            "description": "Search all memory points by similarity. Use it to recall memories that are not shown in the current Memory Context.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "What you want to recall, such as a person, place or event."
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of results. Default is `10`.",
+                        "default": 10
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+
+    async def execute(self, query: str, limit: int = 10) -> str:
+        limit = max(1, min(int(limit), 50))
+        hits = memory_index.search(query, k=limit)
+        points = await work_memory_storage.get_memory_points_by_ids([point_id for point_id, _ in hits])
+        if not points:
+            return "No related memory points found."
+        return "\n".join(f"- [{p['memory_point_id']}] {p['anchor']} -> {p['content']}" for p in points)
+
+register_tool(SearchMemoryPoints())
@@ -13,13 +13,20 @@ import sys
 
 from config.prompts import CORE_SYSTEM_PROMPT
 from datamodel import *
-from channels.telegram_polling import main as telegram_main
-from channels.qq_onebot_ws import main as napcatqq_main
+from channels.base import load_channels, run_channel
+from channels.telegram_polling import TELEGRAM_CHANNEL_TYPE
 from admin.http_server import main_loop as admin_http_main
 import core.orchestrator as orchestrator
+import core.outbox
 from core.amaya import Amaya, configure_amaya
 import world.reminder
+import world.scheduler
+import maintenance.memory_decay
+import maintenance.backup
+import maintenance.message_archive
+import storage.attachment as attachment_storage
 import storage.db_config as db_config
+import storage.memory_index as memory_index
 from llm.base import LLMClient
 
 shutdown_event = asyncio.Event()
@@ -51,9 +58,11 @@ def _create_llm_clients() -> tuple[LLMClient, LLMClient]:
 def _get_primary_channel() -> tuple[ChannelType, dict | None]:
     """获取主联系方式对应的通道"""
     if PRIMARY_CONTACT_METHOD == "telegram":
-        return ChannelType.TELEGRAM_BOT_POLLING, None
+        return TELEGRAM_CHANNEL_TYPE, None
     elif PRIMARY_CONTACT_METHOD == "napcatqq":
         return ChannelType.NAPCATQQ_ONEBOT_V11, None
+    elif PRIMARY_CONTACT_METHOD == "loopback":
+        return ChannelType.LOOPBACK, None
     else:
         raise ValueError(f"不支持的主联系方式: {PRIMARY_CONTACT_METHOD}")
 
@@ -71,29 +80,34 @@ async def main():
     )
     configure_amaya(amaya)
 
-    await db_config.init_db("data/amaya.db")
+    await db_config.init_db("data/amaya.db", archive_path=MESSAGE_ARCHIVE_DB_PATH)
+    await memory_index.init_index("data/memory_index")
 
     try:
         tasks = [
             world.reminder.main_loop(shutdown_event),
+            world.scheduler.main_loop(shutdown_event),
+            core.outbox.main_loop(shutdown_event),
+            maintenance.memory_decay.main_loop(shutdown_event),
+            maintenance.message_archive.main_loop(shutdown_event),
+            maintenance.backup.main_loop(shutdown_event),
             amaya.run_loop(shutdown_event),
             admin_http_main(shutdown_event, restart_event),
         ]
 
-        if ENABLE_TELEGRAM_BOT_POLLING:
-            tasks.append(telegram_main(shutdown_event))
-        else:
-            logger.warning("Telegram Bot Polling 已禁用")
-
-        if ENABLE_QQ_NAPCAT:
-            tasks.append(napcatqq_main(shutdown_event))
-        else:
-            logger.warning("NapCatQQ 通道已禁用")
+        for channel in load_channels():
+            if channel.is_enabled():
+                tasks.append(run_channel(channel, shutdown_event))
+            else:
+                logger.info(f"渠道已禁用: {channel.name}")
 
         await asyncio.gather(*tasks)
     finally:
         logger.info("关闭 Amaya...")
 
+        await attachment_storage.close()
+        await memory_index.flush_index()
+
         logger.info("关闭数据库连接...")
         if db_config.conn is not None:
             await db_config.conn.close()
@@ -0,0 +1,202 @@
+"""数据库在线备份任务
+
+使用 SQLite 在线备份 API 定期为主库（以及已挂载的归档库）生成快照，并按数量轮转。
+
+- 备份在独立的只读源连接与工作线程中进行，不占用 Amaya 唯一的 aiosqlite 连接；
+- 每次只复制 BACKUP_PAGES_PER_STEP 页，每一步结束后都要等事件循环完成一次调度才继续，
+  事件循环繁忙时备份会自动放慢，从而不会拖慢 Agent；
+- 快照先写入临时文件，完成后再原子重命名，目录中只会出现完整的快照。
+
+- 备份期间源库被写入会使分步备份重新开始，超过 BACKUP_MAX_RESTARTS 次后改为一步复制完整快照，
+  避免持续写入时无限重来。
+
+指标说明：
+- writer_blocked_ms: 备份期间 Amaya 主连接上 commit() 的总耗时(writer_commits 为提交次数)，
+  即写入方在备份期间花在提交上的时间，包含提交本身的正常耗时，可与平时的平均提交耗时对比；
+- lock_held_ms: 所有步骤持有源库读锁的总时长；max_step_ms 为单步最长耗时。
+  WAL 模式(主库与归档库的默认配置)下读锁不阻塞写入；回滚日志模式下这段时间内写入方无法提交；
+- restarts: 备份期间源库被其它连接修改导致重新开始的次数；single_step 表示是否退回了一步复制。
+"""
+
+import asyncio
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config.settings import (
+    BACKUP_DIR,
+    BACKUP_INTERVAL_MINUTES,
+    BACKUP_KEEP,
+    BACKUP_MAX_RESTARTS,
+    BACKUP_PAGES_PER_STEP,
+)
+from logger import logger
+import storage.db_config as db_config
+
+__shutdown_event: asyncio.Event = None
+__backup_lock = asyncio.Lock()
+__last_result: dict[str, object] | None = None
+__backup_count = 0
+__failure_count = 0
+
+
+class _TooManyRestarts(Exception):
+    """在进度回调中抛出以中止分步备份"""
+
+
+def get_status() -> dict[str, object]:
+    running = __shutdown_event is not None and not __shutdown_event.is_set()
+    return {
+        "running": running,
+        "in_progress": __backup_lock.locked(),
+        "interval_minutes": BACKUP_INTERVAL_MINUTES,
+        "keep": BACKUP_KEEP,
+        "backup_count": __backup_count,
+        "failure_count": __failure_count,
+        "last": __last_result,
+    }
+
+
+def _backup_file(
+    source_path: str,
+    target_path: Path,
+    loop: asyncio.AbstractEventLoop,
+) -> dict[str, object]:
+    """在工作线程中执行分步备份，返回统计信息"""
+    steps = 0
+    restarts = 0
+    lock_held_ms = 0.0
+    max_step_ms = 0.0
+    last_remaining: int | None = None
+    step_started = time.perf_counter()
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal steps, restarts, lock_held_ms, max_step_ms, last_remaining, step_started
+        step_ms = (time.perf_counter() - step_started) * 1000
+        steps += 1
+        lock_held_ms += step_ms
+        max_step_ms = max(max_step_ms, step_ms)
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        # 等待事件循环完成一次调度后再继续下一步
+        if remaining > 0:
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result(timeout=30)
+        step_started = time.perf_counter()
+
+    tmp_path = target_path.with_name(target_path.name + ".tmp")
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    target = sqlite3.connect(tmp_path)
+    single_step = False
+    try:
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=progress, sleep=0)
+        except _TooManyRestarts:
+            logger.warning(
+                f"分步备份因源库持续写入已重新开始 {BACKUP_MAX_RESTARTS} 次，改为一步复制: source={source_path}"
+            )
+            single_step = True
+            step_started = time.perf_counter()
+            source.backup(target)
+            step_ms = (time.perf_counter() - step_started) * 1000
+            steps += 1
+            lock_held_ms += step_ms
+            max_step_ms = max(max_step_ms, step_ms)
+        pages = target.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+    tmp_path.replace(target_path)
+
+    return {
+        "file": str(target_path),
+        "pages": pages,
+        "steps": steps,
+        "restarts": restarts,
+        "single_step": single_step,
+        "lock_held_ms": round(lock_held_ms, 2),
+        "max_step_ms": round(max_step_ms, 3),
+    }
+
+
+def _rotate(backup_dir: Path, prefix: str) -> list[str]:
+    snapshots = sorted(backup_dir.glob(f"{prefix}-*.db"))
+    removed = []
+    for path in snapshots[:-BACKUP_KEEP] if BACKUP_KEEP > 0 else []:
+        path.unlink(missing_ok=True)
+        removed.append(path.name)
+    return removed
+
+
+async def run_once() -> dict[str, object]:
+    """立即执行一次备份（主库 + 归档库），返回统计信息"""
+    global __last_result, __backup_count, __failure_count
+    if db_config.db_path is None:
+        raise RuntimeError("数据库未初始化，请先调用 init_db()")
+
+    async with __backup_lock:
+        backup_dir = Path(BACKUP_DIR)
+        backup_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        sources = [db_config.db_path]
+        if db_config.archive_attached and db_config.archive_db_path:
+            sources.append(db_config.archive_db_path)
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        commit_count, commit_ms_total = db_config.commit_count, db_config.commit_ms_total
+        files: list[dict[str, object]] = []
+        try:
+            for source_path in sources:
+                prefix = Path(source_path).stem
+                target_path = backup_dir / f"{prefix}-{stamp}.db"
+                stats = await asyncio.to_thread(_backup_file, source_path, target_path, loop)
+                stats["rotated"] = _rotate(backup_dir, prefix)
+                files.append(stats)
+        except Exception:
+            __failure_count += 1
+            raise
+
+        result = {
+            "finished_at_epoch": time.time(),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            "writer_blocked_ms": round(db_config.commit_ms_total - commit_ms_total, 2),
+            "writer_commits": db_config.commit_count - commit_count,
+            "lock_held_ms": round(sum(float(f["lock_held_ms"]) for f in files), 2),
+            "files": files,
+        }
+        __last_result = result
+        __backup_count += 1
+        logger.info(
+            f"数据库备份完成: files={len(files)}, duration={result['duration_ms']}ms, "
+            f"writer_blocked={result['writer_blocked_ms']}ms/{result['writer_commits']} commits, "
+            f"lock_held={result['lock_held_ms']}ms"
+        )
+        return result
+
+
+async def main_loop(shutdown_event: asyncio.Event):
+    global __shutdown_event
+    __shutdown_event = shutdown_event
+    if BACKUP_INTERVAL_MINUTES <= 0:
+        logger.warning("数据库定期备份已禁用")
+        return
+    logger.info("数据库备份任务已启动")
+
+    while not shutdown_event.is_set():
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=BACKUP_INTERVAL_MINUTES * 60)
+        except asyncio.TimeoutError:
+            pass
+        if shutdown_event.is_set():
+            break
+
+        try:
+            await run_once()
+        except Exception as e:
+            logger.error(f"数据库备份失败: {e}", exc_info=e)
+
+    logger.info("数据库备份任务已关闭")
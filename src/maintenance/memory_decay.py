@@ -0,0 +1,113 @@
+"""记忆衰减任务
+
+定期按半衰期衰减事实型/情感型记忆的权重（工作型记忆不衰减），并将权重低于阈值的记忆点移入归档表，
+使在线记忆集合、Prompt 体积与查询开销长期保持有界。
+
+衰减系数由距上次执行的实际时长计算: factor = 0.5 ** (elapsed_days / half_life_days)，
+上次执行时间持久化在 system_state 中，因此停机期间的衰减会在重启后一次性补上。
+"""
+
+import asyncio
+import time
+
+from config.settings import (
+    MEMORY_ARCHIVE_WEIGHT_THRESHOLD,
+    MEMORY_DECAY_HALF_LIFE_DAYS,
+    MEMORY_DECAY_INTERVAL_MINUTES,
+)
+from logger import logger
+import storage.db_config as db_config
+import storage.memory_index as memory_index
+import storage.system_state as system_state
+import storage.work_memory as work_memory_storage
+
+_STATE_KEY = "memory_decay.last_run_at_epoch"
+_SAVEPOINT = "memory_decay"
+
+__shutdown_event: asyncio.Event = None
+__last_run_at_epoch: float | None = None
+__last_factor: float | None = None
+__last_decayed_count = 0
+__last_archived_count = 0
+__last_duration_ms: float | None = None
+__total_archived_count = 0
+
+
+def get_status() -> dict[str, object]:
+    running = __shutdown_event is not None and not __shutdown_event.is_set()
+    return {
+        "running": running,
+        "half_life_days": MEMORY_DECAY_HALF_LIFE_DAYS,
+        "interval_minutes": MEMORY_DECAY_INTERVAL_MINUTES,
+        "archive_threshold": MEMORY_ARCHIVE_WEIGHT_THRESHOLD,
+        "last_run_at_epoch": __last_run_at_epoch,
+        "last_factor": __last_factor,
+        "last_decayed_count": __last_decayed_count,
+        "last_archived_count": __last_archived_count,
+        "last_duration_ms": __last_duration_ms,
+        "total_archived_count": __total_archived_count,
+    }
+
+
+async def run_once() -> None:
+    """执行一次衰减与归档"""
+    global __last_run_at_epoch, __last_factor, __last_decayed_count, __last_archived_count
+    global __last_duration_ms, __total_archived_count
+
+    now = time.time()
+    raw_last = await system_state.get_state(_STATE_KEY)
+    if raw_last is None:
+        # 首次运行只记录起点，不做衰减
+        await system_state.set_state(_STATE_KEY, str(now))
+        __last_run_at_epoch = now
+        return
+
+    elapsed_days = max(0.0, now - float(raw_last)) / 86400.0
+    factor = 0.5 ** (elapsed_days / MEMORY_DECAY_HALF_LIFE_DAYS) if MEMORY_DECAY_HALF_LIFE_DAYS > 0 else 1.0
+
+    start = time.perf_counter()
+    # 衰减结果与本次运行时间在同一事务中提交：否则两次提交之间崩溃会让下次运行按旧的时间再衰减一遍。
+    # 连接是共享的，失败时只回滚到本任务的保存点，不影响其他协程尚未提交的写入
+    await db_config.conn.execute(f"SAVEPOINT {_SAVEPOINT}")
+    try:
+        decayed, archived_ids = await work_memory_storage.decay_memory_weights(
+            factor, MEMORY_ARCHIVE_WEIGHT_THRESHOLD, commit=False
+        )
+        await system_state.set_state(_STATE_KEY, str(now), commit=False)
+        await db_config.conn.execute(f"RELEASE {_SAVEPOINT}")
+    except Exception:
+        await db_config.conn.execute(f"ROLLBACK TO {_SAVEPOINT}")
+        await db_config.conn.execute(f"RELEASE {_SAVEPOINT}")
+        raise
+    await db_config.conn.commit()
+    await memory_index.remove_points(archived_ids)
+
+    __last_run_at_epoch = now
+    __last_factor = factor
+    __last_decayed_count = decayed
+    __last_archived_count = len(archived_ids)
+    __last_duration_ms = round((time.perf_counter() - start) * 1000, 2)
+    __total_archived_count += len(archived_ids)
+    logger.info(
+        f"记忆衰减完成: factor={factor:.4f}, decayed={decayed}, archived={len(archived_ids)}, "
+        f"cost={__last_duration_ms}ms"
+    )
+
+
+async def main_loop(shutdown_event: asyncio.Event):
+    global __shutdown_event
+    __shutdown_event = shutdown_event
+    logger.info("记忆衰减任务已启动")
+
+    while not shutdown_event.is_set():
+        try:
+            await run_once()
+        except Exception as e:
+            logger.error(f"记忆衰减执行失败: {e}", exc_info=e)
+
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=MEMORY_DECAY_INTERVAL_MINUTES * 60)
+        except asyncio.TimeoutError:
+            pass
+
+    logger.info("记忆衰减任务已关闭")
@@ -0,0 +1,70 @@
+"""消息冷热分离任务
+
+Amaya 规划回复时只读取最新的几十条消息，而管理端扫描、备份与 VACUUM 却要为全部历史买单。
+该任务定期把早于 MESSAGE_ARCHIVE_AFTER_DAYS 天的消息移动到 ATTACH 挂载的归档库，
+使热表保持小而常驻缓存；管理端通过 messages_all 视图仍可透明地检索归档消息。
+"""
+
+import asyncio
+import time
+
+from config.settings import MESSAGE_ARCHIVE_AFTER_DAYS, MESSAGE_ARCHIVE_INTERVAL_MINUTES
+from logger import logger
+import storage.message as message_storage
+
+__shutdown_event: asyncio.Event = None
+__last_run_at_epoch: float | None = None
+__last_moved_count = 0
+__last_duration_ms: float | None = None
+__total_moved_count = 0
+
+
+def get_status() -> dict[str, object]:
+    running = __shutdown_event is not None and not __shutdown_event.is_set()
+    return {
+        "running": running,
+        "archive_after_days": MESSAGE_ARCHIVE_AFTER_DAYS,
+        "interval_minutes": MESSAGE_ARCHIVE_INTERVAL_MINUTES,
+        "last_run_at_epoch": __last_run_at_epoch,
+        "last_moved_count": __last_moved_count,
+        "last_duration_ms": __last_duration_ms,
+        "total_moved_count": __total_moved_count,
+    }
+
+
+async def run_once() -> None:
+    """执行一次归档"""
+    global __last_run_at_epoch, __last_moved_count, __last_duration_ms, __total_moved_count
+
+    now = time.time()
+    start = time.perf_counter()
+    moved = await message_storage.archive_messages_before(now - MESSAGE_ARCHIVE_AFTER_DAYS * 86400)
+
+    __last_run_at_epoch = now
+    __last_moved_count = moved
+    __last_duration_ms = round((time.perf_counter() - start) * 1000, 2)
+    __total_moved_count += moved
+    if moved:
+        logger.info(f"消息归档完成: moved={moved}, cost={__last_duration_ms}ms")
+
+
+async def main_loop(shutdown_event: asyncio.Event):
+    global __shutdown_event
+    __shutdown_event = shutdown_event
+    if MESSAGE_ARCHIVE_AFTER_DAYS <= 0:
+        logger.warning("消息归档已禁用")
+        return
+    logger.info("消息归档任务已启动")
+
+    while not shutdown_event.is_set():
+        try:
+            await run_once()
+        except Exception as e:
+            logger.error(f"消息归档执行失败: {e}", exc_info=e)
+
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=MESSAGE_ARCHIVE_INTERVAL_MINUTES * 60)
+        except asyncio.TimeoutError:
+            pass
+
+    logger.info("消息归档任务已关闭")
@@ -4,8 +4,68 @@
 
 from __future__ import annotations
 
+import bisect
+import math
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+
+class Histogram:
+    """固定分桶直方图，记录次数、总和、最值以及各桶计数（桶上界单位与 observe 的输入一致）"""
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.total = 0.0
+        self.min: float | None = None
+        self.max: float | None = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> float | None:
+        """按桶上界估算分位数(不超过观测到的最大值)，落入 +Inf 桶时返回最大值"""
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        def fmt(v: float | None) -> float | None:
+            return None if v is None else round(v, 2)
+
+        cumulative = 0
+        buckets: dict[str, int] = {}
+        for bound, n in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.total, 2),
+            "avg": fmt(self.total / self.count) if self.count else None,
+            "min": fmt(self.min),
+            "max": fmt(self.max),
+            "p50": fmt(self.quantile(0.5)),
+            "p99": fmt(self.quantile(0.99)),
+            "buckets": buckets,  # 累计计数: 上界 -> 小于等于该上界的次数
+        }
+
+
+# 提醒与延时事件触发延迟(毫秒)的分桶上界，发件箱送达耗时同样使用
+REMINDER_LATENESS_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# 事件总线处理器耗时(毫秒)的分桶上界
+BUS_HANDLER_LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
 
 
 @dataclass
@@ -17,6 +77,7 @@ class RuntimeMetrics:
     msg_out_count: int = 0
     reminder_triggered_count: int = 0
     last_llm_call_at: float | None = None
+    reminder_lateness_ms: Histogram = field(default_factory=lambda: Histogram(REMINDER_LATENESS_BUCKETS_MS))
 
     def record_llm_call(self, latency_ms: float, error: bool = False) -> None:
         self.llm_call_count += 1
@@ -34,6 +95,9 @@ class RuntimeMetrics:
     def record_reminder_triggered(self) -> None:
         self.reminder_triggered_count += 1
 
+    def record_reminder_lateness(self, lateness_ms: float) -> None:
+        self.reminder_lateness_ms.observe(max(0.0, lateness_ms))
+
     def snapshot(self) -> dict:
         avg_latency_ms = 0.0
         if self.llm_call_count > 0:
@@ -50,6 +114,7 @@ class RuntimeMetrics:
             "msg_in_count": self.msg_in_count,
             "msg_out_count": self.msg_out_count,
             "reminder_triggered_count": self.reminder_triggered_count,
+            "reminder_lateness_ms": self.reminder_lateness_ms.snapshot(),
             "last_llm_call_at_epoch": self.last_llm_call_at,
             "last_llm_call_at_utc": (
                 time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.last_llm_call_at))
@@ -62,4 +127,4 @@ class RuntimeMetrics:
 runtime_metrics = RuntimeMetrics()
 
 
-__all__ = ["RuntimeMetrics", "runtime_metrics"]
\ No newline at end of file
+__all__ = ["Histogram", "RuntimeMetrics", "runtime_metrics"]
\ No newline at end of file
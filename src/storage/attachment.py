@@ -0,0 +1,231 @@
+"""附件缓存
+
+渠道收到的图片与文件以流式方式下载到磁盘缓存，不在内存中保留整份内容：
+- 下载时边写临时文件边计算 SHA-256，完成后以摘要作为 cache_name 原子重命名(内容寻址)，
+  同一内容无论来源与重复次数只保存一份；
+- 缓存目录总大小超过 ATTACHMENT_CACHE_MAX_MB 时按最近使用时间(文件 mtime)淘汰最久未用的文件；
+- 事件总线与消息记录中只传递引用 {mime_type, cache_name}，需要内容时用 resolve() 取得文件路径，
+  已被淘汰的附件返回 None。
+
+download() 可传入自定义的 httpx.AsyncClient(例如指向本地 HTTP 服务或使用 httpx.MockTransport)，
+未传入时使用模块内共享的客户端，停机时由 close() 关闭。
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import httpx
+from ulid import ULID
+
+from config.settings import (
+    ATTACHMENT_CACHE_DIR,
+    ATTACHMENT_CACHE_MAX_MB,
+    ATTACHMENT_DOWNLOAD_TIMEOUT_SECONDS,
+    ATTACHMENT_MAX_FILE_MB,
+)
+from logger import logger
+from metrics import Histogram
+
+__all__ = ["close", "describe", "download", "get_status", "resolve"]
+
+_CHUNK_SIZE = 64 * 1024
+_TMP_DIR_NAME = ".tmp"
+_DEFAULT_MIME_TYPE = "application/octet-stream"
+
+_cache_dir = Path(ATTACHMENT_CACHE_DIR)
+_max_cache_bytes = ATTACHMENT_CACHE_MAX_MB * 1024 * 1024
+_max_file_bytes = ATTACHMENT_MAX_FILE_MB * 1024 * 1024
+
+_client: httpx.AsyncClient | None = None
+_index: OrderedDict[str, int] | None = None  # cache_name -> 字节数，按最近使用排序(最旧在前)
+_index_lock = asyncio.Lock()
+_total_bytes = 0
+__download_count = 0
+__dedup_count = 0
+__failed_count = 0
+__evicted_count = 0
+__downloaded_bytes = 0
+__download_latency_ms = Histogram((50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000))
+
+
+def get_status() -> dict[str, object]:
+    return {
+        "cache_dir": str(_cache_dir),
+        "file_count": None if _index is None else len(_index),
+        "total_bytes": None if _index is None else _total_bytes,
+        "max_bytes": _max_cache_bytes,
+        "download_count": __download_count,
+        "dedup_count": __dedup_count,
+        "failed_count": __failed_count,
+        "evicted_count": __evicted_count,
+        "downloaded_bytes": __downloaded_bytes,
+        "download_latency_ms": __download_latency_ms.snapshot(),
+    }
+
+
+def describe(attachments: list[dict[str, str]] | None) -> str:
+    """给模型看的附件占位文本，如 "[图片]"、"[文件: application/pdf]" """
+    parts = []
+    for item in attachments or []:
+        mime_type = item.get("mime_type", _DEFAULT_MIME_TYPE)
+        parts.append("[图片]" if mime_type.startswith("image/") else f"[文件: {mime_type}]")
+    return "".join(parts)
+
+
+def _scan_cache_dir() -> OrderedDict[str, int]:
+    """在工作线程中调用：建立缓存索引，清理上次进程残留的临时文件"""
+    (_cache_dir / _TMP_DIR_NAME).mkdir(parents=True, exist_ok=True)
+    for tmp in (_cache_dir / _TMP_DIR_NAME).iterdir():
+        tmp.unlink(missing_ok=True)
+
+    entries = []
+    for path in _cache_dir.iterdir():
+        if not path.is_file():
+            continue
+        stat = path.stat()
+        entries.append((stat.st_mtime, path.name, stat.st_size))
+    entries.sort()
+    return OrderedDict((name, size) for _, name, size in entries)
+
+
+async def _ensure_index() -> OrderedDict[str, int]:
+    global _index, _total_bytes
+    if _index is not None:
+        return _index
+    async with _index_lock:
+        if _index is None:
+            index = await asyncio.to_thread(_scan_cache_dir)
+            _total_bytes = sum(index.values())
+            _index = index
+            logger.info(f"附件缓存已加载: files={len(index)}, bytes={_total_bytes}")
+    return _index
+
+
+def _touch(index: OrderedDict[str, int], cache_name: str) -> None:
+    index.move_to_end(cache_name)
+    try:
+        os.utime(_cache_dir / cache_name)  # 持久化最近使用时间，重启后淘汰顺序不变
+    except OSError:
+        pass
+
+
+def _evict(index: OrderedDict[str, int], keep: str) -> list[str]:
+    """超过缓存上限时按最近使用顺序从索引中淘汰，刚写入的附件除外；返回需要删除的文件，由调用方在工作线程中删除"""
+    global _total_bytes, __evicted_count
+    evicted = []
+    while _total_bytes > _max_cache_bytes and len(index) > 1:
+        cache_name = next(iter(index))
+        if cache_name == keep:
+            index.move_to_end(keep)
+            continue
+        size = index.pop(cache_name)
+        _total_bytes -= size
+        __evicted_count += 1
+        evicted.append(cache_name)
+    return evicted
+
+
+def _unlink_evicted(cache_names: list[str]) -> None:
+    for cache_name in cache_names:
+        try:
+            (_cache_dir / cache_name).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"删除附件缓存失败: cache_name={cache_name}, error={e}")
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=ATTACHMENT_DOWNLOAD_TIMEOUT_SECONDS, follow_redirects=True)
+    return _client
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _write_chunk(f, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    f.write(chunk)
+
+
+async def _stream_to_file(client: httpx.AsyncClient, url: str, tmp_path: Path) -> tuple[str, int, str | None]:
+    """流式写入临时文件，返回 (sha256, 字节数, 响应 Content-Type)"""
+    digest = hashlib.sha256()
+    size = 0
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        content_length = response.headers.get("Content-Length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > _max_file_bytes:
+            raise ValueError(f"附件超过大小上限: {content_length} > {_max_file_bytes} 字节")
+        # 文件打开、写入与摘要计算都在工作线程中进行，慢速磁盘不会阻塞事件循环
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                size += len(chunk)
+                if size > _max_file_bytes:
+                    raise ValueError(f"附件超过大小上限: > {_max_file_bytes} 字节")
+                await asyncio.to_thread(_write_chunk, f, digest, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+        content_type = response.headers.get("Content-Type")
+    return digest.hexdigest(), size, content_type
+
+
+async def download(url: str, mime_type: str | None = None, client: httpx.AsyncClient | None = None) -> dict[str, str]:
+    """下载 url 到附件缓存，返回附件引用 {mime_type, cache_name}
+
+    mime_type 未指定时取响应的 Content-Type。下载失败或超过 ATTACHMENT_MAX_FILE_MB 时抛出异常，
+    临时文件会被清理。
+    """
+    global _total_bytes, __download_count, __dedup_count, __failed_count, __downloaded_bytes
+    index = await _ensure_index()
+    tmp_path = _cache_dir / _TMP_DIR_NAME / str(ULID())
+    started = time.perf_counter()
+    try:
+        sha256, size, content_type = await _stream_to_file(client or _get_client(), url, tmp_path)
+    except Exception:
+        __failed_count += 1
+        await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+        raise
+
+    __download_count += 1
+    __downloaded_bytes += size
+    __download_latency_ms.observe((time.perf_counter() - started) * 1000)
+
+    if sha256 in index and (_cache_dir / sha256).exists():
+        await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+        __dedup_count += 1
+        _touch(index, sha256)
+    else:
+        await asyncio.to_thread(os.replace, tmp_path, _cache_dir / sha256)
+        _total_bytes += size - index.pop(sha256, 0)
+        index[sha256] = size
+        evicted = _evict(index, keep=sha256)
+        if evicted:
+            await asyncio.to_thread(_unlink_evicted, evicted)
+
+    if mime_type is None:
+        mime_type = (content_type or _DEFAULT_MIME_TYPE).split(";", 1)[0].strip() or _DEFAULT_MIME_TYPE
+    return {"mime_type": mime_type, "cache_name": sha256}
+
+
+async def resolve(cache_name: str) -> Path | None:
+    """取得附件在缓存中的路径并刷新最近使用时间；已淘汰或不存在时返回 None"""
+    global _total_bytes
+    index = await _ensure_index()
+    if cache_name not in index:
+        return None
+    path = _cache_dir / cache_name
+    if not path.exists():
+        _total_bytes -= index.pop(cache_name)
+        return None
+    _touch(index, cache_name)
+    return path
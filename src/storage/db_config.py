@@ -1,30 +1,99 @@
 import aiosqlite
 import os
+import sqlite3
+import time
 
 conn: aiosqlite.Connection | None = None
+db_path: str | None = None
+archive_db_path: str | None = None
+archive_attached = False
+# 主连接上 commit() 的累计次数与耗时(毫秒)，后台任务(如备份)取前后差值评估自己对写入方的影响
+commit_count = 0
+commit_ms_total = 0.0
 
-async def init_db(db_path: str) -> None:
-    db_dir = os.path.dirname(db_path)
+
+class _TimedConnection(aiosqlite.Connection):
+    async def commit(self) -> None:
+        global commit_count, commit_ms_total
+        started = time.perf_counter()
+        try:
+            await super().commit()
+        finally:
+            commit_count += 1
+            commit_ms_total += (time.perf_counter() - started) * 1000
+
+# (目标版本, 迁移脚本)，按版本顺序执行
+_MIGRATIONS = [
+    (2, 'src/storage/sql/db_migrate_v2.sql'),
+    (3, 'src/storage/sql/db_migrate_v3.sql'),
+    (4, 'src/storage/sql/db_migrate_v4.sql'),
+    (5, 'src/storage/sql/db_migrate_v5.sql'),
+    (6, 'src/storage/sql/db_migrate_v6.sql'),
+    (7, 'src/storage/sql/db_migrate_v7.sql'),
+    (8, 'src/storage/sql/db_migrate_v8.sql'),
+]
+
+async def _run_script(script_path: str, version: int) -> None:
+    """在一个显式事务中执行建表/迁移脚本并更新 user_version
+
+    重建表(DROP/RENAME)的迁移中途失败或进程退出时整体回滚，版本号保持不变，下次启动从完整的旧结构重新迁移。
+    事务内 PRAGMA foreign_keys 不生效，迁移期间外键检查保持连接默认的关闭状态，重建表不会触发级联。
+    """
+    with open(script_path, 'r', encoding='utf-8') as f:
+        script = f.read()
+    try:
+        await conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+    except Exception:
+        if conn.in_transaction:
+            await conn.rollback()
+        raise
+
+
+async def init_db(path: str, archive_path: str | None = None) -> None:
+    db_dir = os.path.dirname(path)
     if not os.path.exists(db_dir):
         os.makedirs(db_dir, exist_ok=True)
-    global conn
-    conn = await aiosqlite.connect(db_path)
+    global conn, db_path
+    conn = await _TimedConnection(lambda: sqlite3.connect(path), iter_chunk_size=64)
+    db_path = path
 
     async with conn.execute("PRAGMA user_version") as cursor:
         row = await cursor.fetchone()
         user_version = row[0]
 
         if user_version == 0:
-            with open('src/storage/sql/db_init_v1.sql', 'r', encoding='utf-8') as f:
-                init_sql = f.read()
-                await conn.executescript(init_sql)
-            await conn.execute("PRAGMA user_version = 1")
+            await _run_script('src/storage/sql/db_init_v1.sql', 1)
+
+        for version, script_path in _MIGRATIONS:
+            if user_version < version:
+                await _run_script(script_path, version)
 
-        if user_version <= 1:  # 数据库初始版本
-            with open('src/storage/sql/db_preconfig_v1.sql', 'r', encoding='utf-8') as f:
-                init_sql = f.read()
-                await conn.executescript(init_sql)
+        # 连接级配置，每次启动都需要执行
+        with open('src/storage/sql/db_preconfig_v1.sql', 'r', encoding='utf-8') as f:
+            init_sql = f.read()
+            await conn.executescript(init_sql)
 
         await conn.commit()
 
-__all__ = ["conn", "init_db"]
+    if archive_path is not None:
+        await attach_archive(archive_path)
+
+
+async def attach_archive(path: str) -> None:
+    """挂载冷数据归档库（archive），并创建热/冷统一视图"""
+    archive_dir = os.path.dirname(path)
+    if archive_dir and not os.path.exists(archive_dir):
+        os.makedirs(archive_dir, exist_ok=True)
+    global archive_attached, archive_db_path
+    await conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    with open('src/storage/sql/db_archive_v1.sql', 'r', encoding='utf-8') as f:
+        archive_sql = f.read()
+        await conn.executescript(archive_sql)
+    await conn.commit()
+    archive_attached = True
+    archive_db_path = path
+
+__all__ = [
+    "conn", "db_path", "archive_db_path", "archive_attached", "commit_count", "commit_ms_total",
+    "init_db", "attach_archive",
+]
@@ -0,0 +1,320 @@
+"""记忆点本地相似度索引
+
+不依赖任何网络模型，使用“字符 n-gram 哈希”把记忆点(锚点 + 内容)映射为定长向量：
+1. 对文本取 1~3 字符的 n-gram，用 crc32 哈希到 [0, dim) 的槽位，并由哈希的最高位决定正负号；
+2. 向量做 L2 归一化，因此余弦相似度就是点积；
+3. 所有向量存放在一块连续的 float32 矩阵中，查询时一次矩阵-向量乘法即可得到全部得分。
+
+磁盘布局(index_dir 下)：
+- vectors.npy: (capacity, dim) float32 矩阵；
+- ids.npy: (capacity,) int64，记录每行对应的 memory_point_id，空行为 -1；
+- hashes.npy: (capacity,) uint32，记录每行文本的 crc32，用于启动时校验内容是否变化。
+
+启动时以内存映射方式打开上述文件，仅对与数据库不一致的记忆点重新计算向量；
+写入记忆点时就地更新对应的行并延迟批量刷盘，容量不足时按倍数扩容(刷盘与扩容都在工作线程中进行)。
+
+维度较小时不同 n-gram 会大量落入同一槽位(MEMORY_INDEX_DIM=128 时 1~3-gram 的碰撞很常见)，
+相似度会偏高且区分度下降；默认使用 512 维，召回仍与词面匹配取较大值(见 core.memory_recall)。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+import storage.db_config as db_config
+from config.settings import MEMORY_INDEX_DIM
+from logger import logger
+
+__all__ = [
+    "MemoryIndex", "embed_text",
+    "init_index", "upsert_point", "remove_points", "flush_index", "search", "get_status",
+]
+
+_NGRAM_SIZES = (1, 2, 3)
+_INITIAL_CAPACITY = 1024
+
+
+def _point_text(anchor: str, content: str) -> str:
+    return f"{anchor} {content}"
+
+
+def _text_hash(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def embed_text(text: str, dim: int = MEMORY_INDEX_DIM) -> np.ndarray:
+    """将文本编码为 L2 归一化的哈希 n-gram 向量"""
+    vec = np.zeros(dim, dtype=np.float32)
+    normalized = " ".join(text.lower().split())
+    for n in _NGRAM_SIZES:
+        for i in range(len(normalized) - n + 1):
+            gram = normalized[i:i + n]
+            if gram.isspace():
+                continue
+            h = zlib.crc32(gram.encode("utf-8"))
+            vec[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = float(np.linalg.norm(vec))
+    if norm > 0.0:
+        vec /= norm
+    return vec
+
+
+class MemoryIndex:
+    def __init__(self, index_dir: str | os.PathLike, dim: int = MEMORY_INDEX_DIM) -> None:
+        self.index_dir = Path(index_dir)
+        self.dim = dim
+        self._vectors: np.memmap | None = None
+        self._ids: np.memmap | None = None
+        self._hashes: np.memmap | None = None
+        self._rows: dict[int, int] = {}  # memory_point_id -> 行号
+        self._free_rows: list[int] = []
+        self._size = 0  # 已使用过的最大行号 + 1，查询只扫描 [0, _size)
+        self.last_search_ms: float | None = None
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._ids is None else int(self._ids.shape[0])
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _paths(self) -> tuple[Path, Path, Path]:
+        return (
+            self.index_dir / "vectors.npy",
+            self.index_dir / "ids.npy",
+            self.index_dir / "hashes.npy",
+        )
+
+    def _create_files(self, capacity: int) -> None:
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        vectors_path, ids_path, hashes_path = self._paths()
+        vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        ids = np.lib.format.open_memmap(ids_path, mode="w+", dtype=np.int64, shape=(capacity,))
+        hashes = np.lib.format.open_memmap(hashes_path, mode="w+", dtype=np.uint32, shape=(capacity,))
+        ids[:] = -1
+        self._vectors, self._ids, self._hashes = vectors, ids, hashes
+        self._rows = {}
+        self._free_rows = []
+        self._size = 0
+
+    def open(self) -> bool:
+        """以内存映射方式打开已有索引，返回是否成功"""
+        vectors_path, ids_path, hashes_path = self._paths()
+        if not (vectors_path.exists() and ids_path.exists() and hashes_path.exists()):
+            return False
+        try:
+            vectors = np.load(vectors_path, mmap_mode="r+")
+            ids = np.load(ids_path, mmap_mode="r+")
+            hashes = np.load(hashes_path, mmap_mode="r+")
+        except (OSError, ValueError) as e:
+            logger.warning(f"记忆索引文件损坏，将重建: {e}")
+            return False
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim or not (vectors.shape[0] == ids.shape[0] == hashes.shape[0]):
+            logger.warning(f"记忆索引维度不匹配，将重建: shape={vectors.shape}, dim={self.dim}")
+            return False
+
+        self._vectors, self._ids, self._hashes = vectors, ids, hashes
+        used = np.flatnonzero(ids >= 0)
+        self._size = int(used[-1]) + 1 if used.size else 0
+        self._rows = {int(ids[row]): int(row) for row in used}
+        self._free_rows = [row for row in range(self._size) if ids[row] < 0]
+        return True
+
+    def _grow(self, min_capacity: int = 0) -> None:
+        """扩容：先写好新文件再整体替换，替换前的查询仍读取旧映射，不会看到不完整的状态"""
+        new_capacity = max(_INITIAL_CAPACITY, self.capacity * 2)
+        while new_capacity < min_capacity:
+            new_capacity *= 2
+        logger.debug(f"记忆索引扩容: {self.capacity} -> {new_capacity}")
+        vectors_path, ids_path, hashes_path = self._paths()
+        tmp_paths = [p.with_suffix(".tmp.npy") for p in (vectors_path, ids_path, hashes_path)]
+
+        vectors = np.lib.format.open_memmap(tmp_paths[0], mode="w+", dtype=np.float32, shape=(new_capacity, self.dim))
+        ids = np.lib.format.open_memmap(tmp_paths[1], mode="w+", dtype=np.int64, shape=(new_capacity,))
+        hashes = np.lib.format.open_memmap(tmp_paths[2], mode="w+", dtype=np.uint32, shape=(new_capacity,))
+        ids[:] = -1
+        n = self._size
+        if self._ids is not None and n:
+            vectors[:n] = self._vectors[:n]
+            ids[:n] = self._ids[:n]
+            hashes[:n] = self._hashes[:n]
+        for arr in (vectors, ids, hashes):
+            arr.flush()
+
+        # 映射跟随文件本身，重命名后仍然有效；旧文件在旧映射释放后由系统回收
+        for tmp, final in zip(tmp_paths, (vectors_path, ids_path, hashes_path)):
+            os.replace(tmp, final)
+        self._vectors, self._ids, self._hashes = vectors, ids, hashes
+
+    def needs_grow(self, point_id: int) -> bool:
+        return point_id not in self._rows and not self._free_rows and self._size >= self.capacity
+
+    def _alloc_row(self) -> int:
+        if self._free_rows:
+            return self._free_rows.pop()
+        if self._size >= self.capacity:
+            self._grow()
+        row = self._size
+        self._size += 1
+        return row
+
+    def upsert(self, point_id: int, anchor: str, content: str, flush: bool = True) -> None:
+        text = _point_text(anchor, content)
+        row = self._rows.get(point_id)
+        if row is None:
+            row = self._alloc_row()
+            self._rows[point_id] = row
+        self._vectors[row] = embed_text(text, self.dim)
+        self._ids[row] = point_id
+        self._hashes[row] = _text_hash(text)
+        if flush:
+            self.flush()
+
+    def remove(self, point_ids: list[int], flush: bool = True) -> None:
+        for point_id in point_ids:
+            row = self._rows.pop(point_id, None)
+            if row is None:
+                continue
+            self._vectors[row] = 0.0
+            self._ids[row] = -1
+            self._hashes[row] = 0
+            self._free_rows.append(row)
+        if flush:
+            self.flush()
+
+    def flush(self) -> None:
+        for arr in (self._vectors, self._ids, self._hashes):
+            if arr is not None:
+                arr.flush()
+
+    def search(self, text: str, k: int) -> list[tuple[int, float]]:
+        """返回与 text 余弦相似度最高的 k 个 (memory_point_id, score)"""
+        if not self._rows or k <= 0:
+            return []
+        start = time.perf_counter()
+        query = embed_text(text, self.dim)
+        scores = np.asarray(self._vectors)[:self._size] @ query
+        k = min(k, self._size)
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        ids = self._ids[top]
+        results = [(int(pid), float(scores[row])) for pid, row in zip(ids, top) if pid >= 0]
+        self.last_search_ms = (time.perf_counter() - start) * 1000
+        return results
+
+    def sync(self, points: list[tuple[int, str, str]]) -> tuple[int, int]:
+        """与数据库中的记忆点对齐，只重算缺失或内容变化的行；返回 (更新数, 删除数)"""
+        if len(points) > self.capacity:
+            self._grow(len(points))
+
+        db_ids: set[int] = set()
+        updated = 0
+        for point_id, anchor, content in points:
+            db_ids.add(point_id)
+            row = self._rows.get(point_id)
+            if row is not None and int(self._hashes[row]) == _text_hash(_point_text(anchor, content)):
+                continue
+            self.upsert(point_id, anchor, content, flush=False)
+            updated += 1
+
+        stale = [point_id for point_id in self._rows if point_id not in db_ids]
+        self.remove(stale)
+        return updated, len(stale)
+
+
+index: MemoryIndex | None = None
+# 写入只改内存映射中的行，合并为每 _FLUSH_DELAY_SECONDS 至多一次 msync；扩容与 msync 都放到工作线程，
+# 写锁保证二者执行期间事件循环上没有其他写入(查询不受影响)。进程崩溃时未刷盘的修改在下次启动的 sync 中补齐
+_FLUSH_DELAY_SECONDS = 1.0
+_write_lock = asyncio.Lock()
+_flush_task: asyncio.Task | None = None
+_dirty = False
+
+
+async def init_index(index_dir: str) -> None:
+    """打开(或重建)记忆索引，并与数据库中的记忆点同步"""
+    global index
+    if db_config.conn is None:
+        raise RuntimeError("数据库未初始化，请先调用 init_db()")
+
+    async with db_config.conn.execute("SELECT memory_point_id, anchor, content FROM memory_points") as cursor:
+        points = [(row[0], row[1], row[2]) for row in await cursor.fetchall()]
+
+    start = time.perf_counter()
+    new_index = MemoryIndex(index_dir)
+    if not await asyncio.to_thread(new_index.open):
+        await asyncio.to_thread(new_index._create_files, _INITIAL_CAPACITY)
+    updated, removed = await asyncio.to_thread(new_index.sync, points)
+    index = new_index
+    logger.info(
+        f"记忆索引已就绪: points={len(new_index)}, dim={new_index.dim}, "
+        f"updated={updated}, removed={removed}, cost={(time.perf_counter() - start) * 1000:.1f}ms"
+    )
+
+
+async def _flush_later() -> None:
+    await asyncio.sleep(_FLUSH_DELAY_SECONDS)
+    await flush_index()
+
+
+def _schedule_flush() -> None:
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_later(), name="memory-index-flush")
+
+
+async def flush_index() -> None:
+    """把已修改的行写回磁盘(msync)，在工作线程中执行"""
+    global _dirty
+    if index is None or not _dirty:
+        return
+    async with _write_lock:
+        _dirty = False
+        await asyncio.to_thread(index.flush)
+
+
+async def upsert_point(point_id: int, anchor: str, content: str) -> None:
+    global _dirty
+    if index is None:
+        return
+    async with _write_lock:
+        if index.needs_grow(point_id):
+            await asyncio.to_thread(index._grow)
+        index.upsert(point_id, anchor, content, flush=False)
+        _dirty = True
+    _schedule_flush()
+
+
+async def remove_points(point_ids: list[int]) -> None:
+    global _dirty
+    if index is None or not point_ids:
+        return
+    async with _write_lock:
+        index.remove(point_ids, flush=False)
+        _dirty = True
+    _schedule_flush()
+
+
+def search(text: str, k: int) -> list[tuple[int, float]]:
+    if index is None:
+        return []
+    return index.search(text, k)
+
+
+def get_status() -> dict[str, object]:
+    if index is None:
+        return {"ready": False, "points": 0, "capacity": 0, "dim": MEMORY_INDEX_DIM, "last_search_ms": None}
+    return {
+        "ready": True,
+        "points": len(index),
+        "capacity": index.capacity,
+        "dim": index.dim,
+        "flush_pending": _dirty,
+        "last_search_ms": None if index.last_search_ms is None else round(index.last_search_ms, 3),
+    }
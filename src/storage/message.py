@@ -1,14 +1,18 @@
 import storage.db_config as db_config
 from logger import logger
 from ulid import ULID
-import json
+import asyncio
 from typing import Any
 
+from codec import JSONDecodeError, dumps, loads
+
 __all__ = [
     "create_message",
     "get_recent_messages",
     "get_message_by_id",
     "get_latest_route",
+    "has_user_message_since",
+    "archive_messages_before",
 ]
 
 
@@ -16,17 +20,85 @@ def _ensure_conn():
     if db_config.conn is None:
         raise RuntimeError("数据库未初始化，请先调用 init_db()")
 
+def _message_tables() -> tuple[str, ...]:
+    if db_config.archive_attached:
+        return ("main.messages", "archive.messages")
+    return ("main.messages",)
+
 def _loads_metadata(raw_metadata: str | None) -> dict[str, Any] | None:
     if raw_metadata is None or raw_metadata.strip() == "":
         return None
     try:
-        loaded = json.loads(raw_metadata)
-    except json.JSONDecodeError:
+        loaded = loads(raw_metadata)
+    except JSONDecodeError:
         logger.warning("消息 metadata 解析失败，已忽略")
         return None
     return loaded if isinstance(loaded, dict) else None
 
 
+class _MessageRow(dict):
+    """
+    查询结果中的一行消息。metadata 在首次访问时才解析：多数调用方(如组装 LLM 上下文)只读取角色和内容，
+    不必为每一行都解析一次 JSON。遍历、取长度等需要完整视图的操作会先完成解析
+    """
+
+    __slots__ = ("_raw_metadata",)
+
+    def __init__(self, raw_metadata: str | None, **fields: Any) -> None:
+        super().__init__(**fields)
+        self._raw_metadata = raw_metadata
+
+    def _decode(self) -> None:
+        if not dict.__contains__(self, "metadata"):
+            dict.__setitem__(self, "metadata", _loads_metadata(self._raw_metadata))
+
+    def __missing__(self, key: str) -> Any:
+        if key != "metadata":
+            raise KeyError(key)
+        self._decode()
+        return dict.__getitem__(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "metadata":
+            self._decode()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key: object) -> bool:
+        return key == "metadata" or dict.__contains__(self, key)
+
+    def __iter__(self):
+        self._decode()
+        return dict.__iter__(self)
+
+    def __len__(self) -> int:
+        self._decode()
+        return dict.__len__(self)
+
+    def __repr__(self) -> str:
+        self._decode()
+        return dict.__repr__(self)
+
+    def __eq__(self, other: object) -> bool:
+        self._decode()
+        return dict.__eq__(self, other)
+
+    def keys(self):
+        self._decode()
+        return dict.keys(self)
+
+    def values(self):
+        self._decode()
+        return dict.values(self)
+
+    def items(self):
+        self._decode()
+        return dict.items(self)
+
+    def copy(self) -> dict:
+        self._decode()
+        return dict(dict.items(self))
+
+
 async def create_message(
     channel: str,
     role: str,
@@ -40,7 +112,7 @@ async def create_message(
         return ""
 
     message_id = str(ULID())
-    metadata_json = json.dumps(metadata, ensure_ascii=False) if metadata is not None else None
+    metadata_json = dumps(metadata) if metadata is not None else None
     await db_config.conn.execute(
         "INSERT INTO messages (message_id, channel, metadata, role, content) VALUES (?, ?, ?, ?, ?)",
         (message_id, channel, metadata_json, role, content)
@@ -49,71 +121,143 @@ async def create_message(
     return message_id
 
 async def get_recent_messages(limit: int = 50) -> list[dict]:
-    """获取最近的消息记录，按 ULID 排列"""
+    """获取最近的消息记录，按 ULID 从新到旧排列（热表不足 limit 条时从归档库补足更早的消息）"""
     _ensure_conn()
     messages = []
-    async with db_config.conn.execute(
-        (
-            "SELECT message_id, channel, metadata, role, content, created_at_utc "
-            "FROM messages ORDER BY message_id DESC LIMIT ?"
-        ),
-        (limit,)
-    ) as cursor:
-        async for row in cursor:
-            messages.append({
-                "message_id": row[0],
-                "channel": row[1],
-                "metadata": _loads_metadata(row[2]),
-                "role": row[3],
-                "content": row[4],
-                "created_at_utc": row[5],
-            })
+    for table in _message_tables():
+        remaining = limit - len(messages)
+        if remaining <= 0:
+            break
+        # 归档库中的消息都早于热表，按热表最旧一条的 ID 向前接续
+        before_id = messages[-1]["message_id"] if messages else None
+        async with db_config.conn.execute(
+            (
+                "SELECT message_id, channel, metadata, role, content, created_at_utc "
+                f"FROM {table} {'WHERE message_id < ? ' if before_id is not None else ''}"
+                "ORDER BY message_id DESC LIMIT ?"
+            ),
+            (before_id, remaining) if before_id is not None else (remaining,)
+        ) as cursor:
+            async for row in cursor:
+                messages.append(_MessageRow(
+                    row[2],
+                    message_id=row[0],
+                    channel=row[1],
+                    role=row[3],
+                    content=row[4],
+                    created_at_utc=row[5],
+                ))
     return messages
 
 
 async def get_message_by_id(message_id: str) -> dict | None:
-    """通过消息 ID 获取单条消息"""
+    """通过消息 ID 获取单条消息（热表未命中时查找归档库）"""
     _ensure_conn()
-    async with db_config.conn.execute(
-        (
-            "SELECT message_id, channel, metadata, role, content, created_at_utc "
-            "FROM messages WHERE message_id = ? LIMIT 1"
-        ),
-        (message_id,)
-    ) as cursor:
-        row = await cursor.fetchone()
+    row = None
+    for table in _message_tables():
+        async with db_config.conn.execute(
+            (
+                "SELECT message_id, channel, metadata, role, content, created_at_utc "
+                f"FROM {table} WHERE message_id = ? LIMIT 1"
+            ),
+            (message_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is not None:
+            break
 
     if row is None:
         return None
 
-    return {
-        "message_id": row[0],
-        "channel": row[1],
-        "metadata": _loads_metadata(row[2]),
-        "role": row[3],
-        "content": row[4],
-        "created_at_utc": row[5],
-    }
+    return _MessageRow(
+        row[2],
+        message_id=row[0],
+        channel=row[1],
+        role=row[3],
+        content=row[4],
+        created_at_utc=row[5],
+    )
 
 
 async def get_latest_route() -> dict | None:
-    """获取最近一条 user 消息的路由信息"""
+    """获取最近一条 user 消息的路由信息（热表未命中时查找归档库）"""
     _ensure_conn()
-    async with db_config.conn.execute(
-        (
-            "SELECT channel, metadata, created_at_utc "
-            "FROM messages "
-            "WHERE role = 'user' "
-            "ORDER BY message_id DESC LIMIT 1"
-        ),
-    ) as cursor:
-        row = await cursor.fetchone()
+    row = None
+    for table in _message_tables():
+        async with db_config.conn.execute(
+            (
+                "SELECT channel, metadata, created_at_utc "
+                f"FROM {table} "
+                "WHERE role = 'user' "
+                "ORDER BY message_id DESC LIMIT 1"
+            ),
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is not None:
+            break
 
     if row is None:
         return None
 
-    return {
-        "channel": row[0],
-        "metadata": _loads_metadata(row[1]),
-        "created_at_utc": row[2],
-    }
+    return _MessageRow(row[1], channel=row[0], created_at_utc=row[2])
+
+
+def _min_ulid_at(epoch_seconds: float) -> str:
+    """给定时间点对应的最小 ULID，可直接与 message_id 比较"""
+    ms = max(0, int(epoch_seconds * 1000))
+    return str(ULID.from_bytes(ms.to_bytes(6, "big") + bytes(10)))
+
+
+async def has_user_message_since(epoch_seconds: float) -> bool:
+    """给定时间点之后是否有用户消息；按 message_id 主键范围查找，只看热表"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "SELECT 1 FROM main.messages WHERE message_id >= ? AND role = 'user' LIMIT 1",
+        (_min_ulid_at(epoch_seconds),)
+    ) as cursor:
+        return await cursor.fetchone() is not None
+
+
+async def archive_messages_before(epoch_seconds: float, batch_size: int = 2000) -> int:
+    """将早于指定时间的消息分批移动到归档库，返回本次移动的条数
+
+    每批在一个事务内先 INSERT OR IGNORE 到归档库、再从热表删除，借助 ULID 主键按范围定位，
+    批次之间让出事件循环，避免长时间占用唯一的数据库连接。
+    """
+    _ensure_conn()
+    if not db_config.archive_attached:
+        raise RuntimeError("归档库未挂载，请在 init_db() 中传入 archive_db_path")
+
+    cutoff_id = _min_ulid_at(epoch_seconds)
+    moved = 0
+    while True:
+        async with db_config.conn.execute(
+            (
+                "SELECT MAX(message_id), COUNT(*) FROM ("
+                "SELECT message_id FROM main.messages WHERE message_id < ? ORDER BY message_id LIMIT ?"
+                ")"
+            ),
+            (cutoff_id, batch_size)
+        ) as cursor:
+            upper_id, count = await cursor.fetchone()
+        if not count:
+            break
+
+        await db_config.conn.execute(
+            (
+                "INSERT OR IGNORE INTO archive.messages (message_id, channel, metadata, role, content, created_at_utc) "
+                "SELECT message_id, channel, metadata, role, content, created_at_utc "
+                "FROM main.messages WHERE message_id <= ?"
+            ),
+            (upper_id,)
+        )
+        await db_config.conn.execute("DELETE FROM main.messages WHERE message_id <= ?", (upper_id,))
+        await db_config.conn.commit()
+        moved += count
+        if count < batch_size:
+            break
+        await asyncio.sleep(0)
+
+    if moved:
+        logger.trace(f"归档消息: moved={moved}, cutoff_id={cutoff_id}")
+    return moved
@@ -0,0 +1,197 @@
+"""出站消息发件箱
+
+每条发出的消息先写入 outbox(状态 sending，带租约)再交给渠道发送：送达后标记 delivered，失败按退避改回 pending
+等待重发，超过最大尝试次数标记为 dead 作为死信保留，可在管理 API 中查看并重新入队。
+进程在发送途中崩溃时，租约到期后由 core.outbox 重新认领发送(至少一次)。
+"""
+
+import time
+from typing import Any, Iterable
+
+import storage.db_config as db_config
+from codec import JSONDecodeError, dumps, loads
+from config.settings import OUTBOX_MAX_ATTEMPTS
+from datamodel import OutboxItem
+from logger import logger
+from ulid import ULID
+
+__all__ = [
+    "enqueue_outbox",
+    "claim_due_outbox",
+    "mark_delivered",
+    "mark_failed",
+    "release_sending",
+    "requeue_dead",
+    "purge_delivered",
+    "get_next_due_ms",
+    "count_outbox_by_status",
+]
+
+_OUTBOX_COLUMNS = "outbox_id, channel_type, content, metadata, message_id, status, attempts, max_attempts"
+
+
+def _ensure_conn():
+    if db_config.conn is None:
+        raise RuntimeError("数据库未初始化，请先调用 init_db()")
+
+
+def _exclude_clause(exclude_ids: Iterable[str]) -> tuple[str, tuple[str, ...]]:
+    ids = tuple(exclude_ids)
+    if not ids:
+        return "", ()
+    placeholders = ",".join("?" for _ in ids)
+    return f" AND outbox_id NOT IN ({placeholders})", ids
+
+
+def _row_to_item(row) -> OutboxItem:
+    metadata = None
+    if row[3]:
+        try:
+            metadata = loads(row[3])
+        except JSONDecodeError:
+            logger.warning(f"发件箱 metadata 解析失败，已按空处理: outbox_id={row[0]}")
+    return OutboxItem(
+        outbox_id=row[0],
+        channel_type=row[1],
+        content=row[2],
+        metadata=metadata if isinstance(metadata, dict) else None,
+        message_id=row[4],
+        status=row[5],
+        attempts=row[6],
+        max_attempts=row[7],
+    )
+
+
+async def enqueue_outbox(
+    channel_type: str,
+    content: str,
+    metadata: dict[str, Any] | None,
+    message_id: str | None,
+    lease_ms: int,
+    max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+) -> OutboxItem:
+    """登记一条出站消息，直接以 sending 状态(第一次尝试)写入，调用方随后立即发送"""
+    _ensure_conn()
+    outbox_id = str(ULID())
+    metadata_json = dumps(metadata, default=str) if metadata is not None else None
+    await db_config.conn.execute(
+        "INSERT INTO outbox (outbox_id, channel_type, content, metadata, message_id, status, attempts, max_attempts, next_attempt_at_ms_utc) "
+        "VALUES (?, ?, ?, ?, ?, 'sending', 1, ?, ?)",
+        (outbox_id, channel_type, content, metadata_json, message_id, max_attempts, int(time.time() * 1000) + lease_ms)
+    )
+    await db_config.conn.commit()
+    return OutboxItem(
+        outbox_id=outbox_id,
+        channel_type=channel_type,
+        content=content,
+        metadata=metadata,
+        message_id=message_id,
+        status="sending",
+        attempts=1,
+        max_attempts=max_attempts,
+    )
+
+
+async def claim_due_outbox(
+    now_ms: int, lease_ms: int, batch_size: int, exclude_ids: Iterable[str] = ()
+) -> list[OutboxItem]:
+    """认领一批到期待重发的消息(含租约已过期的发送中消息)：单条 UPDATE ... RETURNING，按登记顺序返回
+
+    exclude_ids 为本进程内仍在排队或发送中的消息，即使租约已过期也不重新认领，避免重复发送
+    """
+    _ensure_conn()
+    exclude_sql, exclude_params = _exclude_clause(exclude_ids)
+    # execute_fetchall 在同一次数据库线程调用中执行并取完结果，其他协程的提交不会夹在两者之间
+    rows = await db_config.conn.execute_fetchall(
+        "UPDATE outbox SET status = 'sending', attempts = attempts + 1, "
+        "next_attempt_at_ms_utc = ?, updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE outbox_id IN ("
+        "    SELECT outbox_id FROM outbox"
+        f"    WHERE status IN ('pending', 'sending') AND next_attempt_at_ms_utc <= ?{exclude_sql}"
+        "    ORDER BY next_attempt_at_ms_utc LIMIT ?"
+        f") RETURNING {_OUTBOX_COLUMNS}",
+        (now_ms + lease_ms, now_ms, *exclude_params, batch_size)
+    )
+    await db_config.conn.commit()
+    return sorted((_row_to_item(row) for row in rows), key=lambda item: item.outbox_id)
+
+
+async def mark_delivered(outbox_id: str) -> None:
+    _ensure_conn()
+    await db_config.conn.execute(
+        "UPDATE outbox SET status = 'delivered', delivered_at_ms_utc = ?, updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE outbox_id = ? AND status = 'sending'",
+        (int(time.time() * 1000), outbox_id)
+    )
+    await db_config.conn.commit()
+
+
+async def mark_failed(outbox_id: str, error: str, retry_at_ms: int) -> str | None:
+    """记录一次发送失败：未达最大尝试次数则在 retry_at_ms 重发，否则标记为 dead；返回新状态"""
+    _ensure_conn()
+    rows = await db_config.conn.execute_fetchall(
+        "UPDATE outbox SET "
+        "status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'pending' END, "
+        "next_attempt_at_ms_utc = ?, last_error = ?, updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE outbox_id = ? AND status = 'sending' RETURNING status",
+        (retry_at_ms, error[:1000], outbox_id)
+    )
+    await db_config.conn.commit()
+    return rows[0][0] if rows else None
+
+
+async def release_sending(now_ms: int) -> int:
+    """启动时调用：上一进程发送中但未确认的消息立即重新发送，返回数量"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "UPDATE outbox SET next_attempt_at_ms_utc = ?, updated_at_utc = CURRENT_TIMESTAMP WHERE status = 'sending'",
+        (now_ms,)
+    ) as cursor:
+        released = cursor.rowcount
+    await db_config.conn.commit()
+    return released
+
+
+async def requeue_dead(outbox_id: str, now_ms: int) -> bool:
+    """死信重新入队：清零尝试次数并立即发送，返回是否成功"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at_ms_utc = ?, updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE outbox_id = ? AND status = 'dead'",
+        (now_ms, outbox_id)
+    ) as cursor:
+        updated = cursor.rowcount
+    await db_config.conn.commit()
+    return updated > 0
+
+
+async def purge_delivered(before_ms: int) -> int:
+    """删除早于 before_ms 送达的记录(消息内容仍保存在 messages 中)，返回删除条数"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "DELETE FROM outbox WHERE status = 'delivered' AND delivered_at_ms_utc < ?",
+        (before_ms,)
+    ) as cursor:
+        deleted = cursor.rowcount
+    await db_config.conn.commit()
+    return deleted
+
+
+async def get_next_due_ms(exclude_ids: Iterable[str] = ()) -> int | None:
+    _ensure_conn()
+    exclude_sql, exclude_params = _exclude_clause(exclude_ids)
+    async with db_config.conn.execute(
+        f"SELECT MIN(next_attempt_at_ms_utc) FROM outbox WHERE status IN ('pending', 'sending'){exclude_sql}",
+        exclude_params
+    ) as cursor:
+        row = await cursor.fetchone()
+    return None if row is None else row[0]
+
+
+async def count_outbox_by_status() -> dict[str, int]:
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+    ) as cursor:
+        rows = await cursor.fetchall()
+    return {row[0]: row[1] for row in rows}
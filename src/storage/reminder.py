@@ -3,70 +3,314 @@ from logger import logger
 from datamodel import *
 from events import bus, E
 from utils import *
+from config.settings import REMINDER_ESCALATION_MINUTES, REMINDER_REPEAT_MINUTES, REMINDER_MAX_REPEATS, USER_TIMEZONE
+
+_REMINDER_COLUMNS = (
+    "reminder_id, title, remind_at_min_utc, prompt, status, next_action_at_min_utc, "
+    "priority, retry_count, snoozed_until_min_utc, recurrence_rule, occurrence_count, "
+    "draft_text, draft_for_min_utc, drafted_at_ms_utc"
+)
+
+REMINDER_PRIORITIES = ("high", "medium", "low", "none")
+_IN_CHUNK_SIZE = 500
 
 def _ensure_conn():
     if db_config.conn is None:
         raise RuntimeError("数据库未初始化，请先调用 init_db()")
 
-async def create_reminder(title: str, remind_at_min_utc: str, prompt: str) -> Reminder:
-    """创建提醒"""
+def _row_to_reminder(row) -> Reminder:
+    return Reminder(
+        reminder_id=row[0],
+        title=row[1],
+        remind_at_min_utc=row[2],
+        prompt=row[3],
+        status=row[4],
+        next_action_at_min_utc=row[5],
+        priority=row[6],
+        retry_count=row[7],
+        snoozed_until_min_utc=row[8],
+        recurrence_rule=row[9],
+        occurrence_count=row[10],
+        draft_text=row[11],
+        draft_for_min_utc=row[12],
+        drafted_at_ms_utc=row[13]
+    )
+
+async def create_reminder(title: str, remind_at_min_utc: int, prompt: str, priority: str = "none",
+                          recurrence_rule: str | None = None) -> Reminder:
+    """创建提醒，remind_at_min_utc 为 UTC epoch 分钟(重复提醒的第一次)；recurrence_rule 非法时抛出 ValueError"""
     _ensure_conn()
+    if priority not in REMINDER_PRIORITIES:
+        raise ValueError(f"无效的提醒优先级: {priority}")
+    if recurrence_rule:
+        parse_rrule(recurrence_rule, USER_TIMEZONE)
+    else:
+        recurrence_rule = None
     async with db_config.conn.execute(
-        "INSERT INTO reminders (title, remind_at_min_utc, prompt, status, next_action_at_min_utc) VALUES (?, ?, ?, ?, ?)",
-        (title, remind_at_min_utc, prompt, "pending", remind_at_min_utc)
+        "INSERT INTO reminders (title, remind_at_min_utc, prompt, priority, recurrence_rule, status, next_action_at_min_utc) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (title, remind_at_min_utc, prompt, priority, recurrence_rule, "pending", remind_at_min_utc)
     ) as cursor:
-        await db_config.conn.commit()
         reminder_id = cursor.lastrowid
-        bus.emit(E.REMINDER_CREATED, reminder_id=reminder_id, title=title, remind_at_min_utc=remind_at_min_utc, prompt=prompt)
-        logger.trace(f"创建提醒: title={title}, remind_at_min_utc={remind_at_min_utc}, reminder_id={reminder_id}")
-        return Reminder(
-            reminder_id=reminder_id,
-            title=title,
-            remind_at_min_utc=remind_at_min_utc,
-            prompt=prompt,
-            status="pending",
-            next_action_at_min_utc=remind_at_min_utc
-        )
+    await db_config.conn.commit()
+    # 游标关闭后再发布事件，避免处理器在语句未结束时提交
+    bus.emit(E.REMINDER_CREATED, reminder_id=reminder_id, title=title, remind_at_min_utc=remind_at_min_utc, prompt=prompt)
+    logger.trace(f"创建提醒: title={title}, remind_at_min_utc={remind_at_min_utc}, priority={priority}, recurrence_rule={recurrence_rule}, reminder_id={reminder_id}")
+    return Reminder(
+        reminder_id=reminder_id,
+        title=title,
+        remind_at_min_utc=remind_at_min_utc,
+        prompt=prompt,
+        status="pending",
+        next_action_at_min_utc=remind_at_min_utc,
+        priority=priority,
+        recurrence_rule=recurrence_rule
+    )
+
+async def get_reminder(reminder_id: int) -> Reminder | None:
+    _ensure_conn()
+    async with db_config.conn.execute(
+        f"SELECT {_REMINDER_COLUMNS} FROM reminders WHERE reminder_id = ?",
+        (reminder_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+        return _row_to_reminder(row) if row is not None else None
+
+async def save_reminder_draft(reminder_id: int, for_min_utc: int, draft_text: str, drafted_at_ms_utc: int) -> bool:
+    """保存预生成文案；提醒已发出或已改期(remind_at_min_utc 不再等于 for_min_utc)时不写入，返回是否成功"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "UPDATE reminders SET draft_text = ?, draft_for_min_utc = ?, drafted_at_ms_utc = ? "
+        "WHERE reminder_id = ? AND remind_at_min_utc = ? AND status IN ('pending', 'snoozed')",
+        (draft_text, for_min_utc, drafted_at_ms_utc, reminder_id, for_min_utc)
+    ) as cursor:
+        updated = cursor.rowcount
+    await db_config.conn.commit()
+    return updated > 0
 
 async def get_pending_reminders() -> list[Reminder]:
     """获取所有未触发的提醒"""
     _ensure_conn()
     async with db_config.conn.execute(
-        "SELECT reminder_id, title, remind_at_min_utc, prompt, status, next_action_at_min_utc FROM reminders WHERE status = 'pending'"
+        f"SELECT {_REMINDER_COLUMNS} FROM reminders WHERE status = 'pending'"
     ) as cursor:
         rows = await cursor.fetchall()
-        return [
-            Reminder(
-                reminder_id=row[0],
-                title=row[1],
-                remind_at_min_utc=row[2],
-                prompt=row[3],
-                status=row[4],
-                next_action_at_min_utc=row[5]
-            )
-            for row in rows
-        ]
+        return [_row_to_reminder(row) for row in rows]
 
 async def get_reminders_need_action_now() -> list[Reminder]:
     """获取所有需要立即执行后续动作的提醒"""
     _ensure_conn()
 
+    # 整数范围查询，命中 idx_reminders_next_action 部分索引
     async with db_config.conn.execute(
-        "SELECT reminder_id, title, remind_at_min_utc, prompt, status, next_action_at_min_utc FROM reminders WHERE (next_action_at_min_utc NOT NULL) AND next_action_at_min_utc <= ?",
-        (now_utc_min_str(),)
+        f"SELECT {_REMINDER_COLUMNS} FROM reminders WHERE next_action_at_min_utc IS NOT NULL AND next_action_at_min_utc <= ?",
+        (now_utc_epoch_min(),)
     ) as cursor:
         rows = await cursor.fetchall()
-        return [
-            Reminder(
-                reminder_id=row[0],
-                title=row[1],
-                remind_at_min_utc=row[2],
-                prompt=row[3],
-                status=row[4],
-                next_action_at_min_utc=row[5]
+        return [_row_to_reminder(row) for row in rows]
+
+# ----------------- 状态机批量转换 ----------------
+# 每个转换都是一条 UPDATE ... RETURNING：子查询按 (status, next_action_at_min_utc) 索引取出一批到期提醒，
+# SET 中的 CASE 表达式按优先级/重复次数决定目标状态，一次提交。转换后的 next_action_at_min_utc 要么为 NULL，
+# 要么晚于 now_min，因此同一提醒在一次推进中不会被重复处理。
+
+async def _advance(from_status: str, set_sql: str, set_params: tuple, now_min: int, batch_size: int) -> list[Reminder]:
+    _ensure_conn()
+    async with db_config.conn.execute(
+        f"UPDATE reminders SET {set_sql}, updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE reminder_id IN ("
+        "    SELECT reminder_id FROM reminders"
+        "    WHERE status = ? AND next_action_at_min_utc IS NOT NULL AND next_action_at_min_utc <= ?"
+        "    ORDER BY next_action_at_min_utc LIMIT ?"
+        f") RETURNING {_REMINDER_COLUMNS}",
+        (*set_params, from_status, now_min, batch_size)
+    ) as cursor:
+        rows = await cursor.fetchall()
+    await db_config.conn.commit()
+    if rows:
+        logger.trace(f"提醒状态推进: from={from_status}, count={len(rows)}")
+    return [_row_to_reminder(row) for row in rows]
+
+async def wake_snoozed_reminders(now_min: int, batch_size: int = 100) -> list[Reminder]:
+    """snoozed -> pending: 延后时间已到，重新进入待发送状态"""
+    return await _advance(
+        "snoozed",
+        "status = 'pending', snoozed_until_min_utc = NULL",
+        (),
+        now_min, batch_size
+    )
+
+async def claim_due_reminders(now_min: int, batch_size: int = 100) -> list[Reminder]:
+    """pending -> sent: 原子地认领一批到期提醒，并设置无响应升级的时间"""
+    return await _advance(
+        "pending",
+        "status = 'sent', retry_count = 0, last_reminded_at_min_utc = ?, next_action_at_min_utc = ?",
+        (now_min, now_min + REMINDER_ESCALATION_MINUTES),
+        now_min, batch_size
+    )
+
+async def expire_sent_reminders(now_min: int, batch_size: int = 100) -> list[Reminder]:
+    """sent 超时: High/Medium -> escalated，Low/None -> ignored"""
+    escalate = "priority IN ('high', 'medium')"
+    return await _advance(
+        "sent",
+        f"status = CASE WHEN {escalate} THEN 'escalated' ELSE 'ignored' END, "
+        f"last_reminded_at_min_utc = CASE WHEN {escalate} THEN ? ELSE last_reminded_at_min_utc END, "
+        f"next_action_at_min_utc = CASE WHEN {escalate} THEN ? ELSE NULL END",
+        (now_min, now_min + REMINDER_REPEAT_MINUTES),
+        now_min, batch_size
+    )
+
+async def advance_escalated_reminders(now_min: int, batch_size: int = 100) -> list[Reminder]:
+    """escalated 超时: High 且未达最大重复次数 -> escalated(retry_count + 1)，否则 -> ignored"""
+    repeat = "priority = 'high' AND retry_count < ?"
+    return await _advance(
+        "escalated",
+        f"status = CASE WHEN {repeat} THEN 'escalated' ELSE 'ignored' END, "
+        f"retry_count = CASE WHEN {repeat} THEN retry_count + 1 ELSE retry_count END, "
+        f"last_reminded_at_min_utc = CASE WHEN {repeat} THEN ? ELSE last_reminded_at_min_utc END, "
+        f"next_action_at_min_utc = CASE WHEN {repeat} THEN ? ELSE NULL END",
+        (
+            REMINDER_MAX_REPEATS, REMINDER_MAX_REPEATS, REMINDER_MAX_REPEATS, now_min,
+            REMINDER_MAX_REPEATS, now_min + REMINDER_REPEAT_MINUTES,
+        ),
+        now_min, batch_size
+    )
+
+async def ack_reminders(reminder_ids: list[int]) -> list[Reminder]:
+    """sent/escalated -> acked，返回实际确认的提醒"""
+    _ensure_conn()
+    if not reminder_ids:
+        return []
+    acked: list[Reminder] = []
+    # 按块展开 IN 参数，避免超过 SQLite 的变量数上限；所有块在同一事务内提交
+    for i in range(0, len(reminder_ids), _IN_CHUNK_SIZE):
+        chunk = reminder_ids[i:i + _IN_CHUNK_SIZE]
+        placeholders = ",".join("?" for _ in chunk)
+        async with db_config.conn.execute(
+            "UPDATE reminders SET status = 'acked', next_action_at_min_utc = NULL, updated_at_utc = CURRENT_TIMESTAMP "
+            f"WHERE reminder_id IN ({placeholders}) AND status IN ('sent', 'escalated') RETURNING {_REMINDER_COLUMNS}",
+            tuple(chunk)
+        ) as cursor:
+            acked.extend(_row_to_reminder(row) for row in await cursor.fetchall())
+    await db_config.conn.commit()
+    for reminder in acked:
+        bus.emit(E.REMINDER_ACKED, reminder_id=reminder.reminder_id)
+    return acked
+
+async def advance_recurring_reminders(reminders: list[Reminder], now_min: int) -> list[Reminder]:
+    """
+    将已结束(acked/ignored)的重复提醒推进到晚于 now_min 的下一次发生并回到 pending，返回推进后的提醒。
+    非重复提醒与已到达 COUNT/UNTIL 的序列保持原状态；期间错过的发生直接跳过
+    """
+    _ensure_conn()
+    advanced: list[Reminder] = []
+    for reminder in reminders:
+        if not reminder.recurrence_rule or reminder.status not in ("acked", "ignored"):
+            continue
+        try:
+            next_min = next_occurrence_min(
+                reminder.recurrence_rule, reminder.remind_at_min_utc, now_min, reminder.occurrence_count, USER_TIMEZONE
             )
-            for row in rows
-        ]
+        except ValueError as e:
+            logger.error(f"重复提醒规则无效，停止重复: reminder_id={reminder.reminder_id}, rule={reminder.recurrence_rule}, error={e}")
+            continue
+        if next_min is None:
+            logger.info(f"重复提醒序列已结束: reminder_id={reminder.reminder_id}, occurrence_count={reminder.occurrence_count}")
+            continue
+        async with db_config.conn.execute(
+            "UPDATE reminders SET status = 'pending', remind_at_min_utc = ?, next_action_at_min_utc = ?, "
+            "retry_count = 0, snoozed_until_min_utc = NULL, occurrence_count = occurrence_count + 1, "
+            "updated_at_utc = CURRENT_TIMESTAMP "
+            f"WHERE reminder_id = ? AND status IN ('acked', 'ignored') RETURNING {_REMINDER_COLUMNS}",
+            (next_min, next_min, reminder.reminder_id)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is not None:
+            advanced.append(_row_to_reminder(row))
+    if not advanced:
+        return advanced
+    await db_config.conn.commit()
+    for reminder in advanced:
+        bus.emit(E.REMINDER_RESCHEDULED, reminder_id=reminder.reminder_id, next_action_at_min_utc=reminder.next_action_at_min_utc)
+    logger.trace(f"重复提醒推进到下一次: count={len(advanced)}")
+    return advanced
+
+async def ignore_reminders(reminder_ids: list[int]) -> list[Reminder]:
+    """sent/escalated -> ignored(不再升级)，返回实际更新的提醒"""
+    _ensure_conn()
+    if not reminder_ids:
+        return []
+    ignored: list[Reminder] = []
+    for i in range(0, len(reminder_ids), _IN_CHUNK_SIZE):
+        chunk = reminder_ids[i:i + _IN_CHUNK_SIZE]
+        placeholders = ",".join("?" for _ in chunk)
+        async with db_config.conn.execute(
+            "UPDATE reminders SET status = 'ignored', next_action_at_min_utc = NULL, updated_at_utc = CURRENT_TIMESTAMP "
+            f"WHERE reminder_id IN ({placeholders}) AND status IN ('sent', 'escalated') RETURNING {_REMINDER_COLUMNS}",
+            tuple(chunk)
+        ) as cursor:
+            ignored.extend(_row_to_reminder(row) for row in await cursor.fetchall())
+    await db_config.conn.commit()
+    return ignored
+
+async def snooze_reminder(reminder_id: int, until_min: int) -> bool:
+    """将提醒延后到 until_min(UTC epoch 分钟)，返回是否成功"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "UPDATE reminders SET status = 'snoozed', snoozed_until_min_utc = ?, next_action_at_min_utc = ?, "
+        "updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE reminder_id = ? AND status IN ('pending', 'sent', 'escalated', 'acked', 'snoozed')",
+        (until_min, until_min, reminder_id)
+    ) as cursor:
+        updated = cursor.rowcount
+    await db_config.conn.commit()
+    if updated:
+        bus.emit(E.REMINDER_RESCHEDULED, reminder_id=reminder_id, next_action_at_min_utc=until_min)
+        logger.info(f"提醒已延后: reminder_id={reminder_id}, until_min={until_min}")
+    return updated > 0
+
+async def cancel_reminder(reminder_id: int) -> bool:
+    """取消尚未结束的提醒(重复提醒会取消整个序列)，返回是否成功"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "UPDATE reminders SET status = 'cancelled', next_action_at_min_utc = NULL, updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE reminder_id = ? AND status IN ('pending', 'sent', 'escalated', 'snoozed')",
+        (reminder_id,)
+    ) as cursor:
+        updated = cursor.rowcount
+    await db_config.conn.commit()
+    if updated:
+        bus.emit(E.REMINDER_CANCELLED, reminder_id=reminder_id)
+        logger.info(f"提醒已取消: reminder_id={reminder_id}")
+    return updated > 0
+
+async def get_open_reminder_ids() -> list[int]:
+    """获取所有已发送、等待用户响应的提醒 ID"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "SELECT reminder_id FROM reminders WHERE status IN ('sent', 'escalated')"
+    ) as cursor:
+        rows = await cursor.fetchall()
+        return [row[0] for row in rows]
+
+async def get_finished_recurring_reminders() -> list[Reminder]:
+    """获取已结束但尚未推进到下一次的重复提醒(进程在确认/忽略与推进之间退出时残留)"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        f"SELECT {_REMINDER_COLUMNS} FROM reminders WHERE recurrence_rule IS NOT NULL AND status IN ('acked', 'ignored')"
+    ) as cursor:
+        rows = await cursor.fetchall()
+        return [_row_to_reminder(row) for row in rows]
+
+async def get_scheduled_action_times() -> list[tuple[int, int]]:
+    """获取所有待执行动作的 (next_action_at_min_utc, reminder_id)，供调度器启动时建堆"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "SELECT next_action_at_min_utc, reminder_id FROM reminders WHERE next_action_at_min_utc IS NOT NULL"
+    ) as cursor:
+        rows = await cursor.fetchall()
+        return [(row[0], row[1]) for row in rows]
 
 
 async def update_reminder(reminder: Reminder) -> None:
@@ -77,4 +321,6 @@ async def update_reminder(reminder: Reminder) -> None:
         (reminder.status, reminder.next_action_at_min_utc, reminder.reminder_id)
     )
     await db_config.conn.commit()
+    if reminder.next_action_at_min_utc is not None:
+        bus.emit(E.REMINDER_RESCHEDULED, reminder_id=reminder.reminder_id, next_action_at_min_utc=reminder.next_action_at_min_utc)
     logger.trace(f"更新提醒: reminder_id={reminder.reminder_id}, next_action_at_min_utc={reminder.next_action_at_min_utc}, status={reminder.status}")
@@ -0,0 +1,163 @@
+"""持久化延时事件队列
+
+调度器(world.scheduler)从这里认领到期事件并投递到事件总线，处理成功后删除，失败则按退避重新排期，
+超过最大尝试次数的事件标记为 dead 保留以便排查。认领带租约，进程崩溃后未确认的事件会被重新投递(至少一次)。
+"""
+
+import time
+from typing import Any
+
+import storage.db_config as db_config
+from codec import JSONDecodeError, dumps, loads
+from config.settings import SCHEDULER_MAX_ATTEMPTS
+from datamodel import ScheduledEvent
+from events import bus, E
+from logger import logger
+from ulid import ULID
+
+__all__ = [
+    "schedule_event",
+    "claim_due_events",
+    "ack_events",
+    "fail_event",
+    "cancel_event",
+    "release_claimed_events",
+    "get_next_due_ms",
+    "count_events_by_status",
+]
+
+_EVENT_COLUMNS = "event_id, event_type, payload, scheduled_at_ms_utc, status, attempts, max_attempts"
+
+
+def _ensure_conn():
+    if db_config.conn is None:
+        raise RuntimeError("数据库未初始化，请先调用 init_db()")
+
+
+def _row_to_event(row) -> ScheduledEvent:
+    try:
+        payload = loads(row[2]) if row[2] else {}
+    except JSONDecodeError:
+        logger.warning(f"延时事件 payload 解析失败，已按空处理: event_id={row[0]}")
+        payload = {}
+    return ScheduledEvent(
+        event_id=row[0],
+        event_type=row[1],
+        payload=payload if isinstance(payload, dict) else {},
+        scheduled_at_ms_utc=row[3],
+        status=row[4],
+        attempts=row[5],
+        max_attempts=row[6],
+    )
+
+
+async def schedule_event(
+    event_type: str,
+    payload: dict[str, Any] | None = None,
+    at_ms: int | None = None,
+    delay_seconds: float = 0.0,
+    max_attempts: int = SCHEDULER_MAX_ATTEMPTS,
+) -> str:
+    """登记一个延时事件，在 at_ms(UTC epoch 毫秒)或 delay_seconds 秒后投递，返回 event_id"""
+    _ensure_conn()
+    if at_ms is None:
+        at_ms = int((time.time() + max(0.0, delay_seconds)) * 1000)
+    event_id = str(ULID())
+    await db_config.conn.execute(
+        "INSERT INTO scheduled_events (event_id, event_type, payload, scheduled_at_ms_utc, max_attempts, next_attempt_at_ms_utc) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (event_id, event_type, dumps(payload or {}, default=str), at_ms, max_attempts, at_ms)
+    )
+    await db_config.conn.commit()
+    bus.emit(E.SCHEDULED_EVENT_ADDED, event_id=event_id, next_attempt_at_ms_utc=at_ms)
+    logger.trace(f"登记延时事件: event_type={event_type}, at_ms={at_ms}, event_id={event_id}")
+    return event_id
+
+
+async def claim_due_events(now_ms: int, lease_ms: int, batch_size: int) -> list[ScheduledEvent]:
+    """认领一批到期事件(含租约已过期的已认领事件)：单条 UPDATE ... RETURNING，一次提交"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "UPDATE scheduled_events SET status = 'claimed', attempts = attempts + 1, "
+        "next_attempt_at_ms_utc = ?, updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE event_id IN ("
+        "    SELECT event_id FROM scheduled_events"
+        "    WHERE status IN ('pending', 'claimed') AND next_attempt_at_ms_utc <= ?"
+        "    ORDER BY next_attempt_at_ms_utc LIMIT ?"
+        f") RETURNING {_EVENT_COLUMNS}",
+        (now_ms + lease_ms, now_ms, batch_size)
+    ) as cursor:
+        rows = await cursor.fetchall()
+    await db_config.conn.commit()
+    return [_row_to_event(row) for row in rows]
+
+
+async def ack_events(event_ids: list[str]) -> None:
+    """确认事件已处理成功并删除"""
+    _ensure_conn()
+    if not event_ids:
+        return
+    placeholders = ",".join("?" for _ in event_ids)
+    await db_config.conn.execute(
+        f"DELETE FROM scheduled_events WHERE event_id IN ({placeholders}) AND status = 'claimed'",
+        tuple(event_ids)
+    )
+    await db_config.conn.commit()
+
+
+async def fail_event(event_id: str, error: str, retry_at_ms: int) -> str | None:
+    """记录一次处理失败：未达最大尝试次数则在 retry_at_ms 重新投递，否则标记为 dead；返回新状态"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "UPDATE scheduled_events SET "
+        "status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'pending' END, "
+        "next_attempt_at_ms_utc = ?, last_error = ?, updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE event_id = ? AND status = 'claimed' RETURNING status",
+        (retry_at_ms, error[:1000], event_id)
+    ) as cursor:
+        row = await cursor.fetchone()
+    await db_config.conn.commit()
+    return None if row is None else row[0]
+
+
+async def cancel_event(event_id: str) -> bool:
+    """取消尚未投递的事件，返回是否取消成功"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "DELETE FROM scheduled_events WHERE event_id = ? AND status = 'pending'",
+        (event_id,)
+    ) as cursor:
+        deleted = cursor.rowcount
+    await db_config.conn.commit()
+    return deleted > 0
+
+
+async def release_claimed_events(now_ms: int) -> int:
+    """启动时调用：上一进程认领但未确认的事件立即重新投递，返回数量"""
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "UPDATE scheduled_events SET next_attempt_at_ms_utc = ?, updated_at_utc = CURRENT_TIMESTAMP "
+        "WHERE status = 'claimed'",
+        (now_ms,)
+    ) as cursor:
+        released = cursor.rowcount
+    await db_config.conn.commit()
+    return released
+
+
+async def get_next_due_ms() -> int | None:
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "SELECT MIN(next_attempt_at_ms_utc) FROM scheduled_events WHERE status IN ('pending', 'claimed')"
+    ) as cursor:
+        row = await cursor.fetchone()
+    return None if row is None else row[0]
+
+
+async def count_events_by_status() -> dict[str, int]:
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "SELECT status, COUNT(*) FROM scheduled_events GROUP BY status"
+    ) as cursor:
+        rows = await cursor.fetchall()
+    return {row[0]: row[1] for row in rows}
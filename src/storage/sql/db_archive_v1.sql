@@ -0,0 +1,20 @@
+-- 冷数据归档库，通过 ATTACH 挂载为 archive
+PRAGMA archive.journal_mode=WAL;
+
+CREATE TABLE IF NOT EXISTS archive.messages (
+    message_id TEXT NOT NULL PRIMARY KEY,  -- ULID
+
+    channel TEXT NOT NULL,
+    metadata TEXT,
+
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+
+    created_at_utc DATETIME
+);
+
+-- 热表与归档表的统一视图（临时视图才能跨库引用），供管理端检索
+CREATE TEMP VIEW IF NOT EXISTS messages_all AS
+    SELECT message_id, channel, metadata, role, content, created_at_utc FROM main.messages
+    UNION ALL
+    SELECT message_id, channel, metadata, role, content, created_at_utc FROM archive.messages;
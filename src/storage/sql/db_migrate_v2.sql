@@ -0,0 +1,23 @@
+-- v2: 记忆衰减与归档
+
+-- 权重衰减到阈值以下的记忆点会被移动到此表，不再参与检索与 Prompt 注入
+CREATE TABLE memory_points_archive (
+    memory_point_id INTEGER NOT NULL PRIMARY KEY,
+
+    memory_group_id INTEGER NOT NULL,
+    anchor TEXT NOT NULL,
+    content TEXT NOT NULL,
+    memory_type TEXT NOT NULL,
+    weight REAL NOT NULL,
+
+    created_at_utc DATETIME,
+    updated_at_utc DATETIME,
+    archived_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 后台任务的运行状态（如上次执行时间），键值对形式
+CREATE TABLE system_state (
+    key TEXT NOT NULL PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP
+);
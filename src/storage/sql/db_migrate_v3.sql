@@ -0,0 +1,36 @@
+-- v3: reminders 的时间字段由 "YYYY-MM-DD HH:MM" 字符串改为整数 epoch 分钟（unix 秒 // 60, UTC）
+-- 重建表(DROP/RENAME)与 user_version 更新由 db_config._run_script 放在同一事务中执行，中途失败整体回滚
+CREATE TABLE reminders_v3 (
+    reminder_id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+    title TEXT NOT NULL,
+    remind_at_min_utc INTEGER NOT NULL,  -- UTC epoch 分钟
+    prompt TEXT NOT NULL,
+    status TEXT CHECK(status IN ('pending', 'triggered', 'sent')) NOT NULL DEFAULT 'pending',
+
+    next_action_at_min_utc INTEGER DEFAULT NULL,  -- UTC epoch 分钟
+    created_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO reminders_v3 (
+    reminder_id, title, remind_at_min_utc, prompt, status, next_action_at_min_utc, created_at_utc, updated_at_utc
+)
+SELECT
+    reminder_id,
+    title,
+    CAST(strftime('%s', remind_at_min_utc) AS INTEGER) / 60,
+    prompt,
+    status,
+    CASE WHEN next_action_at_min_utc IS NULL THEN NULL
+         ELSE CAST(strftime('%s', next_action_at_min_utc) AS INTEGER) / 60 END,
+    created_at_utc,
+    updated_at_utc
+FROM reminders;
+
+DROP TABLE reminders;
+ALTER TABLE reminders_v3 RENAME TO reminders;
+
+-- 只索引仍有后续动作的提醒，扫描到期提醒时走范围查询
+CREATE INDEX idx_reminders_next_action ON reminders(next_action_at_min_utc) WHERE next_action_at_min_utc IS NOT NULL;
+CREATE INDEX idx_reminders_status ON reminders(status);
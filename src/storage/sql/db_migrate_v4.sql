@@ -0,0 +1,21 @@
+-- v4: 持久化延时事件队列
+-- status: pending 等待投递; claimed 已被调度器认领(租约到期前未确认则重新投递); dead 超过最大尝试次数
+-- next_attempt_at_ms_utc: pending 时为计划投递时间，claimed 时为租约到期时间，两种状态下到期即可被认领
+CREATE TABLE IF NOT EXISTS scheduled_events (
+    event_id TEXT PRIMARY KEY,  -- ULID
+
+    event_type TEXT NOT NULL,  -- 投递到事件总线的事件名
+    payload TEXT NOT NULL DEFAULT '{}',  -- JSON，作为关键字参数传给处理器
+    scheduled_at_ms_utc INTEGER NOT NULL,  -- 计划投递时间，UTC epoch 毫秒
+    status TEXT CHECK(status IN ('pending', 'claimed', 'dead')) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    next_attempt_at_ms_utc INTEGER NOT NULL,
+    last_error TEXT DEFAULT NULL,
+
+    created_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduled_events_due ON scheduled_events(next_attempt_at_ms_utc) WHERE status IN ('pending', 'claimed');
+CREATE INDEX IF NOT EXISTS idx_scheduled_events_type ON scheduled_events(event_type, status);
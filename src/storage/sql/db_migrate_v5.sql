@@ -0,0 +1,40 @@
+-- v5: 提醒状态机（见 HLD「Schedule 发送提醒的状态机」）
+-- 新增优先级、重复提醒次数、延后时间与上次提醒时间；旧的 triggered 状态等价于 sent
+-- 重建表(DROP/RENAME)与 user_version 更新由 db_config._run_script 放在同一事务中执行，中途失败整体回滚
+CREATE TABLE reminders_v5 (
+    reminder_id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+    title TEXT NOT NULL,
+    remind_at_min_utc INTEGER NOT NULL,  -- UTC epoch 分钟
+    prompt TEXT NOT NULL,
+    priority TEXT CHECK(priority IN ('high', 'medium', 'low', 'none')) NOT NULL DEFAULT 'none',
+    status TEXT CHECK(status IN ('pending', 'sent', 'acked', 'snoozed', 'escalated', 'ignored', 'cancelled')) NOT NULL DEFAULT 'pending',
+    retry_count INTEGER NOT NULL DEFAULT 0,  -- 升级后的重复提醒次数
+
+    next_action_at_min_utc INTEGER DEFAULT NULL,  -- UTC epoch 分钟，下一次状态转换的时间
+    snoozed_until_min_utc INTEGER DEFAULT NULL,
+    last_reminded_at_min_utc INTEGER DEFAULT NULL,
+    created_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO reminders_v5 (
+    reminder_id, title, remind_at_min_utc, prompt, status, next_action_at_min_utc, created_at_utc, updated_at_utc
+)
+SELECT
+    reminder_id,
+    title,
+    remind_at_min_utc,
+    prompt,
+    CASE WHEN status = 'triggered' THEN 'sent' ELSE status END,
+    next_action_at_min_utc,
+    created_at_utc,
+    updated_at_utc
+FROM reminders;
+
+DROP TABLE reminders;
+ALTER TABLE reminders_v5 RENAME TO reminders;
+
+-- 状态转换按 (status, next_action_at_min_utc) 范围批量推进
+CREATE INDEX idx_reminders_next_action ON reminders(next_action_at_min_utc) WHERE next_action_at_min_utc IS NOT NULL;
+CREATE INDEX idx_reminders_status_next_action ON reminders(status, next_action_at_min_utc);
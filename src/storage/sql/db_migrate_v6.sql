@@ -0,0 +1,5 @@
+-- v6: 重复提醒
+-- 每个重复序列只占一行：remind_at_min_utc 始终为当前这一次的时间，本次结束(acked/ignored)后
+-- 按 recurrence_rule 惰性推进到下一次并回到 pending，不预先展开后续发生
+ALTER TABLE reminders ADD COLUMN recurrence_rule TEXT DEFAULT NULL;  -- RRULE 子集，NULL 表示一次性提醒
+ALTER TABLE reminders ADD COLUMN occurrence_count INTEGER NOT NULL DEFAULT 1;  -- 当前是序列中的第几次，用于 COUNT
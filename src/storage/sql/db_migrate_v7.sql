@@ -0,0 +1,5 @@
+-- v7: 提醒文案预生成
+-- draft_for_min_utc 记录草稿对应的那一次发生(remind_at_min_utc)，改期或重复提醒推进后自动失效
+ALTER TABLE reminders ADD COLUMN draft_text TEXT DEFAULT NULL;
+ALTER TABLE reminders ADD COLUMN draft_for_min_utc INTEGER DEFAULT NULL;  -- UTC epoch 分钟
+ALTER TABLE reminders ADD COLUMN drafted_at_ms_utc INTEGER DEFAULT NULL;  -- 草稿生成时间，用于判断之后是否有新的用户消息
@@ -0,0 +1,39 @@
+-- v8: 出站消息发件箱
+-- status: pending 等待(重新)发送; sending 发送中(租约到期前未确认则重新发送); delivered 已送达; dead 超过最大尝试次数
+-- next_attempt_at_ms_utc: pending 时为计划发送时间，sending 时为租约到期时间，两种状态下到期即可被认领
+CREATE TABLE IF NOT EXISTS outbox (
+    outbox_id TEXT PRIMARY KEY,  -- ULID
+
+    channel_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT DEFAULT NULL,  -- JSON，发送时原样传给渠道
+    message_id TEXT DEFAULT NULL,  -- messages 中对应的记录
+    status TEXT CHECK(status IN ('pending', 'sending', 'delivered', 'dead')) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 8,
+    next_attempt_at_ms_utc INTEGER NOT NULL,
+    last_error TEXT DEFAULT NULL,
+    delivered_at_ms_utc INTEGER DEFAULT NULL,
+
+    created_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at_utc DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(next_attempt_at_ms_utc) WHERE status IN ('pending', 'sending');
+CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, outbox_id);
+
+-- 旧版本经延时事件队列登记的消息重发改由发件箱接管
+INSERT OR IGNORE INTO outbox (outbox_id, channel_type, content, metadata, attempts, next_attempt_at_ms_utc, last_error)
+SELECT
+    event_id,
+    json_extract(payload, '$.channel_type'),
+    json_extract(payload, '$.content'),
+    json_extract(payload, '$.metadata'),
+    attempts,
+    next_attempt_at_ms_utc,
+    last_error
+FROM scheduled_events
+WHERE event_type = 'io.send_message_retry' AND status != 'dead'
+    AND json_extract(payload, '$.channel_type') IS NOT NULL AND json_extract(payload, '$.content') IS NOT NULL;
+
+DELETE FROM scheduled_events WHERE event_type = 'io.send_message_retry' AND status != 'dead';
@@ -0,0 +1,34 @@
+"""后台任务运行状态存储
+
+以键值对形式记录各后台任务的持久化状态（例如上次执行时间），进程重启后依然有效。
+"""
+
+import storage.db_config as db_config
+
+__all__ = ["get_state", "set_state"]
+
+
+def _ensure_conn():
+    if db_config.conn is None:
+        raise RuntimeError("数据库未初始化，请先调用 init_db()")
+
+
+async def get_state(key: str) -> str | None:
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "SELECT value FROM system_state WHERE key = ?",
+        (key,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return None if row is None else row[0]
+
+
+async def set_state(key: str, value: str, commit: bool = True) -> None:
+    _ensure_conn()
+    await db_config.conn.execute(
+        "INSERT INTO system_state (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at_utc = CURRENT_TIMESTAMP",
+        (key, value)
+    )
+    if commit:
+        await db_config.conn.commit()
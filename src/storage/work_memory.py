@@ -6,6 +6,7 @@
 """
 
 import storage.db_config as db_config
+import storage.memory_index as memory_index
 from logger import logger
 
 def _ensure_conn():
@@ -65,6 +66,11 @@ async def edit_memory_group_title_by_id(memory_group_id: int, new_title: str) ->
 async def delete_memory_group_by_id(memory_group_id: int) -> None:
     """删除记忆组及其下所有记忆点"""
     _ensure_conn()
+    async with db_config.conn.execute(
+        "SELECT memory_point_id FROM memory_points WHERE memory_group_id = ?",
+        (memory_group_id,)
+    ) as cursor:
+        point_ids = [row[0] for row in await cursor.fetchall()]
     await db_config.conn.execute(
         "DELETE FROM memory_points WHERE memory_group_id = ?",
         (memory_group_id,)
@@ -74,6 +80,7 @@ async def delete_memory_group_by_id(memory_group_id: int) -> None:
         (memory_group_id,)
     )
     await db_config.conn.commit()
+    await memory_index.remove_points(point_ids)
     logger.trace(f"删除记忆组及其记忆点: memory_group_id={memory_group_id}")
 
 
@@ -97,6 +104,7 @@ async def create_memory_point(memory_group_title: str, anchor: str, content: str
     ) as cursor:
         await db_config.conn.commit()
         point_id = cursor.lastrowid
+        await memory_index.upsert_point(point_id, anchor, content)
         logger.trace(f"添加记忆点: memory_group_id={memory_group_id}, anchor={anchor}, point_id={point_id}, memory_type={memory_type}, weight={weight}")
         return point_id
 
@@ -116,19 +124,21 @@ async def edit_memory_point_content_by_id(memory_point_id: int, new_content: str
     """修改记忆点内容"""
     _ensure_conn()
     async with db_config.conn.execute(
-        "SELECT COUNT(*) FROM memory_points WHERE memory_point_id = ?",
+        "SELECT anchor FROM memory_points WHERE memory_point_id = ?",
         (memory_point_id,)
     ) as cursor:
         row = await cursor.fetchone()
-        if row[0] == 0:
+        if row is None:
             logger.error(f"LLM 试图修改不存在的记忆点内容: memory_point_id={memory_point_id}")
             return False
+        anchor = row[0]
 
     await db_config.conn.execute(
         "UPDATE memory_points SET content = ? WHERE memory_point_id = ?",
         (new_content, memory_point_id)
     )
     await db_config.conn.commit()
+    await memory_index.upsert_point(memory_point_id, anchor, new_content)
     logger.trace(f"修改记忆点内容: memory_point_id={memory_point_id}, new_content={new_content}")
     return True
 
@@ -151,3 +161,82 @@ async def list_memory_points_by_group_id(memory_group_id: int) -> list[dict]:
                 "created_at_utc": row[5],
             })
     return points
+
+
+async def list_all_memory_points() -> list[dict]:
+    """列出所有记忆点（附带所属记忆组标题），供记忆检索打分使用"""
+    _ensure_conn()
+    points = []
+    async with db_config.conn.execute(
+        "SELECT p.memory_point_id, p.memory_group_id, g.title, p.anchor, p.content, p.memory_type, p.weight, p.created_at_utc, p.updated_at_utc "
+        "FROM memory_points p JOIN memory_groups g ON g.memory_group_id = p.memory_group_id"
+    ) as cursor:
+        async for row in cursor:
+            points.append({
+                "memory_point_id": row[0],
+                "memory_group_id": row[1],
+                "memory_group_title": row[2],
+                "anchor": row[3],
+                "content": row[4],
+                "memory_type": row[5],
+                "weight": row[6],
+                "created_at_utc": row[7],
+                "updated_at_utc": row[8],
+            })
+    return points
+
+
+async def get_memory_points_by_ids(memory_point_ids: list[int]) -> list[dict]:
+    """按 ID 批量获取记忆点，返回顺序与传入顺序一致"""
+    _ensure_conn()
+    if not memory_point_ids:
+        return []
+    placeholders = ", ".join("?" for _ in memory_point_ids)
+    found: dict[int, dict] = {}
+    async with db_config.conn.execute(
+        f"SELECT memory_point_id, anchor, content, memory_type, weight, created_at_utc FROM memory_points WHERE memory_point_id IN ({placeholders})",
+        tuple(memory_point_ids)
+    ) as cursor:
+        async for row in cursor:
+            found[row[0]] = {
+                "memory_point_id": row[0],
+                "anchor": row[1],
+                "content": row[2],
+                "memory_type": row[3],
+                "weight": row[4],
+                "created_at_utc": row[5],
+            }
+    return [found[i] for i in memory_point_ids if i in found]
+
+
+async def decay_memory_weights(factor: float, archive_threshold: float, commit: bool = True) -> tuple[int, list[int]]:
+    """衰减事实型/情感型记忆的权重，并归档权重低于阈值的记忆点
+
+    衰减与归档均为集合式语句，整体在同一个事务中提交。
+    commit=False 时由调用方提交(以便与其他写入放在同一事务中)，并在提交后自行从相似度索引中移除归档的记忆点。
+    返回 (被衰减的记忆点数量, 被归档的记忆点 ID 列表)。
+    """
+    _ensure_conn()
+    async with db_config.conn.execute(
+        "UPDATE memory_points SET weight = weight * ? WHERE memory_type IN ('fact', 'emotion')",
+        (factor,)
+    ) as cursor:
+        decayed = cursor.rowcount
+
+    await db_config.conn.execute(
+        "INSERT OR REPLACE INTO memory_points_archive "
+        "(memory_point_id, memory_group_id, anchor, content, memory_type, weight, created_at_utc, updated_at_utc) "
+        "SELECT memory_point_id, memory_group_id, anchor, content, memory_type, weight, created_at_utc, updated_at_utc "
+        "FROM memory_points WHERE memory_type IN ('fact', 'emotion') AND weight < ?",
+        (archive_threshold,)
+    )
+    rows = await db_config.conn.execute_fetchall(
+        "DELETE FROM memory_points WHERE memory_type IN ('fact', 'emotion') AND weight < ? RETURNING memory_point_id",
+        (archive_threshold,)
+    )
+    archived_ids = [row[0] for row in rows]
+    if commit:
+        await db_config.conn.commit()
+        await memory_index.remove_points(archived_ids)
+    logger.trace(f"记忆衰减: factor={factor:.6f}, decayed={decayed}, archived={len(archived_ids)}")
+    return decayed, archived_ids
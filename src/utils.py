@@ -1,8 +1,17 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import NamedTuple
 from zoneinfo import ZoneInfo
+import time
 
 __all__ = ["now_utc", "now_utc_min_str", "user_local_min_to_utc", "user_local_min_to_utc_min_str",
-           "utc_to_user_local_min", "utc_min_str_to_user_local_min", "utc_str_to_user_local_min", "now_user_local_min"]
+           "utc_to_user_local_min", "utc_min_str_to_user_local_min", "utc_str_to_user_local_min", "now_user_local_min",
+           "now_utc_epoch_min", "user_local_min_to_utc_epoch_min", "utc_epoch_min_to_user_local_min",
+           "RecurrenceRule", "parse_rrule", "next_occurrence_min"]
+
+@lru_cache(maxsize=16)
+def _zone(user_tz: str) -> ZoneInfo:
+    return ZoneInfo(user_tz)
 
 def now_utc() -> datetime:
     """获取当前 UTC 时间"""
@@ -15,7 +24,7 @@ def now_utc_min_str() -> str:
 def user_local_min_to_utc(local_str: str, user_tz: str) -> datetime:
     # local_str: "YYYY-MM-DD HH:MM"
     naive = datetime.strptime(local_str, "%Y-%m-%d %H:%M")
-    local_dt = naive.replace(tzinfo=ZoneInfo(user_tz))
+    local_dt = naive.replace(tzinfo=_zone(user_tz))
     return local_dt.astimezone(timezone.utc)
 
 def user_local_min_to_utc_min_str(local_str: str, user_tz: str) -> str:
@@ -25,7 +34,7 @@ def user_local_min_to_utc_min_str(local_str: str, user_tz: str) -> str:
 def utc_to_user_local_min(utc_dt: datetime, user_tz: str) -> str:
     if utc_dt.tzinfo is None:
         utc_dt = utc_dt.replace(tzinfo=timezone.utc)
-    local_dt = utc_dt.astimezone(ZoneInfo(user_tz))
+    local_dt = utc_dt.astimezone(_zone(user_tz))
     return local_dt.strftime("%Y-%m-%d %H:%M")
 
 def utc_min_str_to_user_local_min(utc_str: str, user_tz: str) -> str:
@@ -36,8 +45,160 @@ def utc_str_to_user_local_min(utc_str: str, user_tz: str) -> str:
     utc_dt = datetime.strptime(utc_str, "%Y-%m-%d %H:%M:%S")
     if utc_dt.tzinfo is None:
         utc_dt = utc_dt.replace(tzinfo=timezone.utc)
-    local_dt = utc_dt.astimezone(ZoneInfo(user_tz))
+    local_dt = utc_dt.astimezone(_zone(user_tz))
     return local_dt.strftime("%Y-%m-%d %H:%M")
 
 def now_user_local_min(user_tz: str) -> str:
     return utc_to_user_local_min(now_utc(), user_tz)
+
+# ----------------- epoch 分钟 (unix 秒 // 60, UTC) ----------------
+def now_utc_epoch_min() -> int:
+    """获取当前 UTC epoch 分钟"""
+    return int(time.time() // 60)
+
+def user_local_min_to_utc_epoch_min(local_str: str, user_tz: str) -> int:
+    # local_str: "YYYY-MM-DD HH:MM"
+    return int(user_local_min_to_utc(local_str, user_tz).timestamp() // 60)
+
+@lru_cache(maxsize=8192)
+def utc_epoch_min_to_user_local_min(epoch_min: int, user_tz: str) -> str:
+    """epoch 分钟 -> 用户本地时间字符串 'YYYY-MM-DD HH:MM'，结果按 (分钟, 时区) 缓存"""
+    return datetime.fromtimestamp(epoch_min * 60, _zone(user_tz)).strftime("%Y-%m-%d %H:%M")
+
+
+# ----------------- 重复规则 (RFC 5545 RRULE 子集) ----------------
+# 支持 FREQ=MINUTELY/HOURLY/DAILY/WEEKLY/MONTHLY/YEARLY，INTERVAL，BYDAY(仅 DAILY/WEEKLY)，COUNT，UNTIL。
+# DAILY 及以上频率按用户本地时间的“墙上时钟”推进，跨夏令时仍保持同一本地时刻。
+_RRULE_FREQS = ("MINUTELY", "HOURLY", "DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+_RRULE_WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+_RRULE_MAX_STEPS = 1000
+
+class RecurrenceRule(NamedTuple):
+    freq: str
+    interval: int
+    byday: tuple[int, ...]  # 0=周一，已排序去重；空表示不限制
+    count: int | None
+    until_min_utc: int | None
+
+@lru_cache(maxsize=256)
+def parse_rrule(rule: str, user_tz: str) -> RecurrenceRule:
+    """解析 RRULE 字符串(可带 'RRULE:' 前缀)，非法时抛出 ValueError；不带 Z 的 UNTIL 按用户本地时间解释"""
+    text = rule.strip()
+    if text.upper().startswith("RRULE:"):
+        text = text[6:]
+    parts: dict[str, str] = {}
+    for part in text.split(";"):
+        if not part:
+            continue
+        key, sep, value = part.partition("=")
+        if not sep or not value:
+            raise ValueError(f"无效的 RRULE 片段: {part}")
+        parts[key.strip().upper()] = value.strip().upper()
+
+    unknown = set(parts) - {"FREQ", "INTERVAL", "BYDAY", "COUNT", "UNTIL"}
+    if unknown:
+        raise ValueError(f"不支持的 RRULE 字段: {', '.join(sorted(unknown))}")
+
+    freq = parts.get("FREQ")
+    if freq not in _RRULE_FREQS:
+        raise ValueError(f"无效的 RRULE FREQ: {freq}")
+
+    interval = int(parts.get("INTERVAL", "1"))
+    if interval < 1:
+        raise ValueError("RRULE INTERVAL 必须为正整数")
+
+    byday: tuple[int, ...] = ()
+    if "BYDAY" in parts:
+        if freq not in ("DAILY", "WEEKLY"):
+            raise ValueError("RRULE BYDAY 仅支持 FREQ=DAILY 或 FREQ=WEEKLY")
+        try:
+            byday = tuple(sorted({_RRULE_WEEKDAYS[day.strip()] for day in parts["BYDAY"].split(",")}))
+        except KeyError as e:
+            raise ValueError(f"无效的 RRULE BYDAY: {parts['BYDAY']}") from e
+
+    count = int(parts["COUNT"]) if "COUNT" in parts else None
+    if count is not None and count < 1:
+        raise ValueError("RRULE COUNT 必须为正整数")
+
+    until_min_utc = None
+    if "UNTIL" in parts:
+        until = parts["UNTIL"]
+        is_utc = until.endswith("Z")
+        until = until.rstrip("Z")
+        fmt = "%Y%m%dT%H%M%S" if "T" in until else "%Y%m%d"
+        until_dt = datetime.strptime(until, fmt)
+        if fmt == "%Y%m%d":
+            until_dt = until_dt.replace(hour=23, minute=59)
+        until_dt = until_dt.replace(tzinfo=timezone.utc if is_utc else _zone(user_tz))
+        until_min_utc = int(until_dt.timestamp() // 60)
+    if count is not None and until_min_utc is not None:
+        raise ValueError("RRULE COUNT 与 UNTIL 不能同时使用")
+
+    return RecurrenceRule(freq, interval, byday, count, until_min_utc)
+
+def _local_to_epoch_min(local_dt: datetime, user_tz: str) -> int:
+    return int(local_dt.replace(tzinfo=_zone(user_tz)).timestamp() // 60)
+
+def _add_months(local_dt: datetime, months: int) -> datetime | None:
+    """按月推进并保持日号，目标月份没有该日(如 2 月 30 日)时返回 None，由调用方跳过"""
+    total = local_dt.month - 1 + months
+    try:
+        return local_dt.replace(year=local_dt.year + total // 12, month=total % 12 + 1)
+    except ValueError:
+        return None
+
+def _iter_candidates(rule: RecurrenceRule, start: datetime, after: datetime):
+    """从 start(本身是一次发生)之后按规则生成本地时间候选，先整体跳过 after 之前的周期"""
+    interval = rule.interval
+    if rule.freq == "DAILY":
+        skip = max(0, (after - start).days // interval) * interval
+        for i in range(skip, skip + _RRULE_MAX_STEPS * interval, interval):
+            candidate = start + timedelta(days=i)
+            if not rule.byday or candidate.weekday() in rule.byday:
+                yield candidate
+    elif rule.freq == "WEEKLY":
+        byday = rule.byday or (start.weekday(),)
+        week_start = start - timedelta(days=start.weekday())
+        skip = max(0, (after - week_start).days // 7 // interval) * interval
+        for week in range(skip, skip + _RRULE_MAX_STEPS * interval, interval):
+            for day in byday:
+                yield week_start + timedelta(weeks=week, days=day)
+    else:
+        months_per_step = interval * (12 if rule.freq == "YEARLY" else 1)
+        elapsed = (after.year - start.year) * 12 + after.month - start.month
+        skip = max(1, elapsed // months_per_step) * months_per_step
+        for months in range(skip, skip + _RRULE_MAX_STEPS * months_per_step, months_per_step):
+            candidate = _add_months(start, months)
+            if candidate is not None:
+                yield candidate
+
+def next_occurrence_min(rule_text: str, current_min_utc: int, after_min_utc: int,
+                        occurrence_count: int, user_tz: str) -> int | None:
+    """
+    计算重复规则在 current_min_utc(第 occurrence_count 次发生)之后、且晚于 after_min_utc 的下一次发生时间(UTC epoch 分钟)。
+    只计算一次，不展开整个序列；规则已结束(COUNT/UNTIL)时返回 None
+    """
+    rule = parse_rrule(rule_text, user_tz)
+    if rule.count is not None and occurrence_count >= rule.count:
+        return None
+    after_min_utc = max(after_min_utc, current_min_utc)
+
+    if rule.freq in ("MINUTELY", "HOURLY"):
+        # 亚日频率按绝对时间推进，不受夏令时影响
+        step = rule.interval * (60 if rule.freq == "HOURLY" else 1)
+        next_min = current_min_utc + ((after_min_utc - current_min_utc) // step + 1) * step
+    else:
+        start = datetime.fromtimestamp(current_min_utc * 60, _zone(user_tz)).replace(tzinfo=None)
+        after = datetime.fromtimestamp(after_min_utc * 60, _zone(user_tz)).replace(tzinfo=None)
+        next_min = None
+        for candidate in _iter_candidates(rule, start, after):
+            candidate_min = _local_to_epoch_min(candidate, user_tz)
+            if candidate_min > after_min_utc:
+                next_min = candidate_min
+                break
+        if next_min is None:
+            return None
+
+    if rule.until_min_utc is not None and next_min > rule.until_min_utc:
+        return None
+    return next_min
@@ -1,18 +1,43 @@
 """
-注意: Reminder 的时间(remind_at_min_utc)只精确到分钟，其格式为 "YYYY-MM-DD HH:MM"
+注意: Reminder 的时间(remind_at_min_utc)只精确到分钟，以整数 UTC epoch 分钟(unix 秒 // 60)存储
+
+调度方式: 启动时从数据库加载所有待执行动作的时间建立最小堆，之后只通过总线事件
+(REMINDER_CREATED / REMINDER_RESCHEDULED) 增量维护；主循环睡眠到堆顶的到期时间，
+只在到期时刻查询数据库。堆中的旧条目采用惰性删除：出堆时与 __scheduled 中记录的最新时间不一致即丢弃。
+
+状态机(见 HLD): 到期时依次批量执行 snoozed -> pending、pending -> sent、sent 超时 -> escalated/ignored、
+escalated 超时 -> escalated(重复)/ignored，每一步都是 storage.reminder 中的一条 UPDATE ... RETURNING。
+已发送、等待响应的提醒 ID 保存在内存集合 __open 中：收到用户消息时若集合为空则无需访问数据库，
+否则用一条 UPDATE 将其全部置为 acked。
+
+重复提醒(recurrence_rule)每个序列只占一行：本次被确认或忽略后，按规则惰性计算下一次发生时间，
+同一行回到 pending 并重新入堆，不预先展开、也不需要 LLM 再次创建。
+
+错过的提醒(停机期间到期等，触发时已晚于 REMINDER_CATCHUP_AFTER_MINUTES)不逐个触发，而是合并为一次
+REMINDER_CATCHUP，由编排器写入一条汇总的世界消息、只触发一次规划；晚于 REMINDER_STALE_MINUTES 的直接置为 ignored。
 """
 
 from events import bus, E
 from logger import logger
 from datamodel import *
-from typing import Dict, List
+from metrics import runtime_metrics
+from typing import Dict, List, Set
 from utils import *
+from config.settings import REMINDER_CATCHUP_AFTER_MINUTES, REMINDER_STALE_MINUTES
 import asyncio
+import heapq
 import time
 import storage.reminder as reminder_storage
 
 __shutdown_event: asyncio.Event = None
+__wake_event = asyncio.Event()
+__heap: List[tuple[int, int]] = []  # (next_action_at_min_utc, reminder_id)
+__scheduled: Dict[int, int] = {}  # reminder_id -> 最新的 next_action_at_min_utc
+__open: Set[int] = set()  # 状态为 sent/escalated 的 reminder_id
 __last_check_at_epoch: float | None = None
+__db_check_count = 0
+
+_CLAIM_BATCH_SIZE = 100
 
 
 def get_status() -> dict[str, object]:
@@ -20,23 +45,198 @@ def get_status() -> dict[str, object]:
     return {
         "running": running,
         "last_check_at_epoch": __last_check_at_epoch,
+        "db_check_count": __db_check_count,
+        "scheduled_count": len(__scheduled),
+        "open_count": len(__open),
+        "next_due_at_epoch": __heap[0][0] * 60 if __heap else None,
     }
 
 
+def _schedule(reminder_id: int, due_min: int) -> None:
+    if __scheduled.get(reminder_id) == due_min:
+        return
+    __scheduled[reminder_id] = due_min
+    heapq.heappush(__heap, (due_min, reminder_id))
+    __wake_event.set()
+
+
+@bus.on(E.REMINDER_CREATED)
+async def handle_reminder_created(reminder_id: int, remind_at_min_utc: int, **_):
+    _schedule(reminder_id, remind_at_min_utc)
+
+
+@bus.on(E.REMINDER_RESCHEDULED)
+async def handle_reminder_rescheduled(reminder_id: int, next_action_at_min_utc: int, **_):
+    __open.discard(reminder_id)
+    _schedule(reminder_id, next_action_at_min_utc)
+
+
+@bus.on(E.REMINDER_CANCELLED)
+async def handle_reminder_cancelled(reminder_id: int, **_):
+    __open.discard(reminder_id)
+    __scheduled.pop(reminder_id, None)
+
+
+@bus.on(E.IO_MESSAGE_RECEIVED)
+async def handle_user_reply(*_, **__):
+    """用户的任何回复都视为确认所有等待响应的提醒，同时取消其后续升级"""
+    if not __open:
+        return
+    reminder_ids = list(__open)
+    __open.clear()
+    try:
+        acked = await reminder_storage.ack_reminders(reminder_ids)
+    except Exception as e:
+        __open.update(reminder_ids)
+        logger.error(f"确认提醒失败: {e}", exc_info=e)
+        return
+    for reminder in acked:
+        __scheduled.pop(reminder.reminder_id, None)
+    if acked:
+        logger.info(f"用户已响应，确认 {len(acked)} 个提醒")
+        await _advance_recurring(acked, now_utc_epoch_min())
+
+
+async def _advance_recurring(reminders: List[Reminder], now_min: int) -> None:
+    """已结束的重复提醒推进到下一次；推进后的提醒通过 REMINDER_RESCHEDULED 重新入堆"""
+    if not any(reminder.recurrence_rule for reminder in reminders):
+        return
+    try:
+        await reminder_storage.advance_recurring_reminders(reminders, now_min)
+    except Exception as e:
+        logger.error(f"重复提醒推进失败: {e}", exc_info=e)
+
+
+def _pop_due(now_min: int) -> Dict[int, int]:
+    """弹出所有已到期的堆条目，返回其中有效(未被改期)的 reminder_id -> 到期时间"""
+    due: Dict[int, int] = {}
+    while __heap and __heap[0][0] <= now_min:
+        due_min, reminder_id = heapq.heappop(__heap)
+        if __scheduled.get(reminder_id) == due_min:
+            del __scheduled[reminder_id]
+            due[reminder_id] = due_min
+    return due
+
+
+async def _sleep(timeout: float | None) -> None:
+    """睡眠直到超时、被新的调度唤醒或收到关闭信号"""
+    waiters = [
+        asyncio.create_task(__wake_event.wait()),
+        asyncio.create_task(__shutdown_event.wait()),
+    ]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+async def _run_batches(step, now_min: int, handle=None) -> None:
+    """分批执行一步状态转换；每批写库后立即交给 handle 处理(触发事件、重新入堆)，再认领下一批。
+    后续批次失败时，已改变状态的提醒也都已处理，不会出现数据库中已发送、事件却从未触发的提醒
+    """
+    global __db_check_count
+    while True:
+        __db_check_count += 1
+        reminders = await step(now_min, _CLAIM_BATCH_SIZE)
+        if handle is not None and reminders:
+            await handle(reminders)
+        if len(reminders) < _CLAIM_BATCH_SIZE:
+            return
+
+
+def _after_timeout(reminder: Reminder) -> None:
+    if reminder.status == "escalated":
+        _schedule(reminder.reminder_id, reminder.next_action_at_min_utc)
+        logger.info(f"Reminder 无响应，升级提醒: id={reminder.reminder_id}, retry_count={reminder.retry_count}")
+        bus.emit(E.REMINDER_ESCALATED, reminder=reminder)
+    else:
+        __open.discard(reminder.reminder_id)
+        logger.info(f"Reminder 无响应，已忽略: id={reminder.reminder_id}, status={reminder.status}")
+
+
+async def _catch_up(missed: List[Reminder], stale: List[Reminder], now_min: int) -> None:
+    """错过的提醒合并为一次补发；过期的提醒直接忽略(重复提醒照常推进到下一次)"""
+    if stale:
+        ignored = await reminder_storage.ignore_reminders([reminder.reminder_id for reminder in stale])
+        await _advance_recurring(ignored, now_min)
+    logger.info(f"补发错过的提醒: missed={len(missed)}, stale={len(stale)}")
+    bus.emit(E.REMINDER_CATCHUP, missed=missed, stale=stale)
+
+
+async def _process_due(now_min: int, due: Dict[int, int]) -> None:
+    """按状态机顺序批量推进到期提醒；due 为 reminder_id -> 堆中记录的到期时间，用于计算触发延迟"""
+    global __last_check_at_epoch
+    __last_check_at_epoch = time.time()
+
+    await _run_batches(reminder_storage.wake_snoozed_reminders, now_min)
+
+    missed: List[Reminder] = []
+    stale: List[Reminder] = []
+
+    async def handle_sent(sent: List[Reminder]) -> None:
+        now = time.time()
+        for reminder in sent:
+            due_min = due.get(reminder.reminder_id, reminder.remind_at_min_utc)
+            runtime_metrics.record_reminder_lateness((now - due_min * 60) * 1000)
+            late_min = now_min - due_min
+            if late_min >= REMINDER_STALE_MINUTES:
+                stale.append(reminder)
+                continue
+            __open.add(reminder.reminder_id)
+            _schedule(reminder.reminder_id, reminder.next_action_at_min_utc)
+            if late_min >= REMINDER_CATCHUP_AFTER_MINUTES:
+                missed.append(reminder)
+            else:
+                bus.emit(E.REMINDER_TRIGGERED, reminder=reminder)
+
+    try:
+        await _run_batches(reminder_storage.claim_due_reminders, now_min, handle_sent)
+    finally:
+        # 后续批次失败时，已认领的错过/过期提醒同样要补发或忽略
+        if missed or stale:
+            await _catch_up(missed, stale, now_min)
+
+    async def handle_timed_out(timed_out: List[Reminder]) -> None:
+        for reminder in timed_out:
+            _after_timeout(reminder)
+        await _advance_recurring([reminder for reminder in timed_out if reminder.status == "ignored"], now_min)
+
+    await _run_batches(reminder_storage.expire_sent_reminders, now_min, handle_timed_out)
+    await _run_batches(reminder_storage.advance_escalated_reminders, now_min, handle_timed_out)
+
+
 async def main_loop(shutdown_event: asyncio.Event):
-    global __shutdown_event, __last_check_at_epoch
+    global __shutdown_event
     __shutdown_event = shutdown_event
-    logger.info("Reminder 主循环已启动")
-    
+
+    await _advance_recurring(await reminder_storage.get_finished_recurring_reminders(), now_utc_epoch_min())
+    for due_min, reminder_id in await reminder_storage.get_scheduled_action_times():
+        _schedule(reminder_id, due_min)
+    __open.update(await reminder_storage.get_open_reminder_ids())
+    logger.info(f"Reminder 主循环已启动，已加载 {len(__scheduled)} 个待执行提醒，{len(__open)} 个等待响应")
+
     while not shutdown_event.is_set():
-        __last_check_at_epoch = time.time()
-        reminders_to_process: List[Reminder] = await reminder_storage.get_reminders_need_action_now()
-        for reminder in reminders_to_process:
-            bus.emit(E.REMINDER_TRIGGERED, reminder=reminder)
-            reminder.status = "triggered"
-            reminder.next_action_at_min_utc = None
-            await reminder_storage.update_reminder(reminder)  # ToDo: 将状态更新放到事件处理器里，并设法完善消息的状态机转换
-
-        await asyncio.sleep(5)  # 每5秒检查一次，可能需要改进
+        __wake_event.clear()
+        if not __heap:
+            await _sleep(None)
+            continue
+
+        delay = __heap[0][0] * 60 - time.time()
+        if delay > 0:
+            await _sleep(delay)
+            continue
+
+        now_min = now_utc_epoch_min()
+        due = _pop_due(now_min)
+        if due:
+            try:
+                await _process_due(now_min, due)
+            except Exception as e:
+                logger.error(f"Reminder 处理失败，一分钟后重试: {e}", exc_info=e)
+                # 已处理的提醒已按新的动作时间重新入堆，只重试尚未处理的
+                for reminder_id in due:
+                    if reminder_id not in __scheduled:
+                        _schedule(reminder_id, now_min + 1)
 
     logger.info("Reminder 主循环已关闭")
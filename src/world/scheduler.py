@@ -0,0 +1,151 @@
+"""
+延时事件调度器
+
+所有基于时间的后续动作(重试、升级提醒、预生成等)统一登记到 storage.scheduled_event，由本调度器在到期时投递到事件总线:
+1. 启动时先把上一进程已认领但未确认的事件重新放回队列(崩溃恢复)，再查询最早的到期时间;
+2. 主循环睡眠到最早到期时间，期间若有更早的事件登记(SCHEDULED_EVENT_ADDED)则提前唤醒;
+3. 到期后分批认领，并发执行 bus.emit_and_wait；全部处理器成功才确认删除，否则按指数退避重新排期。
+
+投递语义为“至少一次”，处理器需要自行保证幂等。
+"""
+
+from events import bus, E
+from logger import logger
+from config.settings import *
+from datamodel import ScheduledEvent
+from metrics import REMINDER_LATENESS_BUCKETS_MS, Histogram
+from typing import List
+import asyncio
+import time
+import storage.scheduled_event as scheduled_event_storage
+
+__shutdown_event: asyncio.Event = None
+__wake_event = asyncio.Event()
+__next_due_ms: int | None = None
+__woken_ms: int | None = None  # 刷新 __next_due_ms 期间登记的事件中最早的到期时间
+__delivered_count = 0
+__failed_count = 0
+__dead_count = 0
+__replayed_count = 0
+__lateness_ms = Histogram(REMINDER_LATENESS_BUCKETS_MS)
+
+
+def get_status() -> dict[str, object]:
+    running = __shutdown_event is not None and not __shutdown_event.is_set()
+    return {
+        "running": running,
+        "next_due_at_epoch": None if __next_due_ms is None else __next_due_ms / 1000,
+        "delivered_count": __delivered_count,
+        "failed_count": __failed_count,
+        "dead_count": __dead_count,
+        "replayed_count": __replayed_count,
+        "dispatch_lateness_ms": __lateness_ms.snapshot(),
+    }
+
+
+@bus.on(E.SCHEDULED_EVENT_ADDED)
+async def handle_scheduled_event_added(event_id: str, next_attempt_at_ms_utc: int, **_):
+    global __next_due_ms, __woken_ms
+    if __woken_ms is None or next_attempt_at_ms_utc < __woken_ms:
+        __woken_ms = next_attempt_at_ms_utc
+    if __next_due_ms is None or next_attempt_at_ms_utc < __next_due_ms:
+        __next_due_ms = next_attempt_at_ms_utc
+        __wake_event.set()
+
+
+async def _sleep(timeout: float | None) -> None:
+    """睡眠直到超时、被新的事件唤醒或收到关闭信号"""
+    waiters = [
+        asyncio.create_task(__wake_event.wait()),
+        asyncio.create_task(__shutdown_event.wait()),
+    ]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+async def _deliver(event: ScheduledEvent) -> bool:
+    global __failed_count, __dead_count
+    try:
+        await bus.emit_and_wait(event.event_type, **event.payload)
+        return True
+    except Exception as e:
+        __failed_count += 1
+        backoff = SCHEDULER_RETRY_BASE_SECONDS * (2 ** max(0, event.attempts - 1))
+        retry_at_ms = int((time.time() + backoff) * 1000)
+        status = await scheduled_event_storage.fail_event(event.event_id, f"{type(e).__name__}: {e}", retry_at_ms)
+        if status == "dead":
+            __dead_count += 1
+            logger.error(
+                f"延时事件投递失败且已达最大尝试次数: event_type={event.event_type}, "
+                f"event_id={event.event_id}, attempts={event.attempts}, error={e}",
+                exc_info=e,
+            )
+        else:
+            logger.warning(
+                f"延时事件投递失败，{backoff:.1f}s 后重试: event_type={event.event_type}, "
+                f"event_id={event.event_id}, attempts={event.attempts}, error={e}"
+            )
+        return False
+
+
+async def _dispatch_due() -> None:
+    global __delivered_count
+    while True:
+        now_ms = int(time.time() * 1000)
+        events: List[ScheduledEvent] = await scheduled_event_storage.claim_due_events(
+            now_ms, SCHEDULER_LEASE_SECONDS * 1000, SCHEDULER_BATCH_SIZE
+        )
+        if not events:
+            return
+        for event in events:
+            if event.attempts == 1:
+                __lateness_ms.observe(max(0, now_ms - event.scheduled_at_ms_utc))
+
+        results = await asyncio.gather(*(_deliver(event) for event in events))
+        delivered = [event.event_id for event, ok in zip(events, results) if ok]
+        await scheduled_event_storage.ack_events(delivered)
+        __delivered_count += len(delivered)
+        if len(events) < SCHEDULER_BATCH_SIZE:
+            return
+
+
+async def _refresh_next_due() -> None:
+    global __next_due_ms, __woken_ms
+    __woken_ms = None
+    next_due_ms = await scheduled_event_storage.get_next_due_ms()
+    # 查询期间登记的事件可能不在查询结果中，且会被旧的 __next_due_ms 挡掉，取两者中较早的
+    if __woken_ms is not None and (next_due_ms is None or __woken_ms < next_due_ms):
+        next_due_ms = __woken_ms
+    __next_due_ms = next_due_ms
+
+
+async def main_loop(shutdown_event: asyncio.Event):
+    global __shutdown_event, __replayed_count
+    __shutdown_event = shutdown_event
+
+    __replayed_count = await scheduled_event_storage.release_claimed_events(int(time.time() * 1000))
+    await _refresh_next_due()
+    logger.info(f"延时事件调度器已启动，重新投递 {__replayed_count} 个未确认事件")
+
+    while not shutdown_event.is_set():
+        __wake_event.clear()
+        if __next_due_ms is None:
+            await _sleep(None)
+            continue
+
+        delay = __next_due_ms / 1000 - time.time()
+        if delay > 0:
+            await _sleep(delay)
+            continue
+
+        try:
+            await _dispatch_due()
+            await _refresh_next_due()
+        except Exception as e:
+            logger.error(f"延时事件调度失败: {e}", exc_info=e)
+            await _sleep(SCHEDULER_RETRY_BASE_SECONDS)
+
+    logger.info("延时事件调度器已关闭")